@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+time to menu of the application list for dmenu, on a synthetic $PATH:
+listing and checking every file on every call against utils/appindex.py
+without (cold) and with (warm) its index file.
+
+    python bench/app_index.py [directories] [executables per directory]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from appindex import AppIndex
+
+
+def scan_path(path):
+    """the old ApplicationGenerator"""
+    apps = set()
+    validpaths = [p for p in path.split(':') if os.path.exists(p)]
+    for p in validpaths:
+        for f in os.listdir(p):
+            fullname = os.path.join(p, f)
+            if os.path.isfile(fullname) and os.access(fullname, os.X_OK):
+                apps.add(f)
+    return sorted(apps)
+
+
+def make_path(root, dirs, files):
+    path = []
+    for d in xrange(dirs):
+        p = os.path.join(root, 'bin%02d' % d)
+        os.mkdir(p)
+        for f in xrange(files):
+            name = os.path.join(p, 'app%02d_%04d' % (d, f))
+            os.close(os.open(name, os.O_CREAT | os.O_WRONLY, 0755))
+        path.append(p)
+    return ':'.join(path)
+
+
+def timed(func, n = 5):
+    """best of n runs in ms"""
+    best = None
+    for i in xrange(n):
+        start = time.time()
+        ret = func()
+        t = (time.time() - start) * 1000.0
+        if best is None or t < best:
+            best = t
+    return best, ret
+
+
+def main(dirs = 20, files = 500):
+    root = tempfile.mkdtemp()
+    try:
+        path = make_path(root, dirs, files)
+        index_file = os.path.join(root, 'appindex')
+        print '%d directories, %d executables' % (dirs, dirs * files)
+
+        def cold():
+            if os.path.exists(index_file):
+                os.unlink(index_file)
+            index = AppIndex(index_file, path)
+            index.refresh()
+            return index.apps()
+
+        def warm():
+            # a new session: load the index, the refresh stats the
+            # directories in the background
+            index = AppIndex(index_file, path)
+            index.load()
+            return index.apps()
+
+        def warm_refresh():
+            index = AppIndex(index_file, path)
+            index.refresh()
+            return index.apps()
+
+        def one_changed():
+            index = AppIndex(index_file, path)
+            index.load()
+            os.close(os.open(os.path.join(root, 'bin00', 'new'), os.O_CREAT | os.O_WRONLY, 0755))
+            os.utime(os.path.join(root, 'bin00'), (0, time.time() + index.scans + 10))
+            index.refresh()
+            os.unlink(os.path.join(root, 'bin00', 'new'))
+            return index.apps()
+
+        print '%-34s %10s' % ('', 'ms')
+        t, old = timed(lambda: scan_path(path))
+        print '%-34s %10.2f' % ('scan $PATH (old)', t)
+        t, apps = timed(cold)
+        print '%-34s %10.2f' % ('index, cold', t)
+        if apps != old:
+            raise AssertionError('index and scan differ')
+        print '%-34s %10.2f' % ('index, warm', timed(warm)[0])
+        print '%-34s %10.2f' % ('index, warm + mtime check', timed(warm_refresh)[0])
+        print '%-34s %10.2f' % ('index, one directory changed', timed(one_changed)[0])
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+feeding menu items to dmenu: the old list built with writelines() against
+feed_lines() of utils/event_handler.py. a thread stands in for dmenu and
+notes when the first line arrives. every run is forked, so the peak
+memory (VmHWM) of one run doesn't hide the next.
+
+runs against tests/fake_wmii.py, no wmii needed.
+
+    python bench/dmenu_feed.py [items ...]
+"""
+
+import os
+import sys
+import time
+import threading
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+import fake_wmii
+
+wmii = fake_wmii.FakeWmii()
+wmii.start()
+sys.path.insert(0, ROOT)
+from utils.event_handler import feed_lines
+
+
+def generate(n):
+    for i in xrange(n):
+        yield 'application-%07d' % i
+
+
+def write_list(pipe, items):
+    """the old DMenu"""
+    pipe.writelines([l + '\n' for l in items])
+    pipe.flush()
+    pipe.close()
+
+
+def memory(key):
+    for line in open('/proc/self/status'):
+        if line.startswith(key + ':'):
+            return int(line.split()[1])
+    return 0
+
+
+def run(feed, n):
+    """return (seconds to the first line, seconds to the last, kB peak growth)"""
+    rfd, wfd = os.pipe()
+    times = []
+
+    def reader():
+        file = os.fdopen(rfd, 'rb', 0)
+        data = file.read(1)
+        times.append(time.time())
+        while data:
+            data = file.read(65536)
+        times.append(time.time())
+        file.close()
+
+    base = memory('VmRSS')
+    t = threading.Thread(target = reader)
+    t.start()
+    start = time.time()
+    feed(os.fdopen(wfd, 'wb', 0), generate(n))
+    t.join()
+    return times[0] - start, times[1] - start, memory('VmHWM') - base
+
+
+def forked(feed, n):
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        os.write(wfd, repr(run(feed, n)))
+        os._exit(0)
+    os.close(wfd)
+    data = os.read(rfd, 1024)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    return eval(data)
+
+
+def main(sizes = (1000, 100000, 1000000)):
+    print '%9s  %-10s %10s %10s %10s' % ('items', 'feed', 'first ms', 'last ms', 'peak kB')
+    for n in sizes:
+        for name, feed in (('list', write_list), ('stream', feed_lines)):
+            first, last, peak = forked(feed, n)
+            print '%9d  %-10s %10.1f %10.1f %10d' % (n, name, first * 1000, last * 1000, peak)
+
+
+if __name__ == '__main__':
+    try:
+        if len(sys.argv) > 1:
+            main([int(a) for a in sys.argv[1:]])
+        else:
+            main()
+    finally:
+        wmii.stop()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+event dispatch with the EVENTS of events.py: the indexed lookup of
+EventList.resolve() against matching every resolver in turn.
+
+runs against tests/fake_wmii.py, no wmii needed.
+
+    python bench/event_dispatch.py [seconds per event]
+"""
+
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+import fake_wmii
+
+wmii = fake_wmii.FakeWmii()
+wmii.start()
+sys.path.insert(0, ROOT)
+from config import MODKEY
+import events
+
+EVENTS = (
+    'Key %s-1' % MODKEY,
+    'Key %s-Control-Left' % MODKEY,
+    'Key %s-p' % MODKEY,
+    'FocusTag 1',
+    'UnfocusTag 1',
+    'LeftBarClick 1 2',
+    'ClientFocus 0x1000001',
+    'Key Mod1-x',
+)
+
+
+def bench(func, seconds):
+    n = 0
+    start = time.time()
+    end = start + seconds
+    while True:
+        for i in xrange(100):
+            func()
+        n += 100
+        now = time.time()
+        if now >= end:
+            return n / (now - start)
+
+
+def main(seconds = 0.5):
+    resolvers = events.EVENTS
+    print '%d resolvers' % len(resolvers)
+    print '%-28s %8s %12s %12s' % ('event', 'matches', 'scan ev/s', 'index ev/s')
+    for event in EVENTS:
+        scan = lambda: [r for r in resolvers if r.match(event)]
+        index = lambda: resolvers.resolve(event)
+        if scan() != index():
+            raise AssertionError('different resolvers for %r' % event)
+        print '%-28s %8d %12d %12d' % (event, len(index()), bench(scan, seconds),
+                                       bench(index, seconds))
+
+
+if __name__ == '__main__':
+    try:
+        if len(sys.argv) > 1:
+            main(float(sys.argv[1]))
+        else:
+            main()
+    finally:
+        wmii.stop()
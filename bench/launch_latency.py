@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+starting an application like Execute: subprocess.Popen() from the process
+against a write to the helper of utils/launcher.py. the helper is forked
+first, then the process grows by 'megabytes' to stand in for a wmiirc
+which ran for a while.
+
+'call' is the time spent in the handler, 'started' the time until the
+application (a shell opening a fifo) runs. 'zombies' are the children
+left unreaped afterwards.
+
+    python bench/launch_latency.py [launches] [megabytes]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import launcher
+
+
+def popen(argv):
+    """the old Execute"""
+    subprocess.Popen(argv)
+
+
+def zombies(parent):
+    """the number of exited, unreaped children of parent"""
+    n = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            stat = open('/proc/%s/stat' % pid).read().rsplit(')', 1)[1].split()
+        except IOError:
+            continue
+        if stat[0] == 'Z' and int(stat[1]) == parent:
+            n += 1
+    return n
+
+
+def run(start, fifo, launches):
+    argv = ['/bin/sh', '-c', ': > %s' % fifo]
+    call = started = 0.0
+    for i in xrange(launches):
+        t = time.time()
+        start(argv)
+        call += time.time() - t
+        open(fifo).read()
+        started += time.time() - t
+    return call / launches, started / launches
+
+
+def main(launches = 100, megabytes = 200):
+    launcher.start_launcher()
+    ballast = ' ' * (megabytes << 20)
+    tmp = tempfile.mkdtemp()
+    try:
+        fifo = os.path.join(tmp, 'fifo')
+        os.mkfifo(fifo)
+        print '%d launches, %d MB process' % (launches, megabytes)
+        print '%-10s %10s %12s %8s' % ('start', 'call ms', 'started ms', 'zombies')
+        for name, start, parent in (('popen', popen, os.getpid()),
+                                    ('launcher', launcher.launch, launcher.LAUNCHER.pid)):
+            call, started = run(start, fifo, launches)
+            time.sleep(launcher.REAP_INTERVAL + 0.1)
+            print '%-10s %10.3f %12.3f %8d' % (name, call * 1000, started * 1000, zombies(parent))
+    finally:
+        shutil.rmtree(tmp)
+        launcher.stop_launcher()
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
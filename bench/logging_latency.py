@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+the time a logger.debug() call takes in the calling thread: a plain
+FileHandler against the QueueHandler and RotatingLogFile of
+utils/logqueue.py. every 'stall'th write to the file sleeps 'ms'
+milliseconds, like a disk busy with writeback. records come in bursts,
+like the debug output of an event.
+
+the last rows are a disabled debug() with eager '%' formatting and with
+lazy arguments.
+
+    python bench/logging_latency.py [records] [stall] [ms]
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+from logqueue import QueueHandler, RotatingLogFile, FORMAT
+
+
+class StalledFile(object):
+    """a file whose write() sleeps every 'stall' calls"""
+    def __init__(self, file, stall, delay):
+        self.file = file
+        self.stall = stall
+        self.delay = delay
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        if self.writes % self.stall == 0:
+            time.sleep(self.delay)
+        self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def measure(logger, records):
+    times = []
+    for i in xrange(records):
+        t = time.time()
+        logger.debug('dispatch event: [%s]', 'Key Mod4-%d' % (i % 10))
+        times.append(time.time() - t)
+        if i % 10 == 9:
+            time.sleep(0.001)
+    times.sort()
+    return [times[int(len(times) * q)] * 1e6 for q in (0.5, 0.99)] + [times[-1] * 1e6]
+
+
+def run(handler, records):
+    logger = logging.getLogger('bench')
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    try:
+        return measure(logger, records)
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def disabled(records, lazy):
+    logger = logging.getLogger('bench.disabled')
+    logger.setLevel(logging.WARN)
+    event = 'Key Mod4-Return'
+    t = time.time()
+    if lazy:
+        for i in xrange(records):
+            logger.debug('dispatch event: [%s]', event)
+    else:
+        for i in xrange(records):
+            logger.debug('dispatch event: [%s]' % event)
+    return (time.time() - t) / records * 1e6
+
+
+def main(records = 5000, stall = 200, ms = 50):
+    tmp = tempfile.mkdtemp()
+    try:
+        plain = logging.FileHandler(os.path.join(tmp, 'plain.log'))
+        plain.stream = StalledFile(plain.stream, stall, ms / 1000.0)
+        plain.setFormatter(logging.Formatter(FORMAT))
+        rotating = RotatingLogFile(os.path.join(tmp, 'queued.log'))
+        rotating.stream = StalledFile(rotating.stream, stall, ms / 1000.0)
+        rotating.setFormatter(logging.Formatter(FORMAT))
+
+        print '%d records, every %dth write stalls %dms' % (records, stall, ms)
+        print '%-10s %10s %10s %10s' % ('handler', 'p50 us', 'p99 us', 'max us')
+        for name, handler in (('file', plain), ('queue', QueueHandler(rotating))):
+            print '%-10s %10.1f %10.1f %10.1f' % ((name, ) + tuple(run(handler, records)))
+        print '%-10s %10.2f' % ('off eager', disabled(records * 20, False))
+        print '%-10s %10.2f' % ('off lazy', disabled(records * 20, True))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+microbenchmark for the 9P message codec in utils/P9.py.
+
+encodes and decodes every message type through Marshal9P.send and
+Marshal9P.recv and prints messages/sec for both directions.
+
+    python bench/p9_codec.py [seconds per message type]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import P9
+
+
+class NullFd(object):
+    """swallow written messages, keep the last one"""
+    def write(self, buf):
+        self.last = buf
+
+
+class ReplayFd(object):
+    """return the same encoded message over and over again"""
+    def __init__(self, msg):
+        self.msg = str(msg)
+
+    def readmsg(self, maxsize):
+        return buffer(self.msg, 4)
+
+
+QID = (P9.QDIR, 0, 42L)
+STAT = (0, 0, 0, QID, P9.DIR | 0755, 1200000000, 1200000000, 0L, 'tag', 'wmii', 'wmii', 'wmii')
+
+MESSAGES = (
+    (P9.Tversion, (8192, P9.version)),
+    (P9.Rversion, (8192, P9.version)),
+    (P9.Tattach, (23, P9.nofid, '', '')),
+    (P9.Rattach, (QID,)),
+    (P9.Twalk, ((23, 42, ['client', 'sel', 'tags']),)),
+    (P9.Rwalk, ([QID, QID, QID],)),
+    (P9.Topen, (42, P9.OWRITE | P9.OTRUNC)),
+    (P9.Ropen, (QID, 0)),
+    (P9.Tcreate, (42, 'status', 0644, P9.OWRITE)),
+    (P9.Tread, (42, 0L, 4096)),
+    (P9.Rread, ('x' * 4096,)),
+    (P9.Twrite, (42, 0L, '#a0a0a0 #505050 #404040 LOAD: 0.42 0.23 0.05\n')),
+    (P9.Rwrite, (42,)),
+    (P9.Tclunk, (42,)),
+    (P9.Rclunk, ()),
+    (P9.Tflush, (1,)),
+    (P9.Tstat, (42,)),
+    (P9.Rstat, ([STAT],)),
+    (P9.Rerror, ('file not found',)),
+)
+
+
+def bench(func, seconds):
+    n = 0
+    start = time.time()
+    end = start + seconds
+    while True:
+        for i in xrange(100):
+            func()
+        n += 100
+        now = time.time()
+        if now >= end:
+            return n / (now - start)
+
+
+def main(seconds = 0.5):
+    print '%-10s %12s %12s' % ('type', 'enc msg/s', 'dec msg/s')
+    for type, args in MESSAGES:
+        fd = NullFd()
+        enc = P9.Marshal9P(fd)
+        send = lambda: enc.send(type, 1, *args)
+        send()
+        dec = P9.Marshal9P(ReplayFd(fd.last))
+        print '%-10s %12d %12d' % (P9.cmdName[type], bench(send, seconds), bench(dec.recv, seconds))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(float(sys.argv[1]))
+    else:
+        main()
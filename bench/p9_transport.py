@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+syscalls per message of the buffered P9.Sock transport.
+
+bursts of /event sized Rread replies are written into a socket pair and
+received with P9.Sock, once with its buffered framing and once the
+unbuffered way (one recv for the size, at least one for the body).
+
+    python bench/p9_transport.py [messages per burst] [bursts]
+"""
+
+import os
+import sys
+import socket
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import P9
+
+
+class UnbufferedSock(P9.Sock):
+    """the old transport: recv the size field, then recv the body"""
+    def readmsg(self, maxsize):
+        size, = P9._U32.unpack(self.recvall(4))
+        self.msgsin += 1
+        return self.recvall(size - 4)
+
+    def recvall(self, l):
+        x = self.sock.recv(l)
+        self.recvs += 1
+        while len(x) < l:
+            b = self.sock.recv(l - len(x))
+            self.recvs += 1
+            if not b:
+                raise P9.Error("Client EOF")
+            x += b
+        return x
+
+
+def run(transport, burst, bursts):
+    a, b = socket.socketpair()
+    out = P9.Sock(a)
+    rpc = P9.Marshal9P(transport(b))
+    enc = P9.Marshal9P(None)
+    msgs = [enc.encode(P9.Rread, tag, ('FocusTag %d\nUnfocusTag %d\n' % (tag, tag + 1), ))
+            for tag in xrange(burst)]
+
+    def writer():
+        for i in xrange(bursts):
+            out.writev(msgs)
+    t = threading.Thread(target=writer)
+    start = time.time()
+    t.start()
+    for i in xrange(burst * bursts):
+        rpc.recv()
+    t.join()
+    elapsed = time.time() - start
+    a.close()
+    b.close()
+    return rpc.fd.stats(), burst * bursts / elapsed
+
+
+def main(burst = 16, bursts = 2000):
+    print 'burst of %d messages, %d bursts' % (burst, bursts)
+    print '%-12s %12s %12s %12s' % ('transport', 'recv/msg', 'send/msg', 'msg/s')
+    for name, transport in (('unbuffered', UnbufferedSock), ('buffered', P9.Sock)):
+        stats, rate = run(transport, burst, bursts)
+        print '%-12s %12.3f %12.3f %12d' % (name, stats['recvspermsg'], 1.0 / burst, rate)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
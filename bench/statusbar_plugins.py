@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+update() latency of the mem, iface and cpu statusbar plugins: the old
+way, forking free(1) and ip(8) and parsing every line of whole /proc
+files on every update, against the /proc, /sys and netlink readers and
+the SAMPLER of utils/statusbar.py.
+
+runs against tests/fake_wmii.py, no wmii needed.
+
+    python bench/statusbar_plugins.py [updates]
+"""
+
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+import fake_wmii
+
+wmii = fake_wmii.FakeWmii()
+wmii.start()
+sys.path.insert(0, ROOT)
+from utils.statusbar import process_by_pipe, SAMPLER
+
+RE_MEM = re.compile('^Mem:\s*(?P<total>\d+)\s+(?P<used>\d+)\s+(?P<free>\d+)\s+(?P<shared>\d+)\s+(?P<buffers>\d+)\s+(?P<cached>\d+).*$')
+RE_SWAP = re.compile('^Swap:\s*(?P<total>\d+)\s+(?P<used>\d+)\s+(?P<free>\d+).*$')
+
+
+def fork_mem():
+    """the old 77_mem update, without its exception handling"""
+    out, err = process_by_pipe(['free', '-m'])
+    lines = out.split('\n')
+    mem = RE_MEM.match(lines[1])
+    swap = RE_SWAP.match(lines[3])
+    if mem and swap:
+        mem = dict([(k, float(v)) for k, v in mem.groupdict().items()])
+        swap = dict([(k, float(v)) for k, v in swap.groupdict().items()])
+        mem_used = mem['used'] - mem['buffers'] - mem['cached']
+        return 'RAM: %d MB (%02d%%) SWAP: %d MB' % (mem_used, mem_used / mem['total'] * 100.0,
+                                                   swap['used'])
+
+
+def fork_iface():
+    """the old 44_iface update"""
+    s = ""
+    for iface in ['eth0', 'wlan0']:
+        s += iface + ": "
+        out, err = process_by_pipe(['ip', 'a', 's', iface])
+        lines = out.split('\n')
+        if re.search("UP", lines[0]) == None:
+            s += "off "
+        for l in lines[1:]:
+            mo = re.search("inet\s*([0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3})", l)
+            if mo:
+                s += mo.group(1) + " "
+    return s
+
+
+RE_CPU = re.compile(r'^cpu MHz\s*:\s*(?P<mhz>\d+).*$')
+RE_STATS = re.compile(r'^cpu  (?P<user>\d+) (?P<system>\d+) (?P<nice>\d+) (?P<idle>\d+).*$')
+
+
+def readlines_parse(path, regex):
+    """the old parse_file: open, readlines, close, every regex on every line"""
+    file = open(path, 'r')
+    lines = file.readlines()
+    file.close()
+    ret = {}
+    for line in lines:
+        match = regex.match(line)
+        if match:
+            for k, v in match.groupdict().iteritems():
+                ret.setdefault(k, []).append(v)
+    return ret
+
+
+def readlines_cpu():
+    """the file reading part of the old 66_cpu update"""
+    cpu = '/'.join(readlines_parse('/proc/cpuinfo', RE_CPU)['mhz'])
+    stat = readlines_parse('/proc/stat', RE_STATS)
+    return cpu, stat
+
+
+def sampler_cpu():
+    """the same with SAMPLER, as 66_cpu does it now"""
+    cpu = '/'.join([v.lstrip(' \t:').split('.')[0]
+                    for v in SAMPLER.keyed('/proc/cpuinfo', ['cpu MHz'])['cpu MHz']])
+    stat = SAMPLER.keyed('/proc/stat', ['cpu '])
+    return cpu, stat
+
+
+def plugin(name):
+    return __import__('statusbar.' + name, '', '', name).update
+
+
+def bench(func, n):
+    start = time.time()
+    for i in xrange(n):
+        # every update in its own scheduler wakeup, no shared reads
+        SAMPLER.tick()
+        func()
+    return (time.time() - start) / n * 1000.0
+
+
+def main(n = 200):
+    print '%-8s %14s %14s' % ('plugin', 'old ms/upd', 'new ms/upd')
+    for name, old, new in (('mem', fork_mem, plugin('77_mem')),
+                           ('iface', fork_iface, plugin('44_iface')),
+                           ('cpu', readlines_cpu, sampler_cpu)):
+        print '%-8s %14.3f %14.3f' % (name, bench(old, n), bench(new, n))
+    print
+    print 'fork: %r' % fork_iface()
+    print 'proc: %r' % plugin('44_iface')()[1]
+
+
+if __name__ == '__main__':
+    try:
+        main(*[int(a) for a in sys.argv[1:]])
+    finally:
+        wmii.stop()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+ops/sec of the wmiir backend in utils/wmiir.py: a wmiir process forked
+by python for every operation against the wmiir shell, one by one and
+as p9_write_many batch.
+
+wmiir is replaced by a shell script keeping the files in a temporary
+directory, using shell builtins only. so no wmii is needed and both
+sides pay the same for wmiir itself.
+
+    python bench/wmiir_backend.py [operations]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+STUB = '''#!/bin/sh
+f="$WMIIR_ROOT$2"
+case "$1" in
+    write|create) while IFS= read -r l; do printf '%s\\n' "$l"; done > "$f" ;;
+    read) while IFS= read -r l; do printf '%s\\n' "$l"; done < "$f" ;;
+    ls) echo "$f"/* ;;
+    remove) : > "$f" ;;
+esac
+'''
+
+root = tempfile.mkdtemp()
+os.mkdir(os.path.join(root, 'rbar'))
+wmiir = os.path.join(root, 'wmiir')
+open(wmiir, 'w').write(STUB)
+os.chmod(wmiir, 0755)
+os.environ['WMIIR_ROOT'] = root
+os.environ['PATH'] = '%s:%s' % (root, os.environ.get('PATH', ''))
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import wmiir as backend
+
+
+def forked(cmd, path, value = None):
+    """the old backend: Popen a wmiir for every operation"""
+    proc = subprocess.Popen([backend.WMIIR_PATH, cmd, path], stdin = subprocess.PIPE,
+                            stdout = subprocess.PIPE, close_fds = True)
+    if value is not None:
+        proc.stdin.write(value + '\n')
+    proc.stdin.close()
+    ret = [l.strip() for l in proc.stdout.readlines()]
+    proc.stdout.close()
+    proc.wait()
+    return ret
+
+
+def bench(func, n):
+    start = time.time()
+    func(n)
+    return n / (time.time() - start)
+
+
+def main(n = 200):
+    path = '/rbar/status'
+    value = '#a0a0a0 #505050 #404040 LOAD: 0.42 0.23 0.05'
+    backend.p9_write(path, value)
+    if backend.p9_read(path) != forked('read', path) or backend.p9_read(path) != [value]:
+        raise AssertionError('backends read different values')
+
+    def fork_write(n):
+        for i in xrange(n):
+            forked('write', path, value)
+
+    def fork_read(n):
+        for i in xrange(n):
+            forked('read', path)
+
+    def shell_write(n):
+        for i in xrange(n):
+            backend.p9_write(path, value)
+
+    def shell_read(n):
+        for i in xrange(n):
+            backend.p9_read(path)
+
+    def shell_batch(n):
+        # a statusbar flush of 8 entries at a time
+        items = [(path, value)] * 8
+        for i in xrange(n / 8):
+            backend.p9_write_many(items)
+
+    print '%-22s %10s' % ('backend', 'ops/s')
+    for name, func in (('fork per write', fork_write), ('fork per read', fork_read),
+                       ('shell write', shell_write), ('shell read', shell_read),
+                       ('shell p9_write_many', shell_batch)):
+        print '%-22s %10d' % (name, bench(func, n))
+    print backend.SHELL.stats()
+
+
+if __name__ == '__main__':
+    try:
+        main(*[int(a) for a in sys.argv[1:]])
+    finally:
+        backend.SHELL.close()
+        shutil.rmtree(root)
@@ -36,12 +36,30 @@ BORDER = 0
 STATUS_BAR_SEPARATOR = None
 STATUS_BAR_START = None
 STATUS_BAR_END = None
+# keep the /rbar files open and update them with a single write each. only
+# for wmii versions which redraw the bar on write, wmii 3.6 does on clunk.
+STATUS_BAR_PERSISTENT = False
+# run plugins due within this many seconds of each other in one wakeup
+STATUS_BAR_SLACK = 0.25
+# seconds a plugins update() may take before its bar entry is marked with
+# STATUS_BAR_STALE. None runs all updates in the statusbar thread, without
+# deadlines. plugins in STATUS_BAR_PROCESS_PLUGINS run in worker processes,
+# which are killed when they hang.
+STATUS_BAR_TIMEOUT = None
+STATUS_BAR_PROCESS_PLUGINS = ()
+STATUS_BAR_STALE = '(stale)'
+# number of samples the load, cpu and mem plugins show as a sparkline, 0
+# shows none
+STATUS_BAR_HISTORY = 10
 
 # dmenu
 DMENU_FONT = FONT
 DMENU_NORMAL_COLORS = Colors(0xb6b4b8, 0x1c2636)
 DMENU_SELECTION_COLORS = Colors(0xffffff, 0x1c2636)
 
+# seconds between the checks of the views and clients mirrored from /event
+STATE_CHECK_INTERVAL = 60
+
 # tag mappings: (display tag name, real tag name), ...
 TAG_MAPPING = (
     ('mail', '01_mail'),
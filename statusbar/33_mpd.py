@@ -3,7 +3,8 @@
 # Description: 
 # ------------
 # Display the state of MPD in the wmii status bar. 
-# Requires the mpdlib2 library, part of pympd.
+# Keeps one connection to MPD and waits in its 'idle player' command,
+# so the bar changes as soon as the song does, without polling.
 #
 # Install:
 # -------
@@ -26,6 +27,8 @@
 # 2007-11-28    simplify update() function, update songstr()
 #               to generate better output, add logger, add to 
 #               python-wmii mercurial repository
+#               use utils.mpd and mpd's idle command instead of
+#               polling through pympd, reconnect with backoff
 #
 # ------------------------------------------------------------
 #
@@ -48,14 +51,15 @@
 # vim:syntax=python:sw=4:ts=4:expandtab
 
 import os
+import sys
 import logging
 
-has_pympd = False
 try:
-    from pympd.modules import mpdlib2
-    has_pympd = True
-except:
-    pass
+    from utils.mpd import MPDWatcher
+except ImportError:
+    # stand-alone mode, without python-wmii
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+    from mpd import MPDWatcher
 
 try:
     from config import BAR_NORMAL_COLORS
@@ -65,10 +69,12 @@ except:
 logger = logging.getLogger('statusbar.mpd')
 
 SONG_MAX = 30
-mpd = None
+TEXT = ''
+watcher = None
 
 def interval():
-    return 3
+    # the watcher refreshes the bar on changes, this only repaints it
+    return 60
 
 def songstr(song):
     s = ''
@@ -79,39 +85,46 @@ def songstr(song):
     else:
         s = song.get('file', '')
 
+    # cut characters, not bytes of an utf-8 sequence
+    s = s.decode('utf-8', 'replace')
     if s and len(s) > SONG_MAX:
-        s = '..%s' % s[len(s) - SONG_MAX:]
-    return s
+        s = u'..%s' % s[len(s) - SONG_MAX:]
+    return s.encode('utf-8')
+
+def changed(status, song):
+    """called by the watcher thread on every player change"""
+    global TEXT
+
+    text = ''
+    if status:
+        song = dict([(k.lower(), v) for k, v in song.items()])
+        state = status.get('state', '--')
+        text = 'MPD: [%s]' % state
+        if state in ('play', 'pause'):
+            text += ' %s' % songstr(song)
+    if text != TEXT:
+        TEXT = text
+        if __name__ == '__main__':
+            print text
+            sys.stdout.flush()
+        else:
+            from utils.statusbar import refresh
+            refresh(__name__)
 
 def update():
-    global mpd
-        
-    if has_pympd:
-        try:
-            if not mpd:
-                mpd = mpdlib2.connect()
-
-            status = mpd.status()
-
-            if status:
-                song = ''
-                if status.state in ('play', 'pause'):
-                    song = ' %s' % songstr(mpd.currentsong())
-                return (BAR_NORMAL_COLORS, 'MPD: [%s]%s' % (status.state, song))
-        except Exception, e:
-            logger.exception(e)
-            mpd = None  # try to reconnect if connection is lost
+    global watcher
 
-    return None
+    if not watcher:
+        watcher = MPDWatcher(changed)
+        watcher.start()
+    return (BAR_NORMAL_COLORS, TEXT)
 
 
 
 if __name__ == "__main__":  # stand-alone mode, outside of python-wmii
-    import sys
     import time
 
+    watcher = MPDWatcher(changed)
+    watcher.start()
     while True:
-        res = update()
-        if res:
-            print res[1]
-		time.sleep(interval())
+        time.sleep(interval())
@@ -1,5 +1,6 @@
 #
 # Copyright (C) 2007 Alexander Bernauer (alex at copton dot net)
+# Copyright (C) 2026 the python-wmii contributors
 #
 # This program is free software; you can redistribute it and/or
 # modify it under the terms of the GNU General Public License
@@ -17,34 +18,43 @@
 #
 # vim:syntax=python:sw=4:ts=4:expandtab
 
-import re
 import logging
 
 from utils import Colors
-from utils.statusbar import process_by_pipe
+from utils.statusbar import iface_addresses, iface_operstate, link_monitor, drain
 from config import BAR_NORMAL_COLORS
 
 logger = logging.getLogger('statusbar.iface')
 
+IFACES = ['eth0', 'wlan0']
+IFACE_UP = ('up', 'unknown')
+
+MONITOR = None
+
+
+def watch():
+    # the bar changes as soon as the kernel announces a link or address
+    global MONITOR
+    MONITOR = link_monitor()
+    return MONITOR
+
 
 def interval():
-    return 5
+    return 60
 
 
 def update():
     try:
+        if MONITOR:
+            drain(MONITOR)
         s = ""
-        for iface in ['eth0', 'wlan0']:
+        addresses = iface_addresses()
+        for iface in IFACES:
             s += iface + ": "
-            out, err = process_by_pipe(['ip', 'a', 's', iface])
-            lines = out.split('\n')
-
-            if re.search("UP", lines[0]) == None:
+            if iface_operstate(iface) not in IFACE_UP:
                 s += "off "
-            for l in lines[1:]:
-                mo = re.search("inet\s*([0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3})", l)
-                if mo:
-                    s += mo.group(1) + " "
+            for address in addresses.get(iface, []):
+                s += address + " "
 
         return (BAR_NORMAL_COLORS, s)
     except Exception, e:
@@ -19,8 +19,11 @@
 
 import os
 from utils import Colors
+from utils.statusbar import series, STATUS_BAR_HISTORY
 from config import BAR_NORMAL_COLORS
 
+LOAD = series('load', lo = 0)
+
 
 def interval():
     return 3
@@ -37,4 +40,9 @@ def update():
         # red text
         color = Colors(0xFF0000, BAR_NORMAL_COLORS.background, BAR_NORMAL_COLORS.border)
 
-    return (color, 'LOAD: %.2f %.2f %.2f' % lavg)
+    text = 'LOAD: %.2f %.2f %.2f' % lavg
+    if STATUS_BAR_HISTORY:
+        LOAD.push(lavg[0])
+        text += ' ' + LOAD.spark()
+
+    return (color, text)
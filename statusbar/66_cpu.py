@@ -17,22 +17,18 @@
 #
 # vim:syntax=python:sw=4:ts=4:expandtab
 
-import re
 import logging
 
 from utils import Colors
-from utils.statusbar import parse_file
+from utils.statusbar import SAMPLER, CpuStats, series, STATUS_BAR_HISTORY
 from config import BAR_NORMAL_COLORS
 
 logger = logging.getLogger('statusbar.cpu')
 
 FILE_TEMP = '/proc/acpi/thermal_zone/TZ4/temperature'
 
-RE_CPU = re.compile(r'^cpu MHz\s*:\s*(?P<mhz>\d+).*$')
-RE_STATS = re.compile(r'^cpu  (?P<user>\d+) (?P<system>\d+) (?P<nice>\d+) (?P<idle>\d+).*$')
-RE_TEMP = re.compile(r'^temperature:\s*(?P<temp>\d+)\s+(?P<unit>.*)$')
-
-OLD_STATS = dict(user = 0, system = 0, nice = 0, idle = 0)
+CPU = CpuStats()
+LOAD = series('cpu', lo = 0, hi = 100)
 
 
 def interval():
@@ -40,34 +36,31 @@ def interval():
 
 
 def update():
-    cpu_vals = parse_file('/proc/cpuinfo', RE_CPU)
-    stat_vals = parse_file('/proc/stat', RE_STATS)
-    temp_vals = parse_file(FILE_TEMP, RE_TEMP)
-
     cpu = '--'
-    try:
-        cpu = '/'.join(cpu_vals['mhz'])
-    except Exception, e:
-        logger.exception(e)
-
     load = '--'
+    spark = ''
     try:
-        # convert values to int's
-        stat_vals = dict([(k, int(v[0])) for k, v in stat_vals.items()])
-        dtotal = stat_vals['user'] - OLD_STATS['user'] + \
-                 stat_vals['system'] - OLD_STATS['system'] + \
-                 stat_vals['nice'] - OLD_STATS['nice'] + \
-                 stat_vals['idle'] - OLD_STATS['idle']
-        if dtotal > 0:
-            load = '%02d' % (100 - ((stat_vals['idle'] - OLD_STATS['idle']) * 100 / dtotal))
-        OLD_STATS.update(stat_vals)
+        CPU.update()
+        if CPU.mhz_max:
+            cpu = '%d' % CPU.mhz_min
+            if int(CPU.mhz_max) != int(CPU.mhz_min):
+                cpu += '-%d' % CPU.mhz_max
+        load = '%02d%%' % CPU.avg()
+        if CPU.cores > 1:
+            # one line per core doesn't fit the bar, show the busiest
+            core, busy = CPU.busiest()
+            load += ' avg, %02d%% cpu%d' % (busy, core)
+        if STATUS_BAR_HISTORY:
+            LOAD.push(CPU.avg())
+            spark = ' ' + LOAD.spark()
     except Exception, e:
         logger.exception(e)
 
     temp = '--'
     try:
-        temp = '%02d %s' % (int(temp_vals['temp'][0]), temp_vals['unit'][0])
+        value, unit = SAMPLER.keyed(FILE_TEMP, ['temperature:'])['temperature:'][0].split(None, 1)
+        temp = '%02d %s' % (int(value), unit)
     except Exception, e:
         logger.exception(e)
 
-    return (BAR_NORMAL_COLORS, 'CPU: %s MHz (%s%%) [%s]' % (cpu, load, temp))
+    return (BAR_NORMAL_COLORS, 'CPU: %s MHz (%s)%s [%s]' % (cpu, load, spark, temp))
@@ -17,17 +17,15 @@
 #
 # vim:syntax=python:sw=4:ts=4:expandtab
 
-import re
 import logging
 
 from utils import Colors
-from utils.statusbar import process_by_pipe
+from utils.statusbar import meminfo, series, STATUS_BAR_HISTORY
 from config import BAR_NORMAL_COLORS
 
 logger = logging.getLogger('statusbar.mem')
 
-RE_MEM = re.compile('^Mem:\s*(?P<total>\d+)\s+(?P<used>\d+)\s+(?P<free>\d+)\s+(?P<shared>\d+)\s+(?P<buffers>\d+)\s+(?P<cached>\d+).*$')
-RE_SWAP = re.compile('^Swap:\s*(?P<total>\d+)\s+(?P<used>\d+)\s+(?P<free>\d+).*$')
+USAGE = series('mem', lo = 0, hi = 100)
 
 
 def interval():
@@ -36,25 +34,25 @@ def interval():
 
 def update():
     try:
-        out, err = process_by_pipe(['free', '-m'])
-        lines = out.split('\n')
-
-        mem = RE_MEM.match(lines[1])
-        swap = RE_SWAP.match(lines[3])
-
-        if mem and swap:
-            mem = dict([(k, float(v)) for k, v in mem.groupdict().items()])
-            swap = dict([(k, float(v)) for k, v in swap.groupdict().items()])
-
-            mem_used = mem['used'] - mem['buffers'] - mem['cached']
-            mem_usage = mem_used / mem['total'] * 100.0
-
-            swap_usage = swap['used'] / swap['total'] * 100.0
-
-            # return (BAR_NORMAL_COLORS, 'RAM: %d / %d MB (%02d%%) SWAP: %d / %d MB (%02d%%)' % \
-            #         (mem_used, mem['total'], mem_usage, swap['used'], swap['total'], swap_usage))
-            return (BAR_NORMAL_COLORS, 'RAM: %d MB (%02d%%) SWAP: %d MB (%02d%%)' % \
-                    (mem_used, mem_usage, swap['used'], swap_usage))
+        mem = meminfo()
+
+        # the same numbers 'free -m' prints, without forking it
+        mem_total = mem['MemTotal'] / 1024.0
+        mem_used = (mem['MemTotal'] - mem['MemFree'] - mem['Buffers'] - mem['Cached']) / 1024.0
+        mem_usage = mem_used / mem_total * 100.0
+
+        swap_total = mem['SwapTotal'] / 1024.0
+        swap_used = (mem['SwapTotal'] - mem['SwapFree']) / 1024.0
+        swap_usage = swap_total and swap_used / swap_total * 100.0
+
+        # return (BAR_NORMAL_COLORS, 'RAM: %d / %d MB (%02d%%) SWAP: %d / %d MB (%02d%%)' % \
+        #         (mem_used, mem_total, mem_usage, swap_used, swap_total, swap_usage))
+        text = 'RAM: %d MB (%02d%%) SWAP: %d MB (%02d%%)' % \
+               (mem_used, mem_usage, swap_used, swap_usage)
+        if STATUS_BAR_HISTORY:
+            USAGE.push(mem_usage)
+            text += ' ' + USAGE.spark()
+        return (BAR_NORMAL_COLORS, text)
     except Exception, e:
         logger.exception(e)
 
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+in-memory mpd speaking enough of the protocol for the mpd statusbar
+plugin: status, currentsong, idle, noidle, password, ping and close.
+
+    mpd = FakeMPD()
+    mpd.start()                     # exports MPD_HOST and MPD_PORT
+    mpd.play('artist', 'title')     # wakes every client in 'idle player'
+    mpd.disconnect()                # drop all clients, they reconnect
+    mpd.stop()
+
+or standalone, reading 'play <artist> - <title>', 'pause', 'stop' and
+'drop' lines from stdin:
+
+    python tests/fake_mpd.py [port]
+"""
+
+import os
+import sys
+import errno
+import socket
+import logging
+import threading
+
+logger = logging.getLogger('tests.fake_mpd')
+
+__all__ = ['FakeMPD']
+
+
+class FakeMPDConnection(object):
+    def __init__(self, mpd, sock):
+        self.mpd = mpd
+        self.sock = sock
+        self.file = sock.makefile('rb')
+        # subsystems waited for in 'idle', None if not idle
+        self.idle = None
+        self.pending = set()
+        self.authorized = mpd.password is None
+
+    def send(self, data):
+        try:
+            self.sock.sendall(data)
+        except socket.error:
+            pass
+
+    def serve(self):
+        self.send('OK MPD %s\n' % self.mpd.version)
+        while True:
+            line = self.file.readline()
+            if not line.endswith('\n'):
+                break
+            args = line.split(' ', 1)
+            cmd = args[0].strip()
+            arg = len(args) > 1 and args[1].strip().strip('"') or ''
+            self.mpd.lock.acquire()
+            try:
+                self.mpd.count(cmd)
+                if cmd == 'close':
+                    break
+                self.command(cmd, arg)
+            finally:
+                self.mpd.lock.release()
+
+    def command(self, cmd, arg):
+        if cmd == 'noidle':
+            if self.idle is not None:
+                self.idle = None
+                self.send('OK\n')
+            return
+        if self.idle is not None:
+            # only noidle is allowed while idle
+            return
+        if cmd == 'password':
+            if arg == self.mpd.password:
+                self.authorized = True
+                self.send('OK\n')
+            else:
+                self.send('ACK [3@0] {password} incorrect password\n')
+        elif not self.authorized:
+            self.send('ACK [4@0] {%s} you don\'t have permission for "%s"\n' % (cmd, cmd))
+        elif cmd == 'status':
+            self.reply(self.mpd.status())
+        elif cmd == 'currentsong':
+            self.reply(self.mpd.state != 'stop' and self.mpd.song or [])
+        elif cmd == 'ping':
+            self.send('OK\n')
+        elif cmd == 'idle':
+            self.idle = set(arg.split()) or None
+            if self.idle is None:
+                self.idle = set(['player', 'mixer', 'playlist', 'options'])
+            self.wake()
+        else:
+            self.send('ACK [5@0] {} unknown command "%s"\n' % cmd)
+
+    def reply(self, pairs):
+        self.send(''.join(['%s: %s\n' % (k, v) for k, v in pairs]) + 'OK\n')
+
+    def changed(self, subsystem):
+        self.pending.add(subsystem)
+        if self.idle is not None:
+            self.wake()
+
+    def wake(self):
+        changed = self.pending & self.idle
+        if changed:
+            self.pending -= changed
+            self.idle = None
+            self.reply([('changed', s) for s in sorted(changed)])
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+
+class FakeMPD(object):
+    def __init__(self, password = None, version = '0.16.0'):
+        self.password = password
+        self.version = version
+        self.lock = threading.Lock()
+        self.conns = []
+        self.listener = None
+        self.state = 'stop'
+        self.song = []
+        self.songid = 0
+        self.counters = {}
+
+    def count(self, name, n = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def stats(self):
+        """return the number of commands by name and 'connections'"""
+        self.lock.acquire()
+        try:
+            return dict(self.counters)
+        finally:
+            self.lock.release()
+
+    def status(self):
+        return [('volume', '100'), ('state', self.state), ('songid', self.songid)]
+
+    def __player(self, state, song = None):
+        self.lock.acquire()
+        try:
+            self.state = state
+            if song is not None:
+                self.song = song
+                self.songid += 1
+            for conn in self.conns:
+                conn.changed('player')
+        finally:
+            self.lock.release()
+
+    def play(self, artist = None, title = None, file = None):
+        """play a song, or continue the current one without arguments"""
+        song = None
+        if artist or title or file:
+            song = [('file', file or '%s - %s.ogg' % (artist, title))]
+            if artist:
+                song.append(('Artist', artist))
+            if title:
+                song.append(('Title', title))
+        self.__player('play', song)
+
+    def pause(self):
+        self.__player('pause')
+
+    def stop_playing(self):
+        self.__player('stop')
+
+    def start(self, port = 0):
+        """listen on localhost, export MPD_HOST and MPD_PORT, return the port"""
+        self.listener = socket.socket(socket.AF_INET)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', port))
+        self.listener.listen(16)
+        self.port = self.listener.getsockname()[1]
+        os.environ['MPD_HOST'] = self.password and '%s@127.0.0.1' % self.password or '127.0.0.1'
+        os.environ['MPD_PORT'] = str(self.port)
+        t = threading.Thread(target = self.accept)
+        t.setDaemon(True)
+        t.start()
+        return self.port
+
+    def accept(self):
+        while self.listener:
+            try:
+                sock, peer = self.listener.accept()
+            except socket.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                break
+            conn = FakeMPDConnection(self, sock)
+            self.lock.acquire()
+            self.count('connections')
+            self.conns.append(conn)
+            self.lock.release()
+            t = threading.Thread(target = self.serve, args = (conn, ))
+            t.setDaemon(True)
+            t.start()
+
+    def serve(self, conn):
+        try:
+            try:
+                conn.serve()
+            except socket.error, e:
+                logger.debug('connection closed: %s', e)
+        finally:
+            self.lock.acquire()
+            if conn in self.conns:
+                self.conns.remove(conn)
+            self.lock.release()
+            conn.close()
+
+    def disconnect(self):
+        """drop all connections, but keep listening"""
+        self.lock.acquire()
+        conns, self.conns = self.conns, []
+        self.lock.release()
+        for conn in conns:
+            conn.close()
+
+    def stop(self):
+        """stop listening and drop all connections"""
+        listener, self.listener = self.listener, None
+        if listener:
+            try:
+                listener.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            listener.close()
+        self.disconnect()
+
+
+if __name__ == '__main__':
+    mpd = FakeMPD()
+    print mpd.start(len(sys.argv) > 1 and int(sys.argv[1]) or 6600)
+    sys.stdout.flush()
+    try:
+        while True:
+            line = sys.stdin.readline()
+            if not line:
+                break
+            cmd, sep, arg = line.strip().partition(' ')
+            if cmd == 'play':
+                artist, sep, title = arg.partition(' - ')
+                mpd.play(artist, title)
+            elif cmd == 'pause':
+                mpd.pause()
+            elif cmd == 'stop':
+                mpd.stop_playing()
+            elif cmd == 'drop':
+                mpd.disconnect()
+    finally:
+        mpd.stop()
@@ -0,0 +1,729 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+in-memory wmii filesystem served over 9P.
+
+runs p9_sock, the event loop and the statusbar against a headless box
+without X and wmii, for benchmarks and load tests:
+
+    wmii = FakeWmii(tags = ('1', '2'), latency = 0.001)
+    wmii.start()                    # exports WMII_ADDRESS
+    wmii.event('Key Mod1-Return')   # seen by every reader of /event
+    ...
+    wmii.stop()
+
+or standalone, posting every line of stdin to /event:
+
+    WMII_ADDRESS=unix!/tmp/fake-wmii python tests/fake_wmii.py [latency]
+"""
+
+import os
+import sys
+import time
+import errno
+import socket
+import logging
+import tempfile
+import threading
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import P9
+
+logger = logging.getLogger('tests.fake_wmii')
+
+__all__ = ['FakeWmii']
+
+
+def synchronized(func):
+    """run a method under the filesystem lock"""
+    def wrapper(self, *args):
+        self.wmii.lock.acquire()
+        try:
+            return func(self, *args)
+        finally:
+            self.wmii.lock.release()
+    return wrapper
+
+
+class Node(object):
+    """a file of the fake filesystem"""
+    qpath = 0
+
+    def __init__(self, wmii, name, mode = 0644, data = ''):
+        Node.qpath += 1
+        self.wmii = wmii
+        self.name = name
+        self.mode = mode
+        self.data = data
+        self.parent = None
+        self.qid = (self.isdir() and P9.QDIR or 0, 0, Node.qpath)
+
+    def isdir(self):
+        return bool(self.mode & P9.DIR)
+
+    def path(self):
+        if self.parent is None:
+            return ''
+        return '%s/%s' % (self.parent.path(), self.name)
+
+    def stat(self, name = None):
+        now = int(time.time())
+        return (0, 0, 0, self.qid, self.mode, now, now, len(self.content()),
+                name or self.name, 'wmii', 'wmii', 'wmii')
+
+    def content(self):
+        return self.data
+
+    def open(self, fid, mode):
+        if mode & P9.OTRUNC:
+            self.data = ''
+
+    def read(self, conn, tag, fid, offset, count):
+        return self.content()[offset:offset + count]
+
+    def write(self, fid, offset, data):
+        self.data = self.data[:offset] + data + self.data[offset + len(data):]
+        return len(data)
+
+    def clunk(self, fid):
+        pass
+
+
+class Dir(Node):
+    """a directory, 'sel' optionally resolves to the selected entry"""
+    def __init__(self, wmii, name, sel = None, creatable = False):
+        Node.__init__(self, wmii, name, P9.DIR | 0755)
+        self.kids = {}
+        self.sel = sel
+        self.creatable = creatable
+
+    def add(self, node):
+        node.parent = self
+        self.kids[node.name] = node
+        return node
+
+    def remove(self, name):
+        del self.kids[name]
+
+    def lookup(self, name):
+        if name == 'sel' and self.sel:
+            return self.sel()
+        return self.kids.get(name)
+
+    def entries(self):
+        l = [(name, self.kids[name]) for name in sorted(self.kids)]
+        if self.sel and self.sel():
+            l.append(('sel', self.sel()))
+        return l
+
+    def content(self):
+        return ''
+
+    def open(self, fid, mode):
+        if mode & 3 != P9.OREAD:
+            raise P9.ServError('is a directory')
+        fid.dirents = [pack_stat(node.stat(name)) for name, node in self.entries()]
+
+    def read(self, conn, tag, fid, offset, count):
+        # whole stat entries only, starting at the byte offset
+        pos = 0
+        ret = []
+        for ent in fid.dirents:
+            if pos >= offset:
+                if count < len(ent):
+                    break
+                ret.append(ent)
+                count -= len(ent)
+            pos += len(ent)
+        return ''.join(ret)
+
+    def write(self, fid, offset, data):
+        raise P9.ServError('is a directory')
+
+
+class Ctl(Node):
+    """a file running every written line through a handler"""
+    def __init__(self, wmii, name, reader = None, handler = None):
+        Node.__init__(self, wmii, name, 0600)
+        self.reader = reader
+        self.handler = handler
+
+    def content(self):
+        if self.reader:
+            return self.reader()
+        return ''
+
+    def open(self, fid, mode):
+        pass
+
+    def write(self, fid, offset, data):
+        if not self.handler:
+            raise P9.ServError('permission denied')
+        for line in data.splitlines():
+            line = line.strip()
+            if line:
+                self.wmii.log.append((self.path(), line))
+                self.handler(line)
+        return len(data)
+
+
+class Bar(Node):
+    """
+    a bar item, redrawn by wmii when a handle written to is clunked. like
+    wmii, a write cuts it at its end, the old text isn't kept behind it.
+    """
+    def write(self, fid, offset, data):
+        fid.dirty = True
+        self.data = self.data[:offset] + data
+        return len(data)
+
+    def clunk(self, fid):
+        if fid.dirty:
+            self.wmii.count('redraw')
+
+
+class EventFile(Node):
+    """/event, every open handle gets its own queue of events"""
+    def __init__(self, wmii, name):
+        Node.__init__(self, wmii, name, 0600)
+
+    def open(self, fid, mode):
+        fid.queue = EventQueue()
+        self.wmii.queues.append(fid.queue)
+
+    def read(self, conn, tag, fid, offset, count):
+        return fid.queue.read(conn, tag, count)
+
+    def write(self, fid, offset, data):
+        self.wmii.event(*data.splitlines())
+        return len(data)
+
+    def clunk(self, fid):
+        if fid.queue:
+            fid.queue.cancel()
+            self.wmii.queues.remove(fid.queue)
+
+
+class EventQueue(object):
+    """pending events of one /event handle and the read waiting for them"""
+    def __init__(self):
+        self.data = ''
+        self.waiting = None
+
+    def read(self, conn, tag, count):
+        if self.data:
+            ret, self.data = self.data[:count], self.data[count:]
+            return ret
+        self.waiting = (conn, tag, count)
+        return None
+
+    def post(self, data):
+        self.data += data
+        if self.waiting:
+            conn, tag, count = self.waiting
+            self.waiting = None
+            conn.reply(P9.Rread, tag, self.read(conn, tag, count))
+
+    def flush(self, conn, tag):
+        if self.waiting and self.waiting[:2] == (conn, tag):
+            self.waiting = None
+
+    def cancel(self):
+        self.waiting = None
+
+
+def pack_stat(stat):
+    m = P9.Marshal9P(None)
+    m.setBuf(bytearray(m._sizeStat([stat], 0)))
+    m._encStat([stat], 0)
+    return m.getBuf()
+
+
+class Fid(object):
+    def __init__(self, node):
+        self.node = node
+        self.mode = None
+        self.dirty = False
+        self.queue = None
+        self.dirents = []
+
+
+class FakeWmiiServer(P9.RpcServer):
+    """one client connection to the fake filesystem"""
+    def __init__(self, wmii, sock):
+        P9.RpcServer.__init__(self, P9.Sock(sock))
+        self.wmii = wmii
+        self.sock = sock
+        self.fids = {}
+        self.wlock = threading.Lock()
+        self.delayed = deque()
+        self.cond = threading.Condition(threading.Lock())
+        self.running = True
+        if wmii.latency:
+            t = threading.Thread(target = self.deliver)
+            t.setDaemon(True)
+            t.start()
+
+    def rpc(self):
+        self.wmii.count('msgs')
+        return P9.RpcServer.rpc(self)
+
+    def _err(self, tag, msg):
+        self.reply(P9.Rerror, tag, msg)
+
+    def reply(self, type, tag, *args):
+        self.wlock.acquire()
+        try:
+            if not self.wmii.latency:
+                try:
+                    self.msg.send(type, tag, *args)
+                except socket.error, e:
+                    # the serving thread notices on its next recv
+                    logger.debug('reply lost: %s', e)
+                return
+            buf = self.msg.encode(type, tag, args)
+        finally:
+            self.wlock.release()
+        self.cond.acquire()
+        self.delayed.append((time.time() + self.wmii.latency, buf))
+        self.cond.notify()
+        self.cond.release()
+
+    def deliver(self):
+        """send delayed replies once they are due, in order"""
+        while True:
+            self.cond.acquire()
+            try:
+                while self.running and not self.delayed:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                due, buf = self.delayed[0]
+                now = time.time()
+                if due > now:
+                    self.cond.wait(due - now)
+                    continue
+                bufs = []
+                while self.delayed and self.delayed[0][0] <= now:
+                    bufs.append(self.delayed.popleft()[1])
+            finally:
+                self.cond.release()
+            try:
+                self.msg.fd.writev(bufs)
+            except socket.error:
+                return
+
+    def close(self):
+        self.cond.acquire()
+        self.running = False
+        self.cond.notify()
+        self.cond.release()
+        self.release()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+    @synchronized
+    def release(self):
+        for fid in self.fids.values():
+            if fid.mode is not None:
+                fid.node.clunk(fid)
+        self.fids.clear()
+
+    def getfid(self, fid):
+        if fid not in self.fids:
+            raise P9.ServError('unknown fid')
+        return self.fids[fid]
+
+    @synchronized
+    def _srvTversion(self, type, tag, vals):
+        msize, version = vals
+        self.release()
+        if not version.startswith(P9.version):
+            return [min(msize, self.wmii.msize), 'unknown']
+        return [min(msize, self.wmii.msize), P9.version]
+
+    @synchronized
+    def _srvTattach(self, type, tag, vals):
+        fid, afid, uname, aname = vals
+        if fid in self.fids:
+            raise P9.ServError('fid in use')
+        self.fids[fid] = Fid(self.wmii.root)
+        return [self.wmii.root.qid]
+
+    @synchronized
+    def _srvTflush(self, type, tag, oldtag):
+        for queue in self.wmii.queues:
+            queue.flush(self, oldtag)
+        return []
+
+    @synchronized
+    def _srvTwalk(self, type, tag, vals):
+        fid, newfid, names = vals
+        node = self.getfid(fid).node
+        if newfid != fid and newfid in self.fids:
+            raise P9.ServError('fid in use')
+        qids = []
+        for name in names:
+            if name == '..':
+                next = node.parent or node
+            elif node.isdir():
+                next = node.lookup(name)
+            else:
+                next = None
+            if next is None:
+                if not qids:
+                    raise P9.ServError('file not found')
+                return [qids]
+            node = next
+            qids.append(node.qid)
+        self.fids[newfid] = Fid(node)
+        return [qids]
+
+    @synchronized
+    def _srvTopen(self, type, tag, vals):
+        fid, mode = vals
+        f = self.getfid(fid)
+        if f.mode is not None:
+            raise P9.ServError('already open')
+        f.node.open(f, mode)
+        f.mode = mode
+        return [f.node.qid, 0]
+
+    @synchronized
+    def _srvTcreate(self, type, tag, vals):
+        fid, name, perm, mode = vals
+        f = self.getfid(fid)
+        if not f.node.isdir() or not f.node.creatable:
+            raise P9.ServError('permission denied')
+        if name in f.node.kids:
+            raise P9.ServError('file exists')
+        node = f.node.add(Bar(self.wmii, name))
+        f.node = node
+        node.open(f, mode)
+        f.mode = mode
+        return [node.qid, 0]
+
+    @synchronized
+    def _srvTread(self, type, tag, vals):
+        fid, offset, count = vals
+        f = self.getfid(fid)
+        if f.mode is None or f.mode & 3 == P9.OWRITE:
+            raise P9.ServError('not open for reading')
+        data = f.node.read(self, tag, f, offset, min(count, self.wmii.msize - P9.IOHDRSZ))
+        if data is None:
+            return None
+        return [data]
+
+    @synchronized
+    def _srvTwrite(self, type, tag, vals):
+        fid, offset, data = vals
+        f = self.getfid(fid)
+        if f.mode is None or f.mode & 3 == P9.OREAD:
+            raise P9.ServError('not open for writing')
+        self.wmii.count('writes')
+        return [f.node.write(f, offset, data)]
+
+    @synchronized
+    def _srvTclunk(self, type, tag, fid):
+        f = self.getfid(fid)
+        del self.fids[fid]
+        if f.mode is not None:
+            f.node.clunk(f)
+        return []
+
+    @synchronized
+    def _srvTremove(self, type, tag, fid):
+        f = self.getfid(fid)
+        del self.fids[fid]
+        if f.mode is not None:
+            f.node.clunk(f)
+        parent = f.node.parent
+        if not isinstance(f.node, Bar) or parent.kids.get(f.node.name) is not f.node:
+            raise P9.ServError('permission denied')
+        parent.remove(f.node.name)
+        return []
+
+    @synchronized
+    def _srvTstat(self, type, tag, fid):
+        return [[self.getfid(fid).node.stat()]]
+
+
+class FakeWmii(object):
+    """
+    the wmii filesystem: /ctl, /event, /keys, /colrules, /tagrules, the
+    /lbar and /rbar directories and a /tag and /client directory per view
+    and client.  writes to the ctl files change the views and clients and
+    emit the events wmii would.  every reply is delayed by 'latency'
+    seconds, pipelined requests still overlap, like over a slow link.
+    """
+    def __init__(self, tags = ('1', ), latency = 0.0, msize = 8192):
+        self.latency = latency
+        self.msize = msize
+        self.lock = threading.RLock()
+        self.queues = []
+        self.log = deque(maxlen = 1000)
+        self.counts = {}
+        self.settings = [['font', 'fixed'], ['focuscolors', '#ffffff #285577 #4c7899'],
+                         ['normcolors', '#888888 #222222 #333333'], ['grabmod', 'Mod1'],
+                         ['border', '1']]
+        self.tags = {}
+        self.seltag = None
+        self.clients = {}
+        self.selclient = None
+        self.nextclient = 0x1000001
+        self.conns = []
+        self.listener = None
+        self.address = None
+
+        self.root = Dir(self, '')
+        self.root.add(Ctl(self, 'ctl', self.read_ctl, self.ctl))
+        self.root.add(EventFile(self, 'event'))
+        for name in ('keys', 'colrules', 'tagrules'):
+            self.root.add(Node(self, name))
+        self.root.add(Dir(self, 'lbar', creatable = True))
+        self.root.add(Dir(self, 'rbar', creatable = True))
+        self.tagdir = self.root.add(Dir(self, 'tag', lambda: self.tagdir.lookup(self.seltag)))
+        self.clientdir = self.root.add(Dir(self, 'client',
+                                           lambda: self.clientdir.lookup(self.selclient)))
+        self.lock.acquire()
+        try:
+            for tag in tags:
+                self.create_tag(tag)
+            self.view(tags[0])
+        finally:
+            self.lock.release()
+
+    def count(self, name, n = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def stats(self):
+        """message, write and bar redraw counters"""
+        self.lock.acquire()
+        try:
+            return dict(self.counts)
+        finally:
+            self.lock.release()
+
+    def event(self, *lines):
+        """post events to every open /event handle"""
+        data = ''.join([line + '\n' for line in lines])
+        self.lock.acquire()
+        try:
+            self.count('events', len(lines))
+            for queue in self.queues:
+                queue.post(data)
+        finally:
+            self.lock.release()
+
+    def read_ctl(self):
+        return ''.join(['view %s\n' % self.seltag] +
+                       ['%s %s\n' % (k, v) for k, v in self.settings])
+
+    def ctl(self, line):
+        cmd, _, arg = line.partition(' ')
+        if cmd == 'view':
+            self.view(arg)
+        elif cmd != 'quit':
+            for setting in self.settings:
+                if setting[0] == cmd:
+                    setting[1] = arg
+                    break
+            else:
+                raise P9.ServError('bad command')
+
+    def view(self, tag):
+        """select a view, create it if it doesn't exist"""
+        if tag == self.seltag or not tag:
+            return
+        self.create_tag(tag)
+        old, self.seltag = self.seltag, tag
+        if old is not None:
+            self.event('UnfocusTag %s' % old)
+            self.gc_tag(old)
+        self.event('FocusTag %s' % tag)
+
+    def create_tag(self, tag):
+        if tag in self.tags:
+            return
+        self.tags[tag] = []
+        d = self.tagdir.add(Dir(self, tag))
+        d.add(Ctl(self, 'ctl', lambda: '%s\n' % tag, lambda line: None))
+        d.add(Ctl(self, 'index', lambda: self.read_index(tag)))
+        self.event('CreateTag %s' % tag)
+
+    def gc_tag(self, tag):
+        if tag != self.seltag and not self.tags[tag]:
+            del self.tags[tag]
+            self.tagdir.remove(tag)
+            self.event('DestroyTag %s' % tag)
+
+    def read_index(self, tag):
+        return '# ~ 0 0\n' + ''.join(['1 %s 0 0 %s\n' % (cid, self.clients[cid]['label'])
+                                      for cid in self.tags.get(tag, [])])
+
+    def add_client(self, label = 'client', tags = None):
+        """map a client on the given tags (default the selected view), return its id"""
+        self.lock.acquire()
+        try:
+            cid = '0x%x' % self.nextclient
+            self.nextclient += 1
+            self.clients[cid] = {'label': label, 'tags': []}
+            d = self.clientdir.add(Dir(self, cid))
+            d.add(Ctl(self, 'ctl', lambda: '%s\n' % cid, lambda line: self.client_ctl(cid, line)))
+            d.add(Ctl(self, 'tags', lambda: '%s\n' % '+'.join(self.clients[cid]['tags']),
+                      lambda line: self.set_tags(cid, line)))
+            d.add(Ctl(self, 'label', lambda: '%s\n' % self.clients[cid]['label'],
+                      lambda line: self.clients[cid].__setitem__('label', line)))
+            d.add(Ctl(self, 'props', lambda: '%s:%s\n' % (label, label)))
+            self.event('CreateClient %s' % cid)
+            self.set_tags(cid, tags or self.seltag)
+            self.selclient = cid
+            self.event('ClientFocus %s' % cid)
+            return cid
+        finally:
+            self.lock.release()
+
+    def client_ctl(self, cid, line):
+        if line == 'kill':
+            self.remove_client(cid)
+
+    def remove_client(self, cid):
+        self.lock.acquire()
+        try:
+            self.set_tags(cid, '')
+            del self.clients[cid]
+            self.clientdir.remove(cid)
+            if self.selclient == cid:
+                self.selclient = self.clients and sorted(self.clients)[-1] or None
+            self.event('DestroyClient %s' % cid)
+        finally:
+            self.lock.release()
+
+    def set_tags(self, cid, value):
+        old = self.clients[cid]['tags']
+        new = []
+        for tag in value.split('+'):
+            tag = tag.strip()
+            if tag and tag not in new:
+                new.append(tag)
+        self.clients[cid]['tags'] = new
+        for tag in new:
+            self.create_tag(tag)
+            if cid not in self.tags[tag]:
+                self.tags[tag].append(cid)
+        for tag in old:
+            if tag not in new:
+                self.tags[tag].remove(cid)
+                self.gc_tag(tag)
+
+    def start(self, address = None):
+        """
+        listen on address ('unix!<path>' or 'tcp!<host>!<port>', default
+        WMII_ADDRESS or a fresh unix socket), serve every connection in its
+        own thread and export the address as WMII_ADDRESS.
+        """
+        address = address or os.environ.get('WMII_ADDRESS') or \
+                  'unix!%s' % os.path.join(tempfile.mkdtemp(), 'wmii')
+        addr = address.split('!')
+        if addr[0] == 'unix':
+            if os.path.exists(addr[1]):
+                os.unlink(addr[1])
+            self.listener = socket.socket(socket.AF_UNIX)
+            self.listener.bind(addr[1])
+        elif addr[0] == 'tcp':
+            self.listener = socket.socket(socket.AF_INET)
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.listener.bind((addr[1], int(addr[2])))
+            address = 'tcp!%s!%d' % self.listener.getsockname()
+        else:
+            raise ValueError('bad address: %s' % address)
+        self.listener.listen(16)
+        self.address = os.environ['WMII_ADDRESS'] = address
+        t = threading.Thread(target = self.accept)
+        t.setDaemon(True)
+        t.start()
+        return address
+
+    def accept(self):
+        while self.listener:
+            try:
+                sock, peer = self.listener.accept()
+            except socket.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                break
+            if sock.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = FakeWmiiServer(self, sock)
+            self.lock.acquire()
+            self.conns.append(conn)
+            self.lock.release()
+            t = threading.Thread(target = self.serve, args = (conn, ))
+            t.setDaemon(True)
+            t.start()
+
+    def serve(self, conn):
+        try:
+            try:
+                conn.serve()
+            except (P9.Error, socket.error), e:
+                logger.debug('connection closed: %s', e)
+        finally:
+            self.lock.acquire()
+            if conn in self.conns:
+                self.conns.remove(conn)
+            self.lock.release()
+            conn.close()
+
+    def stop(self):
+        """stop listening and drop all connections"""
+        listener, self.listener = self.listener, None
+        if listener:
+            if listener.family == socket.AF_UNIX:
+                os.unlink(listener.getsockname())
+            try:
+                listener.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            listener.close()
+        self.lock.acquire()
+        conns, self.conns = self.conns, []
+        self.lock.release()
+        for conn in conns:
+            conn.close()
+
+
+if __name__ == '__main__':
+    wmii = FakeWmii(latency = len(sys.argv) > 1 and float(sys.argv[1]) or 0.0)
+    print wmii.start()
+    sys.stdout.flush()
+    try:
+        while True:
+            line = sys.stdin.readline()
+            if not line:
+                break
+            wmii.event(line.rstrip('\n'))
+    finally:
+        wmii.stop()
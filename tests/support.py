@@ -0,0 +1,42 @@
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+the wmii of the tests. the utils package connects to wmii once, when it
+is imported, so all test modules of a run share one fake_wmii.py.
+"""
+
+import os
+import sys
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(TESTS, '..')
+sys.path.insert(0, TESTS)
+import fake_wmii
+
+WMII = None
+
+def start_wmii():
+    """start the fake wmii, if it isn't running yet, and return it. utils can be imported then."""
+    global WMII
+    if WMII is None:
+        WMII = fake_wmii.FakeWmii()
+        WMII.start()
+        sys.path.insert(0, ROOT)
+    return WMII
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+handlers of utils/event_handler.py built on a menu run in the pool of
+blocking handlers, the other events go on meanwhile.
+
+    python tests/test_event_handler.py
+"""
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from support import start_wmii
+
+
+def setUpModule():
+    global utils, event_handler
+    start_wmii()
+    import utils
+    from utils import event_handler
+
+
+def wait_for(predicate, timeout = 5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+class Menu(object):
+    """a menu like DMenu, the user picks 'item' when open is set"""
+    blocking = True
+
+    def __init__(self, item):
+        self.item = item
+        self.open = threading.Event()
+
+    def __call__(self):
+        self.open.wait(10)
+        return self.item
+
+
+class BlockingTest(unittest.TestCase):
+    def test_menu_handlers_are_blocking(self):
+        menu = Menu('2')
+        eh = event_handler
+        for handler in (eh.View(menu), eh.ColMode(menu), eh.SetTag(menu), eh.AddTag(menu),
+                        eh.RemoveTag(menu), eh.Execute(menu), eh.Call(menu, {})):
+            self.assertTrue(handler.blocking, handler)
+        for handler in (eh.View('2'), eh.ColMode('max'), eh.NextView()):
+            self.assertFalse(handler.blocking, handler)
+
+    def test_view_menu_doesnt_hold_up_events(self):
+        menu = Menu('2')
+        seen = []
+        handler = utils.EventHandler(utils.patterns(
+            (r'^Key Mod4-v$', event_handler.View(menu)),
+            (r'^Key Mod4-x$', lambda event: seen.append(event))))
+        handler.setDaemon(True)
+        utils.EVENT_HANDLER = handler
+        handler.start()
+        utils.add_event('Key Mod4-v')
+        utils.add_event('Key Mod4-x')
+        # handled while the menu is still open
+        self.assertTrue(wait_for(lambda: seen == ['Key Mod4-x'], 2.0), seen)
+        menu.open.set()
+        self.assertTrue(wait_for(lambda: utils.read_active_view() == '2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
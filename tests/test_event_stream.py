@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+the EventStream of utils/p9_sock.py ends as soon as its wmii is gone.
+
+    python tests/test_event_stream.py
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from support import start_wmii
+from fake_wmii import FakeWmii
+
+
+def setUpModule():
+    global EventStream
+    start_wmii()
+    from utils.p9_sock import EventStream
+
+
+def wait_for(predicate, timeout = 5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+class EventStreamTest(unittest.TestCase):
+    """every stream talks to a wmii of its own, the shared one is left alone"""
+
+    def setUp(self):
+        self.address = os.environ['WMII_ADDRESS']
+        os.environ['WMII_ADDRESS'] = 'unix!%s' % os.path.join(tempfile.mkdtemp(), 'wmii')
+        # the failed connects are logged with a traceback
+        logging.getLogger('utils.p9_sock').disabled = True
+
+    def tearDown(self):
+        logging.getLogger('utils.p9_sock').disabled = False
+        os.environ['WMII_ADDRESS'] = self.address
+
+    def read(self, stream):
+        lines = []
+        t = threading.Thread(target = lambda: lines.extend(stream))
+        t.setDaemon(True)
+        t.start()
+        return t, lines
+
+    def test_ends_when_wmii_quits(self):
+        wmii = FakeWmii()
+        wmii.start(os.environ['WMII_ADDRESS'])
+        try:
+            t, lines = self.read(EventStream('/event'))
+            self.assertTrue(wait_for(lambda: wmii.queues))
+            wmii.event('Key Mod4-x')
+            self.assertTrue(wait_for(lambda: lines == ['Key Mod4-x']), lines)
+        finally:
+            wmii.stop()
+        t.join(1.0)
+        self.assertFalse(t.isAlive())
+
+    def test_ends_without_wmii(self):
+        stream = EventStream('/event', retries = 5, backoff = 1.0)
+        start = time.time()
+        self.assertEqual(list(stream), [])
+        self.assertTrue(time.time() - start < 1.0)
+        self.assertFalse(stream.running)
+
+
+if __name__ == '__main__':
+    unittest.main()
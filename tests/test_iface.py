@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+iface_addresses() and link_monitor() of utils/statusbar.py on the
+loopback interface, compared with 'ip addr'. adding an address to lo or
+a dummy interface needs root, those tests are skipped without it.
+
+    python tests/test_iface.py
+"""
+
+import os
+import sys
+import select
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from support import start_wmii
+
+ALIAS = '127.0.0.77'
+DUMMY = 'wmiitest0'
+
+
+def setUpModule():
+    global statusbar
+    start_wmii()
+    from utils import statusbar
+
+
+def ip(*args):
+    """run ip(8), return its output or None if it failed"""
+    try:
+        proc = subprocess.Popen(('ip', ) + args, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    except OSError:
+        return None
+    out, err = proc.communicate()
+    if proc.returncode:
+        return None
+    return out
+
+
+def ip_addresses(iface):
+    """the IPv4 addresses of iface as listed by 'ip -4 -o addr show'"""
+    out = ip('-4', '-o', 'addr', 'show', 'dev', iface)
+    if out is None:
+        return None
+    return [line.split()[3].split('/')[0] for line in out.splitlines()]
+
+
+def readable(sock, timeout = 2.0):
+    return bool(select.select([sock], [], [], timeout)[0])
+
+
+class IfaceAddressesTest(unittest.TestCase):
+    def test_loopback(self):
+        addresses = statusbar.iface_addresses()
+        self.assertTrue('127.0.0.1' in addresses.get('lo', []), addresses)
+        expected = ip_addresses('lo')
+        if expected is not None:
+            self.assertEqual(addresses['lo'], expected)
+
+    def test_loopback_alias(self):
+        monitor = statusbar.link_monitor()
+        try:
+            if ip('addr', 'add', ALIAS + '/8', 'dev', 'lo', 'label', 'lo:wmii') is None:
+                self.skipTest('can\'t add an address to lo')
+            try:
+                self.assertTrue(readable(monitor))
+                self.assertTrue(statusbar.drain(monitor) > 0)
+                # listed with its interface, after the primary address
+                self.assertEqual(statusbar.iface_addresses()['lo'][-1], ALIAS)
+            finally:
+                ip('addr', 'del', ALIAS + '/8', 'dev', 'lo')
+            self.assertTrue(readable(monitor))
+            statusbar.drain(monitor)
+            self.assertFalse(ALIAS in statusbar.iface_addresses()['lo'])
+        finally:
+            monitor.close()
+
+    def test_dummy(self):
+        if ip('link', 'add', DUMMY, 'type', 'dummy') is None:
+            self.skipTest('can\'t create a dummy interface')
+        monitor = statusbar.link_monitor()
+        try:
+            ip('addr', 'add', '192.0.2.1/24', 'dev', DUMMY)
+            self.assertEqual(statusbar.iface_addresses()[DUMMY], ['192.0.2.1'])
+            statusbar.drain(monitor)
+            ip('link', 'set', DUMMY, 'up')
+            self.assertTrue(readable(monitor))
+        finally:
+            monitor.close()
+            ip('link', 'del', DUMMY)
+        self.assertFalse(DUMMY in statusbar.iface_addresses())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+the mpd plugin and utils/mpd.py against fake_mpd.py, with the statusbar
+writing to fake_wmii.py. no mpd, wmii or X needed.
+
+    python tests/test_mpd.py
+"""
+
+import os
+import sys
+import imp
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from support import ROOT, start_wmii
+from fake_mpd import FakeMPD
+
+
+def setUpModule():
+    global statusbar, p9_read, p9_create, p9_remove, MPDWatcher
+    start_wmii()
+    from utils import statusbar, p9_read, p9_create, p9_remove
+    from utils.mpd import MPDWatcher
+
+
+def wait_for(predicate, timeout = 5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+class MPDPluginTest(unittest.TestCase):
+    """the plugin in a Scheduler, its text read back from /rbar/33_mpd"""
+
+    def setUp(self):
+        self.mpd = FakeMPD()
+        self.mpd.start()
+        # a fresh module, its watcher connects to the MPD_HOST of self.mpd
+        self.plugin = imp.load_source('33_mpd', os.path.join(ROOT, 'statusbar', '33_mpd.py'))
+        p9_create('/rbar/33_mpd', 'starting')
+        self.scheduler = statusbar.Scheduler()
+        self.scheduler.add(statusbar.PluginRunner('33_mpd', self.plugin, 'starting'))
+        statusbar.SCHEDULER = self.scheduler
+        self.scheduler.start()
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.scheduler.join()
+        statusbar.SCHEDULER = None
+        if self.plugin.watcher:
+            self.plugin.watcher.stop()
+        self.mpd.stop()
+        p9_remove('/rbar/33_mpd')
+
+    def bar(self):
+        return ''.join(p9_read('/rbar/33_mpd'))
+
+    def test_idle_wakeup_refreshes_bar(self):
+        self.assertTrue(wait_for(lambda: 'MPD: [stop]' in self.bar()), self.bar())
+        self.mpd.play('artist', 'title')
+        # interval() is 60s, only the push of the watcher gets it there in time
+        self.assertTrue(wait_for(lambda: 'MPD: [play] artist - title' in self.bar(), 2.0), self.bar())
+        self.mpd.pause()
+        self.assertTrue(wait_for(lambda: 'MPD: [pause] artist - title' in self.bar(), 2.0), self.bar())
+        self.assertEqual(self.mpd.stats()['connections'], 1)
+        self.assertTrue(self.mpd.stats()['idle'] >= 3)
+
+    def test_disconnect_clears_bar(self):
+        self.mpd.play('artist', 'title')
+        self.assertTrue(wait_for(lambda: 'artist - title' in self.bar()), self.bar())
+        self.mpd.stop()
+        self.assertTrue(wait_for(lambda: 'MPD' not in self.bar(), 2.0), self.bar())
+        self.assertEqual(self.plugin.TEXT, '')
+
+
+class MPDWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.mpd = FakeMPD()
+        self.port = self.mpd.start()
+        self.calls = []
+        self.watcher = MPDWatcher(self.changed, backoff = 0.1, max_backoff = 0.4)
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.mpd.stop()
+
+    def changed(self, status, song):
+        self.calls.append((time.time(), status and status['state'], song and song.get('Title')))
+
+    def states(self):
+        return [state for t, state, title in self.calls]
+
+    def test_reconnect_after_drop(self):
+        self.watcher.start()
+        self.assertTrue(wait_for(lambda: self.states() == ['stop']), self.calls)
+        self.mpd.disconnect()
+        self.assertTrue(wait_for(lambda: self.states() == ['stop', None, 'stop']), self.calls)
+        self.assertEqual(self.watcher.connects, 2)
+        # the reconnect waited for the backoff
+        self.assertTrue(self.calls[2][0] - self.calls[1][0] >= 0.1, self.calls)
+        self.mpd.play('artist', 'title')
+        self.assertTrue(wait_for(lambda: self.calls[-1][1:] == ('play', 'title')), self.calls)
+
+    def test_backoff_doubles_while_mpd_is_down(self):
+        self.watcher.start()
+        self.assertTrue(wait_for(lambda: self.states() == ['stop']), self.calls)
+        self.mpd.stop()
+        # a changed(None, None) follows every failed connect
+        self.assertTrue(wait_for(lambda: len(self.calls) >= 6, 3.0), self.calls)
+        times = [t for t, state, title in self.calls[1:6]]
+        waits = [b - a for a, b in zip(times, times[1:])]
+        for wait, expected in zip(waits, (0.1, 0.2, 0.4, 0.4)):
+            self.assertTrue(expected * 0.9 <= wait < expected + 0.15, waits)
+        # and it comes back when mpd does
+        self.mpd = FakeMPD()
+        self.mpd.start(self.port)
+        self.assertTrue(wait_for(lambda: self.states()[-1] == 'stop', 2.0), self.calls)
+        self.assertEqual(self.watcher.connects, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
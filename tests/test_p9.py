@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+encode and decode of 9P messages with utils/P9.py, unicode strings are
+sent as utf-8.
+
+    python tests/test_p9.py
+"""
+
+import os
+import sys
+import struct
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+import P9
+
+TEXT = u'view \xe4\u20ac'
+UTF8 = TEXT.encode('utf-8')
+
+
+class RestMarshal(P9.Marshal9P):
+    """Rread with its data as the rest of the message, without a count"""
+    msgFmt = dict(P9.Marshal9P.msgFmt)
+    msgFmt[P9.Rread] = 'R'
+
+
+class CodecTest(unittest.TestCase):
+    def roundtrip(self, marshal, type, args):
+        buf = str(marshal.encode(type, 1, args))
+        size, = struct.unpack_from('<I', buf)
+        self.assertEqual(size, len(buf))
+        return marshal.decode(buf[4:])
+
+    def test_string(self):
+        p9 = P9.Marshal9P(None)
+        self.assertEqual(self.roundtrip(p9, P9.Twrite, (3, 0L, TEXT)), (P9.Twrite, 1, [3, 0L, UTF8]))
+        self.assertEqual(self.roundtrip(p9, P9.Rerror, (TEXT, )), (P9.Rerror, 1, UTF8))
+        self.assertEqual(self.roundtrip(p9, P9.Twalk, ((1, 2, [u'tag', TEXT]), )),
+                         (P9.Twalk, 1, (1, 2, ['tag', UTF8])))
+
+    def test_rest(self):
+        p9 = RestMarshal(None)
+        self.assertEqual(self.roundtrip(p9, P9.Rread, (TEXT, )), (P9.Rread, 1, UTF8))
+
+    def test_stat(self):
+        p9 = P9.Marshal9P(None)
+        stat = (0, 0, 0, (0, 0, 1L), 0644, 0, 0, 0L, TEXT, u'wmii', 'wmii', TEXT)
+        type, tag, vals = self.roundtrip(p9, P9.Rstat, ([stat], ))
+        self.assertEqual(list(vals[0][8:]), [UTF8, 'wmii', 'wmii', UTF8])
+
+    def test_invalid(self):
+        p9 = P9.Marshal9P(None)
+        self.assertRaises(P9.Error, p9.encode, P9.Twrite, 1, (3, 0L, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+the Scheduler of utils/statusbar.py, writing to the fake wmii.
+
+    python tests/test_scheduler.py
+"""
+
+import os
+import sys
+import time
+import types
+import logging
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from support import start_wmii
+
+
+def setUpModule():
+    global statusbar, p9_read, p9_create, p9_remove
+    start_wmii()
+    from utils import statusbar, p9_read, p9_create, p9_remove
+
+
+def plugin(name, interval):
+    mod = types.ModuleType(name)
+    mod.count = 0
+    def update():
+        mod.count += 1
+        return ('#fff #000 #000', '%s %d' % (name, mod.count))
+    mod.update = update
+    mod.interval = lambda: interval
+    return mod
+
+
+class SchedulerErrorTest(unittest.TestCase):
+    def setUp(self):
+        p9_create('/rbar/sched', 'x')
+        self.scheduler = statusbar.Scheduler()
+        self.scheduler.ERROR_DELAY = 0.05
+        # the traceback is expected
+        logging.getLogger('utils.statusbar').disabled = True
+
+    def tearDown(self):
+        logging.getLogger('utils.statusbar').disabled = False
+        self.scheduler.stop()
+        self.scheduler.join()
+        p9_remove('/rbar/sched')
+
+    def test_survives_a_failed_wakeup(self):
+        mod = plugin('sched', 0.05)
+
+        class Failing(statusbar.PluginRunner):
+            fail = True
+            def interval(self):
+                # raises outside the try of a plugin call
+                if Failing.fail:
+                    Failing.fail = False
+                    raise RuntimeError('scheduling failed')
+                return statusbar.PluginRunner.interval(self)
+
+        self.scheduler.add(Failing('sched', mod))
+        self.scheduler.start()
+        end = time.time() + 2
+        while mod.count < 5 and time.time() < end:
+            time.sleep(0.01)
+        self.assertTrue(self.scheduler.isAlive())
+        self.assertEqual(self.scheduler.stats()['errors'], 1)
+        self.assertTrue(mod.count >= 5, mod.count)
+        self.assertTrue(p9_read('/rbar/sched')[0].startswith('#fff #000 #000 sched '))
+
+
+if __name__ == '__main__':
+    unittest.main()
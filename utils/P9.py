@@ -10,6 +10,9 @@ This code is in the public domain.
 Please send any bug reports to newsham@lava.net.
 """
 
+import struct
+import threading
+
 cmdName = {}
 
 
@@ -38,20 +41,19 @@ OTRUNC, ORCLOSE = 0x10, 0x40
 
 PORT = 564
 
+# size of the Twrite/Rread header: size[4] type[1] tag[2] fid[4] offset[8] count[4]
+IOHDRSZ = 24
+
 
 def pad(str, l, padch='\0'):
     str += padch * (l - len(str))
     return str[:l]
 
 
-def _applyFuncs(funcs, vals=None):
-    """Return the results from each function using vals as an argument."""
-    if vals is not None:
-        x = [f(v) for f, v in zip(funcs, vals)]
-    else:
-        x = [f() for f in funcs]
-    if len(x) == 1:
-        x = x[0]
+def _utf8(x):
+    "9P strings are utf-8, a unicode string is sent encoded"
+    if isinstance(x, unicode):
+        return x.encode('utf-8')
     return x
 
 
@@ -71,24 +73,111 @@ class ServError(Error):
     pass
 
 
+class EOF(Error):
+    "The other end closed the connection."
+    pass
+
+
+# precompiled layouts shared by all marshallers
+_U8 = struct.Struct('<B')
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+_HEADER = struct.Struct('<IBH')         # size[4] type[1] tag[2]
+_TYPETAG = struct.Struct('<BH')
+_QID = struct.Struct('<BIQ')            # type[1] vers[4] path[8]
+_TWALK = struct.Struct('<IIH')          # fid[4] newfid[4] nwname[2]
+# size[2] type[2] dev[4] qid[13] mode[4] atime[4] mtime[4] length[8]
+_STAT = struct.Struct('<HHIBIQIIIQ')
+# fixed part of a stat without its own size field, plus the 4 string lengths
+_STATSZ = _STAT.size - 2 + 4 * 2
+
+
 class Sock:
-    """Provide appropriate read and write methods for the Marshaller"""
+    """
+    Provide appropriate read and write methods for the Marshaller.
+
+    Incoming data is received with recv_into into a reusable buffer and
+    messages are framed straight out of it, so a burst of replies costs a
+    single recv.  Messages handed to writev together are gathered into one
+    send.  The transport counts its syscalls and messages, see stats().
+    """
+    BUFSIZE = 64 * 1024
 
-    def __init__(self, sock):
+    def __init__(self, sock, bufsize=BUFSIZE):
         self.sock = sock
+        self.rbuf = bytearray(bufsize)
+        self.rpos = 0
+        self.rend = 0
+        self.recvs = 0
+        self.sends = 0
+        self.msgsin = 0
+        self.msgsout = 0
+
+    def _fill(self, l):
+        "Receive until at least l bytes are buffered."
+        avail = self.rend - self.rpos
+        if self.rpos + l > len(self.rbuf):
+            # move the partial message to the front.  a new buffer is
+            # only allocated if it doesn't fit at all.
+            rbuf = self.rbuf
+            if l > len(rbuf):
+                rbuf = bytearray(max(l, 2 * len(rbuf)))
+            rbuf[:avail] = self.rbuf[self.rpos:self.rend]
+            self.rbuf, self.rpos, self.rend = rbuf, 0, avail
+        while self.rend - self.rpos < l:
+            n = self.sock.recv_into(memoryview(self.rbuf)[self.rend:])
+            self.recvs += 1
+            if not n:
+                raise EOF("Client EOF")
+            self.rend += n
 
     def read(self, l):
-        x = self.sock.recv(l)
-        while len(x) < l:
-            b = self.sock.recv(l - len(x))
-            if not b:
-                raise Error("Client EOF")
-            x += b
-        return x
+        if self.rend - self.rpos < l:
+            self._fill(l)
+        self.rpos += l
+        return str(self.rbuf[self.rpos - l:self.rpos])
+
+    def readmsg(self, maxsize):
+        """
+        Frame the next message.  Return it without its size field as a
+        buffer into the receive buffer, which stays valid until the next
+        read.
+        """
+        if self.rend - self.rpos < 4:
+            self._fill(4)
+        size, = _U32.unpack_from(self.rbuf, self.rpos)
+        if size > maxsize or size < 4:
+            raise Error("Bad message size: %d" % size)
+        if self.rend - self.rpos < size:
+            self._fill(size)
+        pos = self.rpos
+        self.rpos += size
+        self.msgsin += 1
+        return buffer(self.rbuf, pos + 4, size - 4)
 
     def write(self, buf):
-        if self.sock.send(buf) != len(buf):
-            raise Error("short write")
+        self.writev([buf])
+
+    def writev(self, bufs):
+        "Send several messages at once"
+        if len(bufs) == 1:
+            buf = bufs[0]
+        else:
+            buf = bytearray().join(bufs)
+        view = memoryview(buf)
+        n = 0
+        while n < len(buf):
+            n += self.sock.send(view[n:])
+            self.sends += 1
+        self.msgsout += len(bufs)
+
+    def stats(self):
+        "Syscalls and messages so far, without the need for strace"
+        return dict(recvs=self.recvs, sends=self.sends,
+                    msgsin=self.msgsin, msgsout=self.msgsout,
+                    recvspermsg=float(self.recvs) / (self.msgsin or 1),
+                    sendspermsg=float(self.sends) / (self.msgsout or 1))
 
 
 class Marshal(object):
@@ -96,13 +185,19 @@ class Marshal(object):
     Class for marshalling data.
 
     This class provies helpers for marshalling data.  Integers are encoded
-    as little endian.  All encoders and decoders rely on _encX and _decX.
-    These methods append bytes to self.bytes for output and remove bytes
-    from the beginning of self.bytes for input.  To use another scheme
-    only these two methods need be overriden.
+    as little endian with precompiled struct layouts.  Decoders read from
+    self.buf starting at the offset self.pos and advance the offset, so
+    input is never copied except for the strings handed back.  Encoders
+    pack into the preallocated self.buf at self.pos.  Every _encX has a
+    matching _sizeX returning the number of bytes _encX writes, so each
+    message is sized first, allocated once and then packed in place.
     """
     verbose = 0
 
+    # struct codes of the fixed size integers.  runs of them are packed
+    # and unpacked with a single precompiled struct.Struct.
+    fixedFmt = {'1': 'B', '2': 'H', '4': 'I', '8': 'Q'}
+
     def _splitFmt(self, fmt):
         "Split up a format string."
         idx = 0
@@ -119,42 +214,66 @@ class Marshal(object):
         return r
 
     def _prep(self, fmttab):
-        "Precompute encode and decode function tables."
-        encFunc, decFunc = {}, {}
+        "Precompute encode and decode plans."
+        funcs = {}
         for n in dir(self):
-            if n[:4] == "_enc":
-                encFunc[n[4:]] = self.__getattribute__(n)
-            if n[:4] == "_dec":
-                decFunc[n[4:]] = self.__getattribute__(n)
+            if n[:4] in ("_enc", "_dec") or n[:5] == "_size":
+                funcs[n] = getattr(self, n)
 
-        self.msgEncodes, self.msgDecodes = {}, {}
+        self.msgPlans = {}
         for k, v in fmttab.items():
-            fmts = self._splitFmt(v)
-            self.msgEncodes[k] = [encFunc[fmt] for fmt in fmts]
-            self.msgDecodes[k] = [decFunc[fmt] for fmt in fmts]
+            self.msgPlans[k] = self._compile(self._splitFmt(v), funcs)
+
+    def _compile(self, fmts, funcs):
+        """
+        Turn a split format into a list of (struct, count, size, enc, dec)
+        steps.  A run of fixed size integers becomes one step with a struct
+        consuming count values, every other field gets its own functions.
+        """
+        plan = []
+        run = ''
+        for fmt in fmts + [None]:
+            if fmt in self.fixedFmt:
+                run += self.fixedFmt[fmt]
+                continue
+            if run:
+                plan.append((struct.Struct('<' + run), len(run), None, None, None))
+                run = ''
+            if fmt is not None:
+                plan.append((None, 1, funcs['_size' + fmt], funcs['_enc' + fmt],
+                             funcs['_dec' + fmt]))
+        return plan
 
     def setBuf(self, str=""):
-        self.bytes = list(str)
+        self.buf = str
+        self.pos = 0
 
     def getBuf(self):
-        return "".join(self.bytes)
-
-    def _checkSize(self, v, mask):
-        if v != v & mask:
-            raise Error("Invalid value %d" % v)
+        return str(self.buf)
 
     def _checkLen(self, x, l):
         if len(x) != l:
             raise Error("Wrong length %d, expected %d: %r" % (len(x), l, x))
 
+    def _sizeX(self, x):
+        return len(_utf8(x))
+
     def _encX(self, x):
         "Encode opaque data"
-        self.bytes += list(x)
+        x = _utf8(x)
+        pos = self.pos
+        self.pos = pos + len(x)
+        self.buf[pos:self.pos] = x
 
     def _decX(self, l):
-        x = "".join(self.bytes[:l])
-        self.bytes[:l] = []
-        return x
+        pos = self.pos
+        if pos + l > len(self.buf):
+            raise Error("Short message, %d bytes missing" % (pos + l - len(self.buf)))
+        self.pos = pos + l
+        return str(self.buf[pos:self.pos])
+
+    def _sizeC(self, x):
+        return 1
 
     def _encC(self, x):
         "Encode a 1-byte character"
@@ -163,51 +282,76 @@ class Marshal(object):
     def _decC(self):
         return self._decX(1)
 
+    def _size1(self, x):
+        return 1
+
     def _enc1(self, x):
         "Encode a 1-byte integer"
-        self._checkSize(x, 0xff)
-        self._encC(chr(x))
+        _U8.pack_into(self.buf, self.pos, x)
+        self.pos += 1
 
     def _dec1(self):
-        return long(ord(self._decC()))
+        x, = _U8.unpack_from(self.buf, self.pos)
+        self.pos += 1
+        return x
+
+    def _size2(self, x):
+        return 2
 
     def _enc2(self, x):
         "Encode a 2-byte integer"
-        self._checkSize(x, 0xffff)
-        self._enc1(x & 0xff)
-        self._enc1(x >> 8)
+        _U16.pack_into(self.buf, self.pos, x)
+        self.pos += 2
 
     def _dec2(self):
-        return self._dec1() | (self._dec1() << 8)
+        x, = _U16.unpack_from(self.buf, self.pos)
+        self.pos += 2
+        return x
+
+    def _size4(self, x):
+        return 4
 
     def _enc4(self, x):
         "Encode a 4-byte integer"
-        self._checkSize(x, 0xffffffffL)
-        self._enc2(x & 0xffff)
-        self._enc2(x >> 16)
+        _U32.pack_into(self.buf, self.pos, x)
+        self.pos += 4
 
     def _dec4(self):
-        return self._dec2() | (self._dec2() << 16)
+        x, = _U32.unpack_from(self.buf, self.pos)
+        self.pos += 4
+        return x
+
+    def _size8(self, x):
+        return 8
 
     def _enc8(self, x):
-        "Encode a 4-byte integer"
-        self._checkSize(x, 0xffffffffffffffffL)
-        self._enc4(x & 0xffffffffL)
-        self._enc4(x >> 32)
+        "Encode a 8-byte integer"
+        _U64.pack_into(self.buf, self.pos, x)
+        self.pos += 8
 
     def _dec8(self):
-        return self._dec4() | (self._dec4() << 32)
+        x, = _U64.unpack_from(self.buf, self.pos)
+        self.pos += 8
+        return x
+
+    def _sizeS(self, x):
+        return 2 + len(_utf8(x))
 
     def _encS(self, x):
         "Encode length/data strings with 2-byte length"
+        x = _utf8(x)
         self._enc2(len(x))
         self._encX(x)
 
     def _decS(self):
         return self._decX(self._dec2())
 
+    def _sizeD(self, d):
+        return 4 + len(_utf8(d))
+
     def _encD(self, d):
         "Encode length/data arrays with 4-byte length"
+        d = _utf8(d)
         self._enc4(len(d))
         self._encX(d)
 
@@ -258,67 +402,118 @@ class Marshal9P(Marshal):
             raise Error("Invalid message type %d" % t)
 
     def _checkResid(self):
-        if len(self.bytes):
-            raise Error("Extra information in message: %r" % self.bytes)
+        if self.pos != len(self.buf):
+            raise Error("Extra information in message: %r" % self.buf[self.pos:])
+
+    def encode(self, type, tag, args):
+        "Format a message into one freshly allocated buffer"
+        self._checkType(type)
+        plan = self.msgPlans[type]
+        try:
+            size = _HEADER.size
+            i = 0
+            for st, n, sizef, encf, decf in plan:
+                if st is None:
+                    size += sizef(args[i])
+                else:
+                    size += st.size
+                i += n
+
+            self.setBuf(bytearray(size))
+            _HEADER.pack_into(self.buf, 0, size, type, tag)
+            self.pos = _HEADER.size
+            i = 0
+            for st, n, sizef, encf, decf in plan:
+                if st is None:
+                    encf(args[i])
+                else:
+                    st.pack_into(self.buf, self.pos, *args[i:i + n])
+                    self.pos += st.size
+                i += n
+        except (struct.error, IndexError, TypeError, UnicodeError), e:
+            raise Error("Invalid %s message %r: %s" % (cmdName[type], args, e))
+        return self.buf
+
+    def decode(self, buf):
+        "Decode a message without its size field"
+        self.setBuf(buf)
+        try:
+            type, tag = _TYPETAG.unpack_from(buf, 0)
+            self.pos = _TYPETAG.size
+            self._checkType(type)
+            rest = []
+            for st, n, sizef, encf, decf in self.msgPlans[type]:
+                if st is None:
+                    rest.append(decf())
+                else:
+                    rest.extend(st.unpack_from(buf, self.pos))
+                    self.pos += st.size
+        except struct.error, e:
+            raise Error("Malformed message: %s" % e)
+        self._checkResid()
+        if len(rest) == 1:
+            rest = rest[0]
+        return type, tag, rest
 
     def send(self, type, tag, *args):
         "Format and send a message"
-        self.setBuf()
-        self._checkType(type)
-        self._enc1(type)
-        self._enc2(tag)
-        _applyFuncs(self.msgEncodes[type], args)
-        self._enc4(len(self.bytes) + 4)
-        self.bytes = self.bytes[-4:] + self.bytes[:-4]
+        buf = self.encode(type, tag, args)
         if self.verbose:
             print "send", type, tag, repr(args)
-        self.fd.write(self.getBuf())
+        self.fd.write(buf)
 
     def recv(self):
         "Read and decode a message"
-        self.setBuf(self.fd.read(4))
-        size = self._dec4()
-        if size > self.MAXSIZE or size < 4:
-            raise Error("Bad message size: %d" % size)
-        self.setBuf(self.fd.read(size - 4))
-        type, tag = self._dec1(), self._dec2()
-        self._checkType(type)
-        rest = _applyFuncs(self.msgDecodes[type])
-        self._checkResid()
+        type, tag, rest = self.decode(self.fd.readmsg(self.MAXSIZE))
         if self.verbose:
             print "recv", type, tag, repr(rest)
         return type, tag, rest
 
+    def _sizeQ(self, q):
+        return _QID.size
+
     def _encQ(self, q):
         type, vers, path = q
-        self._enc1(type)
-        self._enc4(vers)
-        self._enc8(path)
+        _QID.pack_into(self.buf, self.pos, type, vers, path)
+        self.pos += _QID.size
 
     def _decQ(self):
-        return self._dec1(), self._dec4(), self._dec8()
+        q = _QID.unpack_from(self.buf, self.pos)
+        self.pos += _QID.size
+        return q
+
+    def _sizeR(self, r):
+        return len(_utf8(r))
 
     def _encR(self, r):
         self._encX(r)
 
     def _decR(self):
-        return self._decX(len(self.bytes))
+        return self._decX(len(self.buf) - self.pos)
+
+    def _sizeTwalk(self, x):
+        fid, newfid, names = x
+        size = _TWALK.size
+        for n in names:
+            size += 2 + len(_utf8(n))
+        return size
 
     def _encTwalk(self, x):
         fid, newfid, names = x
-        self._enc4(fid)
-        self._enc4(newfid)
-        self._enc2(len(names))
+        _TWALK.pack_into(self.buf, self.pos, fid, newfid, len(names))
+        self.pos += _TWALK.size
         for n in names:
             self._encS(n)
 
     def _decTwalk(self):
-        fid = self._dec4()
-        newfid = self._dec4()
-        l = self._dec2()
+        fid, newfid, l = _TWALK.unpack_from(self.buf, self.pos)
+        self.pos += _TWALK.size
         names = [self._decS() for n in xrange(l)]
         return fid, newfid, names
 
+    def _sizeRwalk(self, qids):
+        return 2 + _QID.size * len(qids)
+
     def _encRwalk(self, qids):
         self._enc2(len(qids))
         for q in qids:
@@ -328,25 +523,25 @@ class Marshal9P(Marshal):
         l = self._dec2()
         return [self._decQ() for n in xrange(l)]
 
+    def _sizeStat(self, l, enclen=1):
+        size = 0
+        for x in l:
+            size += 2 + _STATSZ + sum([len(_utf8(s)) for s in x[8:12]])
+        if enclen:
+            size += 2
+        return size
+
     def _encStat(self, l, enclen=1):
         if enclen:
-            totsz = 0
-            for x in l:
-                size, type, dev, qid, mode, atime, mtime, ln, name, uid, gid, muid = x
-                totsz = 2+4+13+4+4+4+8+len(name)+len(uid)+len(gid)+len(muid)+2+2+2+2
-            self._enc2(totsz+2)
+            self._enc2(self._sizeStat(l, 0))
 
         for x in l:
             size, type, dev, qid, mode, atime, mtime, ln, name, uid, gid, muid = x
-            size = 2+4+13+4+4+4+8+len(name)+len(uid)+len(gid)+len(muid)+2+2+2+2
-            self._enc2(size)
-            self._enc2(type)
-            self._enc4(dev)
-            self._encQ(qid)
-            self._enc4(mode)
-            self._enc4(atime)
-            self._enc4(mtime)
-            self._enc8(ln)
+            size = _STATSZ + sum([len(_utf8(s)) for s in (name, uid, gid, muid)])
+            qtype, qvers, qpath = qid
+            _STAT.pack_into(self.buf, self.pos, size, type, dev, qtype, qvers, qpath,
+                            mode, atime, mtime, ln)
+            self.pos += _STAT.size
             self._encS(name)
             self._encS(uid)
             self._encS(gid)
@@ -356,48 +551,206 @@ class Marshal9P(Marshal):
         if enclen:
             totsz = self._dec2()
         r = []
-        while len(self.bytes):
-            r.append((self._dec2(),
-                self._dec2(),
-                self._dec4(),
-                self._decQ(),
-                self._dec4(),
-                self._dec4(),
-                self._dec4(),
-                self._dec8(),
-                self._decS(),
-                self._decS(),
-                self._decS(),
-                self._decS()), )
+        buf = self.buf
+        while self.pos < len(buf):
+            size, type, dev, qtype, qvers, qpath, mode, atime, mtime, ln = \
+                    _STAT.unpack_from(buf, self.pos)
+            self.pos += _STAT.size
+            r.append((size, type, dev, (qtype, qvers, qpath), mode, atime, mtime, ln,
+                      self._decS(), self._decS(), self._decS(), self._decS()), )
         return r
 
 
+class RpcRequest(object):
+    """
+    A T-message in flight.  Completed by the RpcClient demultiplexer
+    when the R-message carrying its tag arrives.
+    """
+
+    def __init__(self, type, tag, args):
+        self.type = type
+        self.tag = tag
+        self.args = args
+        self.done = False
+        self.flushing = False
+        self.rtype = None
+        self.vals = None
+
+    def _complete(self, rtype, vals):
+        self.rtype, self.vals = rtype, vals
+        self.done = True
+
+    def result(self):
+        "Return the reply values or raise the error the server sent"
+        if not self.done:
+            raise Error("%s still in flight" % cmdName[self.type])
+        if self.rtype is None:
+            raise Error("%s flushed" % cmdName[self.type])
+        if self.rtype == Rerror:
+            raise RpcError(self.vals)
+        if self.rtype != self.type + 1:
+            raise Error("incorrect reply from server: %r" % [self.rtype, self.tag, self.vals])
+        return self.vals
+
+
 class RpcClient(object):
     """
     A client interface to the protocol.
+
+    Requests are multiplexed over the connection by tag.  Every T-message
+    gets a tag from a pool and any number of them may be in flight, either
+    from several threads or as one pipelined burst (see pipeline).  There
+    is no reader thread: the first waiting thread reads R-messages and
+    routes them by tag to their requests until its own reply is in, then
+    hands the reader role over to the next waiter.
     """
     verbose = 0
+    MAXTAGS = 64
 
     def __init__(self, fd):
         self.msg = Marshal9P(fd)
+        self._rmsg = Marshal9P(fd)
+        self._wlock = threading.Lock()
+        self._cond = threading.Condition(threading.Lock())
+        self._tags = range(self.MAXTAGS - 1, -1, -1)
+        self._pending = {}
+        self._flushed = {}
+        self._reading = False
+
+    def _allocTag(self, type, block=True):
+        "Take a tag from the pool, None if empty and not blocking."
+        if type == Tversion:
+            return notag
+        self._cond.acquire()
+        try:
+            if self._tags:
+                return self._tags.pop()
+        finally:
+            self._cond.release()
+        if not block:
+            return None
+        self._waitFor(lambda: self._tags)
+        return self._allocTag(type)
+
+    def _freeTag(self, tag):
+        if tag != notag:
+            self._tags.append(tag)
+
+    def _write(self, bufs):
+        if not bufs:
+            return
+        self._wlock.acquire()
+        try:
+            self.msg.fd.writev(bufs)
+        finally:
+            self._wlock.release()
+
+    def _waitFor(self, pred):
+        """
+        Block until pred() holds.  While nobody else is reading, take the
+        reader role and dispatch incoming R-messages.
+        """
+        self._cond.acquire()
+        try:
+            while not pred():
+                if self._reading:
+                    self._cond.wait()
+                    continue
+                self._reading = True
+                self._cond.release()
+                try:
+                    rtype, rtag, vals = self._rmsg.recv()
+                finally:
+                    self._cond.acquire()
+                    self._reading = False
+                    self._cond.notifyAll()
+                if self.verbose:
+                    print cmdName.get(rtype, rtype), rtag, repr(vals)
+                self._dispatch(rtype, rtag, vals)
+        finally:
+            self._cond.release()
+
+    def _dispatch(self, rtype, rtag, vals):
+        "Route a reply to its request, called with self._cond held."
+        req = self._pending.pop(rtag, None)
+        if req is None:
+            raise Error("invalid tag received: %r" % rtag)
+        req._complete(rtype, vals)
+        if req.type == Tflush:
+            # after Rflush the old tag may be reused, whether its own
+            # reply made it in before or not
+            old = self._flushed.pop(req.args[0])
+            if self._pending.get(old.tag) is old:
+                del self._pending[old.tag]
+                old._complete(None, None)
+            self._freeTag(old.tag)
+        if not req.flushing:
+            self._freeTag(rtag)
+
+    def pipeline(self, calls):
+        """
+        Send several T-messages in one burst without waiting for the
+        replies in between.  calls is a list of (type, arg, ...) tuples,
+        returns the RpcRequest of every call in the same order.
+        """
+        reqs, bufs = [], []
+        for call in calls:
+            type, args = call[0], call[1:]
+            tag = self._allocTag(type, block=False)
+            if tag is None:
+                # pool exhausted: get the burst so far on the wire, so
+                # its replies can free some tags
+                self._write(bufs)
+                bufs = []
+                tag = self._allocTag(type)
+            if self.verbose:
+                print cmdName[type], tag, repr(args)
+            self._wlock.acquire()
+            try:
+                buf = self.msg.encode(type, tag, args)
+            except Error:
+                self._wlock.release()
+                self._cond.acquire()
+                self._freeTag(tag)
+                self._cond.release()
+                self._write(bufs)
+                raise
+            self._wlock.release()
+            req = RpcRequest(type, tag, args)
+            self._cond.acquire()
+            self._pending[tag] = req
+            self._cond.release()
+            reqs.append(req)
+            bufs.append(buf)
+        self._write(bufs)
+        return reqs
+
+    def request(self, type, *args):
+        "Send a T-message, return its RpcRequest without waiting."
+        return self.pipeline([(type, ) + args])[0]
+
+    def wait(self, req):
+        "Wait for the reply to req and return its values."
+        self._waitFor(lambda: req.done)
+        return req.result()
+
+    def flush(self, req):
+        """
+        Cancel an abandoned request with Tflush.  Its tag returns to the
+        pool when the Rflush arrives, a reply arriving before is dropped.
+        """
+        self._cond.acquire()
+        try:
+            if req.done or req.flushing:
+                return
+            req.flushing = True
+            self._flushed[req.tag] = req
+        finally:
+            self._cond.release()
+        self.request(Tflush, req.tag)
 
     def _rpc(self, type, *args):
-        tag = 1
-        if type == Tversion:
-            tag = notag
-        if self.verbose:
-            print cmdName[type], repr(args)
-        self.msg.send(type, tag, *args)
-        rtype, rtag, vals = self.msg.recv()
-        if self.verbose:
-            print cmdName[rtype], repr(vals)
-        if rtag != tag:
-            raise Error("invalid tag received")
-        if rtype == Rerror:
-            raise RpcError(vals)
-        if rtype != type + 1:
-            raise Error("incorrect reply from server: %r" % [rtype, rtag, vals])
-        return vals
+        return self.wait(self.request(type, *args))
 
     def version(self, msize, version):
         return self._rpc(Tversion, msize, version)
@@ -450,7 +803,14 @@ class RpcServer(object):
         print 'Error', msg        # XXX
         if self.verbose:
             print cmdName[Rerror], repr(msg)
-        self.msg.send(Rerror, tag, msg)
+        self.reply(Rerror, tag, msg)
+
+    def reply(self, type, tag, *args):
+        """
+        Send a reply.  Handlers returning None instead of the reply values
+        answer later through this, e.g. reads blocking for data.
+        """
+        self.msg.send(type, tag, *args)
 
     def rpc(self):
         """
@@ -470,9 +830,11 @@ class RpcServer(object):
             except ServError, e:
                 self._err(tag, e.args[0])
                 return 1                    # nonfatal
+            if rvals is None:
+                return 1                    # deferred, see reply()
             if self.verbose:
                 print cmdName[type+1], repr(rvals)
-            self.msg.send(type + 1, tag, *rvals)
+            self.reply(type + 1, tag, *rvals)
         else:
             return self._err(tag, "Unhandled message: %s" % cmdName[type])
         return 1
@@ -19,7 +19,10 @@
 
 import os
 import re
+import time
 import types
+import sre_parse
+import sre_constants
 import subprocess
 import logging
 import threading
@@ -31,10 +34,10 @@ logger = logging.getLogger('utils')
 p9_impls = ['p9_sock', 'wmiir']
 try:
     for impl in p9_impls:
-        logger.debug('try to load p9 client: %s' % impl)
+        logger.debug('try to load p9 client: %s', impl)
         mod = __import__(impl, globals(), locals(), [])
         if mod.p9_available():
-            logger.debug('p9 client [%s] available' % impl)
+            logger.debug('p9 client [%s] available', impl)
             globals().update(dict([(k, v) for k, v in mod.__dict__.iteritems() if k in mod.__all__]))
             break
 except Exception, e:
@@ -50,22 +53,144 @@ EVENT_LOOP = True
 EVENT_HANDLER = None
 
 
+class LaneStats(object):
+    """queue depth and wait time of an event handler lane"""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.depth = 0
+        self.max_depth = 0
+        self.count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def queued(self):
+        self.__lock.acquire()
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self.__lock.release()
+
+    def started(self, queued_at):
+        wait = time.time() - queued_at
+        self.__lock.acquire()
+        self.depth -= 1
+        self.count += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.__lock.release()
+
+    def stats(self):
+        self.__lock.acquire()
+        try:
+            return dict(depth = self.depth, max_depth = self.max_depth, count = self.count,
+                        wait_avg = self.count and self.wait_total / self.count or 0.0,
+                        wait_max = self.wait_max)
+        finally:
+            self.__lock.release()
+
+
+class HandlerPool(object):
+    """
+    worker threads for blocking event handlers.
+
+    calls of the same handler run one after another in the order of their
+    events, different handlers run in parallel on up to 'size' threads.
+    """
+
+    def __init__(self, size = 4):
+        self.__size = size
+        self.__threads = 0
+        self.__idle = 0
+        self.__cond = threading.Condition(threading.Lock())
+        self.__ready = []
+        self.__pending = {}
+        self.stats = LaneStats()
+
+    def submit(self, handler, event):
+        self.stats.queued()
+        self.__cond.acquire()
+        try:
+            job = (time.time(), event)
+            if handler in self.__pending:
+                # busy, run after the running call
+                self.__pending[handler].append(job)
+                return
+            self.__pending[handler] = []
+            self.__ready.append((handler, job))
+            if self.__idle:
+                self.__cond.notify()
+            elif self.__threads < self.__size:
+                self.__threads += 1
+                t = threading.Thread(target = self.__work, name = 'HandlerPool-%d' % self.__threads)
+                t.setDaemon(True)
+                t.start()
+        finally:
+            self.__cond.release()
+
+    def __work(self):
+        self.__cond.acquire()
+        while EVENT_LOOP:
+            if not self.__ready:
+                self.__idle += 1
+                self.__cond.wait()
+                self.__idle -= 1
+                continue
+            handler, (queued_at, event) = self.__ready.pop(0)
+            self.__cond.release()
+            self.stats.started(queued_at)
+            try:
+                logger.debug('dispatch event in pool: [%s]', event)
+                handler(event)
+            except Exception, e:
+                logger.exception(e)
+            self.__cond.acquire()
+            jobs = self.__pending[handler]
+            if jobs:
+                self.__ready.append((handler, jobs.pop(0)))
+            else:
+                del self.__pending[handler]
+        self.__cond.release()
+
+
+MAIN_LANE = LaneStats()
+HANDLER_POOL = HandlerPool()
+
+
+def event_stats():
+    """return queue depth and wait time statistics of the handler lanes"""
+    return dict(main = MAIN_LANE.stats(), pool = HANDLER_POOL.stats.stats())
+
+
 class EventHandler(threading.Thread):
-    """event handler thread"""
+    """
+    event handler thread.
+
+    handlers run here in the order of the events, except blocking ones
+    (e.g. menus waiting for the user), which are passed to HANDLER_POOL.
+    """
 
     def __init__(self, handler_list):
+        if not isinstance(handler_list, EventList):
+            handler_list = EventList(handler_list)
         self.__handler_list = handler_list
         threading.Thread.__init__(self)
 
     def run(self):
         global EVENT_LOOP, EVENT_QUEUE
+        STATE.live = True
         while EVENT_LOOP:
-            event = EVENT_QUEUE.popleft()
+            queued_at, event = EVENT_QUEUE.popleft()
+            MAIN_LANE.started(queued_at)
             try:
-                logger.debug('dispatch event: [%s]' % event)
+                logger.debug('dispatch event: [%s]', event)
                 if isinstance(event, types.StringTypes):
+                    STATE.event(event)
                     # call every matching event handler
-                    [handler(event) for handler in self.__handler_list if handler.match(event)]
+                    for handler in self.__handler_list.resolve(event):
+                        if handler.blocking:
+                            HANDLER_POOL.submit(handler, event)
+                        else:
+                            handler(event)
                 elif callable(event):
                     # simple call
                     event()
@@ -81,8 +206,9 @@ def stop_event_handler():
 def add_event(event):
     global EVENT_QUEUE, EVENT_HANDLER
 
-    logger.debug('add event: [%s]' % event)
-    EVENT_QUEUE.append(event)
+    logger.debug('add event: [%s]', event)
+    MAIN_LANE.queued()
+    EVENT_QUEUE.append((time.time(), event))
     if not EVENT_HANDLER or not EVENT_HANDLER.isAlive():
         from events import EVENTS
         logger.debug('(re)start event handler')
@@ -91,6 +217,12 @@ def add_event(event):
     return True
 
 
+def blocking(handler):
+    """mark an event handler as blocking, so it runs in the HANDLER_POOL"""
+    handler.blocking = True
+    return handler
+
+
 class EventResolver(object):
     """encapsulate an event handler"""
     __used_keys = set()
@@ -122,12 +254,45 @@ class EventResolver(object):
         if key:
             self.__used_keys.add(key)
 
+        self.prefix, self.exact = self.__literal_prefix(self.__regex)
+
     def match(self, event):
         return self.__regex.match(event)
 
+    def __literal_prefix(self, regex):
+        """
+        return the literal text every matching event starts with and whether
+        the regex matches nothing but that text.
+        """
+        # case insensitive or multiline regexes are always scanned
+        if regex.flags & (re.I | re.M):
+            return '', False
+        if isinstance(regex.pattern, unicode):
+            char = unichr
+        else:
+            char = chr
+        prefix = []
+        items = list(sre_parse.parse(regex.pattern, regex.flags))
+        for i, (op, av) in enumerate(items):
+            if op == sre_constants.AT and av in (sre_constants.AT_BEGINNING,
+                                                 sre_constants.AT_BEGINNING_STRING) and i == 0:
+                continue
+            if op == sre_constants.LITERAL:
+                prefix.append(char(av))
+                continue
+            exact = op == sre_constants.AT and i == len(items) - 1 and \
+                    av in (sre_constants.AT_END, sre_constants.AT_END_STRING)
+            return ''.join(prefix), exact
+        return ''.join(prefix), False
+
     def __call__(self, event):
         self.__handler(event, *self.__default_args)
 
+    @property
+    def blocking(self):
+        """True if the handler waits on something (e.g. the user), see blocking()"""
+        return getattr(self.__handler, 'blocking', False)
+
     RE_KEY_REGEX = re.compile(r'^\^?Key (?P<key>.*?)\$?$')
     def __get_key(self, regex_pattern):
         """return the key, if it matches RE_KEY_REGEX, else None"""
@@ -163,6 +328,82 @@ class MKey(Key):
         return Key.__new__(cls, ''.join((mk, value)))
 
 
+def _invalidating(name):
+    """wrap a list method to drop the EventList index before the change"""
+    method = getattr(list, name)
+    def wrapper(self, *args, **kwargs):
+        self._index = None
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = name
+    return wrapper
+
+
+class EventList(list):
+    """
+    list of event resolvers, as returned by patterns().
+
+    resolve() finds the resolvers matching an event through an index, which
+    is rebuilt after the list changed. resolvers of literal regexes (like
+    '^Key Mod4-1$') are looked up by the event text, those of regexes with
+    a literal prefix (like '^FocusTag') by the event type. only the rest
+    is matched against every event.
+    """
+    _index = None
+
+    def resolve(self, event):
+        """return the resolvers matching event, in list order"""
+        if self._index is None:
+            self._index = self.__build()
+        exact, bytype, lengths, scan = self._index
+
+        candidates = exact.get(event, [])
+        if event[-1:] == '\n':
+            # '$' matches before a trailing newline too
+            candidates = candidates + exact.get(event[:-1], [])
+        etype = event.split(' ', 1)[0]
+        for l in lengths:
+            if l > len(etype):
+                break
+            candidates = candidates + bytype.get(etype[:l], [])
+        if candidates:
+            candidates = sorted(candidates + scan)
+        else:
+            candidates = scan
+        return [r for pos, r in candidates if r.match(event)]
+
+    def __build(self):
+        exact = {}
+        bytype = {}
+        scan = []
+        for pos, r in enumerate(self):
+            prefix, is_exact = getattr(r, 'prefix', ''), getattr(r, 'exact', False)
+            if is_exact:
+                exact.setdefault(prefix, []).append((pos, r))
+            elif prefix:
+                # key by the event type, the prefix up to the first blank
+                bytype.setdefault(prefix.split(' ', 1)[0], []).append((pos, r))
+            else:
+                scan.append((pos, r))
+        lengths = sorted(set([len(t) for t in bytype]))
+        return exact, bytype, lengths, scan
+
+    __iadd__ = _invalidating('__iadd__')
+    __setitem__ = _invalidating('__setitem__')
+    __delitem__ = _invalidating('__delitem__')
+    __setslice__ = _invalidating('__setslice__')
+    __delslice__ = _invalidating('__delslice__')
+    append = _invalidating('append')
+    extend = _invalidating('extend')
+    insert = _invalidating('insert')
+    pop = _invalidating('pop')
+    remove = _invalidating('remove')
+    reverse = _invalidating('reverse')
+    sort = _invalidating('sort')
+
+    def __add__(self, other):
+        return EventList(list.__add__(self, other))
+
+
 def patterns(*tuples):
     """
     used to create the EVENT list.
@@ -193,7 +434,7 @@ def patterns(*tuples):
             ...
         )
     """
-    resolver_list = []
+    resolver_list = EventList()
     for t in tuples:
         if callable(t):
             t = t()
@@ -220,10 +461,10 @@ def patterns(*tuples):
 
         for r in regex:
             if isinstance(r, EventResolver):
-                logger.debug('add event resolver: %s' % r)
+                logger.debug('add event resolver: %s', r)
                 resolver_list.append(r)
             else:
-                logger.debug('add event handler: "%s", %s' % (r, handler))
+                logger.debug('add event handler: "%s", %s', r, handler)
                 try:
                     resolver_list.append(EventResolver(r, handler, default_args))
                 except TypeError, e:
@@ -259,7 +500,7 @@ def init_tag_mappings(tmap):
            r not in [tr for td, tr in clean_tmap]:
             clean_tmap.append((d, r))
         else:
-            logger.warn('invalid mapping: %s (display) -> %s (real)' % (d, r))
+            logger.warn('invalid mapping: %s (display) -> %s (real)', d, r)
 
     TAF_MAPPING_KEY_DISPLAY = dict(clean_tmap)
     TAG_MAPPING_KEY_REAL = dict([(r, d) for d, r in clean_tmap])
@@ -281,11 +522,216 @@ def real_tag_name(name):
 
 def active_view():
     """return the active view."""
+    if STATE.live:
+        return STATE.active_view()
+    return read_active_view()
+
+
+def read_active_view():
+    """return the active view as read from /ctl."""
     act_v = [l for l in p9_read('/ctl') if l.startswith('view ')]
     if act_v:
         act_v = act_v[0].split(' ')[1]
     return act_v
 
+
+def all_views():
+    """return the sorted list of views."""
+    if STATE.live:
+        return STATE.views()
+    return read_views()
+
+
+def read_views():
+    """return the sorted list of views as read from /tag."""
+    return sorted([l.rstrip('/') for l in p9_ls('/tag') or [] if l != 'sel/'])
+
+
+def selected_client():
+    """return the id of the selected client or None."""
+    if STATE.live:
+        return STATE.selected_client()
+    return read_selected_client()
+
+
+def read_selected_client():
+    """return the id of the selected client as read from /client/sel/ctl."""
+    if 'sel/' in (p9_ls('/client') or []):
+        ctl = p9_read('/client/sel/ctl')
+        if ctl and ctl[0]:
+            return ctl[0].strip()
+    return None
+
+
+def read_client_tags(client = None):
+    """
+    return the tags of a client (default the selected one) as read from
+    /client/<client>/tags, None if it can't be read. wmii sends no event
+    when the tags of a client change, so they aren't mirrored.
+    """
+    tags = p9_read('/client/%s/tags' % (client or 'sel'))
+    if tags is None:
+        return None
+    return [tag.strip() for tag in tags[0].split('+') if tag.strip()]
+
+
+def write_client_tags(tags):
+    """set the tags of the selected client."""
+    p9_write('/client/sel/tags', '+'.join(tags))
+
+
+class StateMirror(object):
+    """
+    views and clients of wmii, kept current from the /event stream.
+
+    the mirror is seeded from the filesystem on first use and updated by
+    the event handler thread before any handler sees the event, so handlers
+    get the active view, the views and the selected client without a
+    single RPC. a check compares the mirror with the filesystem every
+    STATE_CHECK_INTERVAL seconds on the event handler thread and resyncs
+    after drift.
+
+    if the mirror can't be seeded, the answers are read from wmii.
+    """
+    CHECK_INTERVAL = 60
+
+    def __init__(self):
+        self.__lock = threading.RLock()
+        self.__synced = False
+        self.__checker = None
+        self.__views = set()
+        self.__view = None
+        self.__clients = set()
+        self.__client = None
+        # set by the event handler thread, before that nothing updates
+        # the mirror and it must not be used
+        self.live = False
+        self.drifts = 0
+
+    def __read(self):
+        tags, clients = p9_ls('/tag'), p9_ls('/client')
+        if tags is None or clients is None:
+            return None
+        views = set([l.rstrip('/') for l in tags if l != 'sel/'])
+        clients = set([l.rstrip('/') for l in clients if l != 'sel/'])
+        return views, read_active_view(), clients, read_selected_client()
+
+    def __ensure(self):
+        """return True if the mirror can be used"""
+        if not self.__synced:
+            self.sync()
+        return self.__synced
+
+    def sync(self):
+        """(re)seed the mirror from the filesystem"""
+        state = self.__read()
+        if state is None:
+            return
+        self.__lock.acquire()
+        try:
+            self.__views, self.__view, self.__clients, self.__client = state
+            self.__synced = True
+        finally:
+            self.__lock.release()
+        self.__start_checker()
+
+    def check(self):
+        """compare the mirror with the filesystem, resync on drift"""
+        if not self.__synced:
+            return
+        state = self.__read()
+        if state is None:
+            return
+        self.__lock.acquire()
+        try:
+            mirror = (self.__views, self.__view, self.__clients, self.__client)
+            if mirror != state:
+                self.drifts += 1
+                logger.warn('state mirror drifted, resync: %r != %r', mirror, state)
+                self.__views, self.__view, self.__clients, self.__client = state
+        finally:
+            self.__lock.release()
+
+    def __start_checker(self):
+        self.__lock.acquire()
+        try:
+            if self.__checker:
+                return
+            try:
+                from config import STATE_CHECK_INTERVAL as interval
+            except ImportError:
+                interval = self.CHECK_INTERVAL
+            def run():
+                while EVENT_LOOP:
+                    time.sleep(interval)
+                    # queue the check behind the pending events
+                    add_event(self.check)
+            self.__checker = threading.Thread(target = run, name = 'StateMirrorCheck')
+            self.__checker.setDaemon(True)
+            self.__checker.start()
+        finally:
+            self.__lock.release()
+
+    def event(self, event):
+        """update the mirror from a wmii event"""
+        if not self.__synced:
+            return
+        parts = event.split()
+        if len(parts) != 2 or parts[1] == 'NULL':
+            return
+        type, arg = parts
+        self.__lock.acquire()
+        try:
+            if type == 'CreateTag':
+                self.__views.add(arg)
+            elif type == 'DestroyTag':
+                self.__views.discard(arg)
+            elif type == 'FocusTag':
+                self.__views.add(arg)
+                self.__view = arg
+            elif type == 'CreateClient':
+                self.__clients.add(arg)
+            elif type == 'DestroyClient':
+                self.__clients.discard(arg)
+                if self.__client == arg:
+                    self.__client = None
+            elif type == 'ClientFocus':
+                self.__clients.add(arg)
+                self.__client = arg
+        finally:
+            self.__lock.release()
+
+    def set_view(self, tag):
+        """the view was switched by ourself, don't wait for the FocusTag event"""
+        self.__lock.acquire()
+        try:
+            if self.__synced:
+                self.__views.add(tag)
+                self.__view = tag
+        finally:
+            self.__lock.release()
+
+    def active_view(self):
+        if not self.__ensure():
+            return read_active_view()
+        return self.__view
+
+    def views(self):
+        if not self.__ensure():
+            return read_views()
+        self.__lock.acquire()
+        try:
+            return sorted(self.__views)
+        finally:
+            self.__lock.release()
+
+    def selected_client(self):
+        if not self.__ensure():
+            return read_selected_client()
+        return self.__client
+
+STATE = StateMirror()
+
 # ---------------------------------------------------------------------------
 
 
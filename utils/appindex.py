@@ -0,0 +1,236 @@
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+index of the executables in $PATH, kept on disk between sessions.
+
+every directory is stored with its mtime and only listed again when that
+changed, so a warm lookup costs one stat() per directory instead of one
+per executable. launch counts are kept, too, and sort the most used
+commands first.
+"""
+
+import os
+import stat
+import logging
+import threading
+import cPickle
+
+logger = logging.getLogger('utils.appindex')
+
+__all__ = ['AppIndex', 'default_index_file']
+
+VERSION = 1
+
+
+def default_index_file():
+    """'appindex' in the first directory of WMII_CONFPATH, or ~/.wmii"""
+    confpath = os.environ.get('WMII_CONFPATH', '').split(':')[0] or os.path.expanduser('~/.wmii')
+    return os.path.join(confpath, 'appindex')
+
+
+def scan_directory(path):
+    """return the sorted names of the executable files in path"""
+    apps = []
+    for f in os.listdir(path):
+        fullname = os.path.join(path, f)
+        if os.path.isfile(fullname) and os.access(fullname, os.X_OK):
+            apps.append(f)
+    apps.sort()
+    return apps
+
+
+class AppIndex(object):
+    def __init__(self, filename = None, path = None):
+        """
+        index the directories of 'path' (default $PATH at each refresh),
+        stored in 'filename' (default default_index_file()).
+        """
+        self.filename = filename or default_index_file()
+        self.path = path
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        # directory -> (mtime, [executable, ...])
+        self.dirs = {}
+        self.counts = {}
+        self.loaded = False
+        self.dirty = False
+        self.scans = 0
+        self.__sorted = None
+        self.__refreshing = None
+
+    def load(self):
+        """read the index file, if there is one"""
+        try:
+            file = open(self.filename, 'rb')
+            try:
+                data = cPickle.load(file)
+            finally:
+                file.close()
+            if data.get('version') != VERSION:
+                raise ValueError('index version %r' % data.get('version'))
+            self.lock.acquire()
+            try:
+                self.dirs = data['dirs']
+                self.counts = data['counts']
+                self.__sorted = None
+            finally:
+                self.lock.release()
+        except (IOError, OSError), e:
+            logger.debug('no application index: %s', e)
+        except Exception, e:
+            logger.warn('broken application index %s: %s', self.filename, e)
+        self.loaded = True
+
+    def save(self):
+        """write the index file, through a temporary file and rename()"""
+        self.save_lock.acquire()
+        try:
+            self.__save()
+        finally:
+            self.save_lock.release()
+
+    def __save(self):
+        self.lock.acquire()
+        try:
+            data = dict(version = VERSION, dirs = dict(self.dirs), counts = dict(self.counts))
+            self.dirty = False
+        finally:
+            self.lock.release()
+        tmp = '%s.%d' % (self.filename, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(self.filename)):
+                os.makedirs(os.path.dirname(self.filename))
+            file = open(tmp, 'wb')
+            try:
+                cPickle.dump(data, file, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                file.close()
+            os.rename(tmp, self.filename)
+        except (IOError, OSError), e:
+            logger.warn('can\'t save application index %s: %s', self.filename, e)
+
+    def directories(self):
+        path = self.path
+        if path is None:
+            path = os.environ.get('PATH', '')
+        ret = []
+        for p in path.split(':'):
+            if p and p not in ret:
+                ret.append(p)
+        return ret
+
+    def refresh(self):
+        """
+        list the directories whose mtime changed again, save the index
+        if anything changed. return True if the set of commands changed.
+        """
+        if not self.loaded:
+            self.load()
+        dirs = {}
+        changed = False
+        for p in self.directories():
+            try:
+                mtime = os.stat(p)[stat.ST_MTIME]
+            except OSError:
+                continue
+            old = self.dirs.get(p)
+            if old and old[0] == mtime:
+                dirs[p] = old
+                continue
+            try:
+                dirs[p] = (mtime, scan_directory(p))
+            except OSError, e:
+                logger.debug('can\'t list %s: %s', p, e)
+                continue
+            self.scans += 1
+            changed = True
+        self.lock.acquire()
+        try:
+            if changed or len(dirs) != len(self.dirs):
+                self.dirs = dirs
+                self.__sorted = None
+                self.dirty = changed = True
+        finally:
+            self.lock.release()
+        if self.dirty:
+            self.save()
+        return changed
+
+    def refresh_async(self):
+        """refresh() in a background thread, unless one is running"""
+        self.lock.acquire()
+        try:
+            if self.__refreshing and self.__refreshing.isAlive():
+                return self.__refreshing
+            t = self.__refreshing = threading.Thread(target = self.__refresh)
+            t.setDaemon(True)
+        finally:
+            self.lock.release()
+        t.start()
+        return t
+
+    def __refresh(self):
+        try:
+            self.refresh()
+        except Exception, e:
+            logger.exception(e)
+
+    def apps(self):
+        """return all commands, the most launched first, then by name"""
+        self.lock.acquire()
+        try:
+            if self.__sorted is None:
+                apps = set()
+                for mtime, names in self.dirs.itervalues():
+                    apps.update(names)
+                # only the few launched ones need a sort key
+                counts = self.counts
+                launched = sorted([a for a in counts if a in apps], key = lambda a: (-counts[a], a))
+                apps.difference_update(launched)
+                self.__sorted = launched + sorted(apps)
+            return self.__sorted
+        finally:
+            self.lock.release()
+
+    def __iter__(self):
+        return iter(self.apps())
+
+    def launched(self, command):
+        """count a launch of the first word of command, if it's indexed"""
+        name = command.split()[0]
+        self.lock.acquire()
+        try:
+            if name not in self.__names():
+                return False
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self.__sorted = None
+            self.dirty = True
+        finally:
+            self.lock.release()
+        t = threading.Thread(target = self.save)
+        t.setDaemon(True)
+        t.start()
+        return True
+
+    def __names(self):
+        ret = set()
+        for mtime, names in self.dirs.itervalues():
+            ret.update(names)
+        return ret
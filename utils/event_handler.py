@@ -19,11 +19,15 @@
 
 import os
 import re
+import errno
 import subprocess
+import threading
 import logging
 import copy
 from utils import *
 from utils.ringbuffer import RingBuffer
+from utils.appindex import AppIndex
+from utils.launcher import launch
 from config import BAR_NORMAL_COLORS, BAR_FOCUS_COLORS, DMENU_FONT, \
                    DMENU_NORMAL_COLORS, DMENU_SELECTION_COLORS
 
@@ -59,6 +63,7 @@ class View(object):
     def __init__(self, tag = None, buttons = ('1', '2')):
         self._tag = tag
         self._buttons = buttons
+        self.blocking = getattr(tag, 'blocking', False)
 
     def __call__(self, event = '', tag = None):
         tag = self._tag or tag
@@ -77,14 +82,12 @@ class View(object):
             if callable(tag):
                 tag = tag()
             tag = real_tag_name(tag)
-            logger.debug('%s: event[%s], tag[%s]' % (self.__class__.__name__, event, tag))
+            logger.debug('%s: event[%s], tag[%s]', self.__class__.__name__, event, tag)
             p9_write('/ctl', 'view %s' % tag)
+            STATE.set_view(tag)
 
     def _get_views(self):
-        act_v = active_view()
-        ignore = ('sel/',)
-        avail_v = [l.rstrip('/') for l in p9_ls('/tag') if l not in ignore]
-        return sorted(avail_v)
+        return all_views()
 
 class WheelView(object):
     """
@@ -94,7 +97,7 @@ class WheelView(object):
     def __call__(self, event):
         try:
             button = event.strip().split()[-2]
-            logger.debug('view_wheel: event[%s], button[%s]' % (event, button))
+            logger.debug('view_wheel: event[%s], button[%s]', event, button)
             if button == '4':
                 PrevView()()
             elif button == '5':
@@ -111,7 +114,7 @@ class NextView(View):
         act_view = active_view()
         avail_views = self._get_views()
         next_view = avail_views[(avail_views.index(act_view) + 1) % len(avail_views)]
-        logger.debug('next_view: %s (act view: %s)' % (next_view, act_view))
+        logger.debug('next_view: %s (act view: %s)', next_view, act_view)
         View.__call__(self, tag = next_view)
 
 class PrevView(View):
@@ -123,7 +126,7 @@ class PrevView(View):
         act_view = active_view()
         avail_views = self._get_views()
         prev_view = avail_views[(avail_views.index(act_view) - 1) % len(avail_views)]
-        logger.debug('prev_view: %s (act view: %s)' % (prev_view, act_view))
+        logger.debug('prev_view: %s (act view: %s)', prev_view, act_view)
         View.__call__(self, tag = prev_view)
 
 # ---------------------------------------------------------------------------
@@ -132,45 +135,51 @@ class SetTag(object):
     """set tag to current client. other tag settings are overwritten."""
     def __init__(self, tag = None):
         self.__tag = tag
+        self.blocking = getattr(tag, 'blocking', False)
 
     def __call__(self, event = ''):
         tag = self.__tag
         if callable(tag):
             tag = tag()
         tag = real_tag_name(tag)
-        logger.debug('%s: event[%s], tag[%s]' % (self.__class__.__name__, event, tag))
-        p9_write('/client/sel/tags', tag)
+        logger.debug('%s: event[%s], tag[%s]', self.__class__.__name__, event, tag)
+        write_client_tags([tag])
 
 class AddTag(object):
     """add tag to current client. other tag settings are preserved."""
     def __init__(self, tag = None):
         self.__tag = tag
+        self.blocking = getattr(tag, 'blocking', False)
 
     def __call__(self, event = ''):
-        tag_list = set([tag.strip() for tag in p9_read('/client/sel/tags')[0].split('+')])
+        tag_list = read_client_tags()
+        if tag_list is None:
+            return
         tag = self.__tag
         if callable(tag):
             tag = tag()
         tag = real_tag_name(tag)
-        tag_list.add(tag)
-        tag_list = '+'.join(tag_list)
-        logger.debug('%s: event[%s], tag[%s], tag_list[%s]' % (self.__class__.__name__, event, tag, tag_list))
-        p9_write('/client/sel/tags', tag_list)
+        if tag not in tag_list:
+            tag_list.append(tag)
+        logger.debug('%s: event[%s], tag[%s], tag_list[%s]', self.__class__.__name__, event, tag, tag_list)
+        write_client_tags(tag_list)
 
 class RemoveTag(object):
     """remove tag from current client."""
     def __init__(self, tag = None):
         self.__tag = tag
+        self.blocking = getattr(tag, 'blocking', False)
 
     def __call__(self, event = ''):
-        tag_list = set([tag.strip() for tag in p9_read('/client/sel/tags')[0].split('+')])
+        tag_list = read_client_tags()
+        if tag_list is None:
+            return
         tag = self.__tag
         if callable(tag):
             tag = tag()
-        tag_list.discard(tag)
-        tag_list = '+'.join(tag_list)
-        logger.debug('%s: event[%s], tag[%s], tag_list[%s]' % (self.__class__.__name__, event, tag, tag_list))
-        p9_write('/client/sel/tags', tag_list)
+        tag_list = [t for t in tag_list if t != tag]
+        logger.debug('%s: event[%s], tag[%s], tag_list[%s]', self.__class__.__name__, event, tag, tag_list)
+        write_client_tags(tag_list)
 
 class TagCreate(object):
     """add left bar entry on tag creation."""
@@ -178,7 +187,7 @@ class TagCreate(object):
         tag = event.strip().split()[-1]
         if tag and tag != 'NULL':
             tag = real_tag_name(tag)
-            logger.debug('tag_create: event[%s], tag[%s]' % (event, tag))
+            logger.debug('tag_create: event[%s], tag[%s]', event, tag)
             p9_create('/lbar/%s' % real_tag_name(tag), '%s %s' % (BAR_NORMAL_COLORS, display_tag_name(tag)))
 
 class TagDestroy(object):
@@ -187,7 +196,7 @@ class TagDestroy(object):
         tag = event.strip().split()[-1]
         if tag:
             tag = real_tag_name(tag)
-            logger.debug('tag_destroy: event[%s], tag[%s]' % (event, tag))
+            logger.debug('tag_destroy: event[%s], tag[%s]', event, tag)
             p9_remove('/lbar/%s' % tag)
 
 class TagFocus(object):
@@ -196,7 +205,7 @@ class TagFocus(object):
         tag = event.strip().split()[-1]
         if tag and tag != 'NULL':
             tag = real_tag_name(tag)
-            logger.debug('tag_focus: event[%s], tag[%s]' % (event, tag))
+            logger.debug('tag_focus: event[%s], tag[%s]', event, tag)
             p9_write('/lbar/%s' % real_tag_name(tag), '%s %s' % (BAR_FOCUS_COLORS, display_tag_name(tag)))
 
 class TagUnfocus(object):
@@ -205,7 +214,7 @@ class TagUnfocus(object):
         tag = event.strip().split()[-1]
         if tag and tag != 'NULL':
             tag = real_tag_name(tag)
-            logger.debug('tag_unfocus: event[%s], tag[%s]' % (event, tag))
+            logger.debug('tag_unfocus: event[%s], tag[%s]', event, tag)
             p9_write('/lbar/%s' % real_tag_name(tag), '%s %s' % (BAR_NORMAL_COLORS, display_tag_name(tag)))
 
 class TagUrgent(object):
@@ -214,7 +223,7 @@ class TagUrgent(object):
         tag = event.strip().split()[-1]
         if tag and tag != 'NULL':
             tag = real_tag_name(tag)
-            logger.debug('tag_urgent: event[%s], tag[%s]' % (event, tag))
+            logger.debug('tag_urgent: event[%s], tag[%s]', event, tag)
             p9_write('/lbar/%s' % real_tag_name(tag), '*' + display_tag_name(tag))
 
 class TagNotUrgent(object):
@@ -223,7 +232,7 @@ class TagNotUrgent(object):
         tag = event.strip().split()[-1]
         if tag and tag != 'NULL':
             tag = real_tag_name(tag)
-            logger.debug('tag_not_urgent: event[%s], tag[%s]' % (event, tag))
+            logger.debug('tag_not_urgent: event[%s], tag[%s]', event, tag)
             p9_write('/lbar/%s' % real_tag_name(tag), display_tag_name(tag))
 
 # ---------------------------------------------------------------------------
@@ -252,7 +261,7 @@ class Select(DirectionNormalizer):
         direction = self.__direction
         if not direction:
             direction = self.normalize(event)
-        logger.debug('select: direction[%s]' % direction)
+        logger.debug('select: direction[%s]', direction)
         p9_write('/tag/sel/ctl', 'select %s' % direction)
 
 class Send(DirectionNormalizer):
@@ -264,7 +273,7 @@ class Send(DirectionNormalizer):
         direction = self.__direction
         if not direction:
             direction = self.normalize(event)
-        logger.debug('send: direction[%s]' % direction)
+        logger.debug('send: direction[%s]', direction)
         p9_write('/tag/sel/ctl', 'send sel %s' % direction)
 
 class DirectionSet(object):
@@ -305,13 +314,13 @@ class SendSet(DirectionSet):
 class Toggle(object):
     """toggle layer managed - floating."""
     def __call__(self, event):
-        logger.debug('toggle: event[%s]' % event)
+        logger.debug('toggle: event[%s]', event)
         p9_write('/tag/sel/ctl', 'select toggle')
 
 class SendToggle(object):
     def __call__(self, event):
         """send current client to mangaged or floating."""
-        logger.debug('send_toggle: event[%s]' % event)
+        logger.debug('send_toggle: event[%s]', event)
         p9_write('/tag/sel/ctl', 'send sel toggle')
 
 # ---------------------------------------------------------------------------
@@ -343,8 +352,8 @@ class TagHistory(object):
                     HISTORY_DELETE = False
                 HISTORY.append(tag)
                 HISTORY_POS = len(HISTORY) - 1
-                logger.debug('history save tag: %s (%d)' % (tag, len(HISTORY)))
-                logger.debug('history pos: %s' % HISTORY_POS)
+                logger.debug('history save tag: %s (%d)', tag, len(HISTORY))
+                logger.debug('history pos: %s', HISTORY_POS)
         else:
             HISTORY_IGNORE_NEXT = False
             HISTORY_DELETE = True
@@ -355,7 +364,7 @@ class HistoryPrev(object):
         if HISTORY_POS > 0:
             HISTORY_POS -= 1
             HISTORY_IGNORE_NEXT = True
-            logger.debug('history prev: %s' % HISTORY[HISTORY_POS])
+            logger.debug('history prev: %s', HISTORY[HISTORY_POS])
             View(HISTORY[HISTORY_POS])()
 
 class HistoryNext(object):
@@ -364,24 +373,28 @@ class HistoryNext(object):
         if HISTORY_POS < len(HISTORY) - 1:
             HISTORY_POS += 1
             HISTORY_IGNORE_NEXT = True
-            logger.debug('history next: %s' % HISTORY[HISTORY_POS])
+            logger.debug('history next: %s', HISTORY[HISTORY_POS])
             View(HISTORY[HISTORY_POS])()
 
 # ---------------------------------------------------------------------------
 
 class Execute(object):
-    """execute cmd. if cmd is callable, first call cmd to get application path."""
+    """
+    execute cmd. if cmd is callable, first call cmd to get application path.
+    the application is started by the launcher helper (see utils/launcher.py).
+    """
     def __init__(self, cmd):
         self.__cmd = cmd
+        self.blocking = getattr(cmd, 'blocking', False)
 
     def __call__(self, event):
         cmd = self.__cmd
         if callable(cmd):
             cmd = cmd()
         if cmd and len(cmd) > 0:
-            logger.debug('execute: event[%s], cmd[%s]' % (event, cmd))
+            logger.debug('execute: event[%s], cmd[%s]', event, cmd)
             try:
-                subprocess.Popen(cmd.split())
+                launch(cmd.split())
             except Exception, e:
                 logger.exception(e)
 
@@ -401,18 +414,55 @@ class ColMode(object):
     """set column mode (default, max, stacked)."""
     def __init__(self, mode = 'default'):
         self.__mode = mode
+        self.blocking = getattr(mode, 'blocking', False)
 
     def __call__(self, event):
         mode = self.__mode
         if callable(mode):
             mode = mode()
         if mode:
-            logger.debug('colmode: event[%s], mode[%s]' % (event, mode))
+            logger.debug('colmode: event[%s], mode[%s]', event, mode)
             p9_write('/tag/sel/ctl', 'colmode sel %s' % mode)
 
 # ---------------------------------------------------------------------------
 
 DMENU_PATH = 'dmenu'
+# lines per write() to dmenu, and so the most lines held at once
+DMENU_CHUNK = 256
+
+def feed_lines(pipe, items, chunk = DMENU_CHUNK):
+    """
+    write items to pipe, one per line and 'chunk' lines per write(), and
+    close it. items are taken only as fast as the reader drains the pipe.
+    stops quietly if the reader went away. return the number of lines written.
+    """
+    written = 0
+    buf = []
+    try:
+        try:
+            for item in items:
+                buf.append(item + '\n')
+                if len(buf) >= chunk:
+                    pipe.write(''.join(buf))
+                    written += len(buf)
+                    buf = []
+            if buf:
+                pipe.write(''.join(buf))
+                written += len(buf)
+            pipe.flush()
+        except IOError, e:
+            if e.errno != errno.EPIPE:
+                raise
+            logger.debug('feed_lines: reader closed after %d lines', written)
+    finally:
+        if hasattr(items, 'close'):
+            items.close()
+        try:
+            pipe.close()
+        except IOError:
+            pass
+    return written
+
 class DMenu(object):
     """
     use dmenu to get an item from a list.
@@ -420,7 +470,12 @@ class DMenu(object):
     the list must be given as callable object which returns an python generator
     or as list.
     (see application_generator and tag_generator)
+
+    the items are streamed to dmenu from a thread while it runs, so the
+    generator never has to build the whole list.
     """
+    blocking = True
+
     def __init__(self, generator, prompt = None, bottom = True, dmenupath = DMENU_PATH):
         self.__generator = generator
         self.__prompt = prompt
@@ -444,13 +499,15 @@ class DMenu(object):
             items = self.__generator
             if callable(items):
                 items = items()
-            proc.stdin.writelines([l + '\n' for l in items])
-            proc.stdin.flush()
-            proc.stdin.close()
-            proc.wait()
+            feeder = threading.Thread(target = self.__feed, args = (proc.stdin, items))
+            feeder.setDaemon(True)
+            feeder.start()
             sel = proc.stdout.readline().strip()
             proc.stdout.close()
-            logger.debug('dmenu: return[%s]' % sel)
+            proc.wait()
+            logger.debug('dmenu: return[%s]', sel)
+            if sel and hasattr(self.__generator, 'selected'):
+                self.__generator.selected(sel)
             return sel
         except Exception, e:
             logger.exception(e)
@@ -465,6 +522,12 @@ class DMenu(object):
                 pass
         return ''
 
+    def __feed(self, pipe, items):
+        try:
+            feed_lines(pipe, items)
+        except Exception, e:
+            logger.exception(e)
+
 WMII9PATH = 'wmii9menu'
 class WMII9Menu(object):
     """
@@ -474,6 +537,8 @@ class WMII9Menu(object):
     or as list.
     (see application_generator and tag_generator)
     """
+    blocking = True
+
     def __init__(self, generator, wmii9path = WMII9PATH):
         self.__generator = generator
         self.__wmii9path = wmii9path
@@ -496,7 +561,7 @@ class WMII9Menu(object):
             proc.wait()
             sel = proc.stdout.readline().strip()
             proc.stdout.close()
-            logger.debug('wmii9menu: return[%s]' % sel)
+            logger.debug('wmii9menu: return[%s]', sel)
             return sel
         except Exception, e:
             logger.exception(e)
@@ -505,30 +570,42 @@ class WMII9Menu(object):
 # ---------------------------------------------------------------------------
 
 class ApplicationGenerator(object):
+    """
+    generate the applications available in $PATH, the most launched first.
+
+    the list comes from an AppIndex on disk, which is refreshed in the
+    background on creation and on every call. only the first call of a
+    session without an index file waits for $PATH to be listed.
+    """
+    def __init__(self, index = None):
+        self.__index = index or AppIndex()
+        self.__index.refresh_async()
+
     def __call__(self):
         """generate list of applications available in $PATH"""
-        apps = set()
-        validpaths = [path for path in os.environ.get('PATH').split(':') if os.path.exists(path)]
-        for p in validpaths:
-            for f in os.listdir(p):
-                fullname = os.path.join(p, f)
-                if os.path.isfile(fullname) and os.access(fullname, os.X_OK):
-                    apps.add(f)
-
-        for f in sorted(apps):
+        refresh = self.__index.refresh_async()
+        if not self.__index.dirs:
+            refresh.join()
+        for f in self.__index.apps():
             yield f
 
+    def selected(self, cmd):
+        """called by DMenu with the chosen command"""
+        self.__index.launched(cmd)
+
 class TagGenerator(object):
     def __init__(self, sort = False):
         self.__sort = sort
 
     def __call__(self):
         """generate list of available tags"""
-        ignore = ['sel/']
-        avail_views = [display_tag_name(l.rstrip('/')) for l in p9_ls('/tag') if l not in ignore]
+        if not self.__sort:
+            for tag in all_views():
+                yield display_tag_name(tag)
+            return
 
-        if self.__sort:
-            avail_views.sort()
+        avail_views = [display_tag_name(tag) for tag in all_views()]
+        avail_views.sort()
 
         for tag in avail_views:
             yield tag
@@ -544,9 +621,10 @@ class Call(object):
     def __init__(self, event_source, event_map):
         self.__event_source = event_source
         self.__event_map = event_map
+        self.blocking = getattr(event_source, 'blocking', False)
 
     def __call__(self, event):
-        logger.debug('call: event[%s]' % event)
+        logger.debug('call: event[%s]', event)
         ev = self.__event_map.get(self.__event_source(), None)
         if ev:
             ev(event)
@@ -580,6 +658,6 @@ class SecondColumnHack(object):
         if len(index) == 2:
             if index[0][0] == index[1][0] == '1':
                 print 'send %s right' % client_id
-                logger.debug('move 2nd client %s to 2nd column' % (client_id))
+                logger.debug('move 2nd client %s to 2nd column', client_id)
                 p9_write('/tag/sel/ctl', 'send %s right' % client_id)
 
@@ -0,0 +1,305 @@
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+start applications from a small helper process.
+
+forking wmiirc for every application copies the page tables of the whole
+process, and nobody waited for the children. the helper is forked once,
+early while wmiirc is still small, reads commands from a pipe, starts them
+with posix_spawnp() (vfork and exec with glibc) and reaps them.
+
+    start_launcher()
+    launch(['xterm', '-e', 'top'])  # a write() to the pipe
+    stop_launcher()
+
+the applications get the environment and working directory wmiirc had
+when the helper was started, and only stdin, stdout and stderr of its
+file descriptors.
+
+only start_launcher() forks. if the helper dies, or launch() is called
+before start_launcher(), wmiirc already runs threads, so the new helper is
+this file run as a program with posix_spawnp():
+
+    python launcher.py <fd of the command pipe>
+"""
+
+import os
+import sys
+import fcntl
+import errno
+import select
+import logging
+import threading
+
+logger = logging.getLogger('utils.launcher')
+
+__all__ = ['start_launcher', 'stop_launcher', 'launch', 'launcher_stats']
+
+# seconds between looking for exited children while some are running
+REAP_INTERVAL = 1.0
+
+def _posix_spawnp():
+    """
+    return a function starting argv with posix_spawnp(3), which returns
+    the pid. None if libc or ctypes aren't available.
+    """
+    try:
+        import ctypes, ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno = True)
+        spawnp = libc.posix_spawnp
+        spawnp.argtypes = [ctypes.POINTER(ctypes.c_int), ctypes.c_char_p, ctypes.c_void_p,
+                           ctypes.c_void_p, ctypes.POINTER(ctypes.c_char_p), ctypes.c_void_p]
+        environ = ctypes.c_void_p.in_dll(libc, 'environ')
+
+        def spawn(argv):
+            pid = ctypes.c_int()
+            args = (ctypes.c_char_p * (len(argv) + 1))(*argv)
+            ret = spawnp(ctypes.byref(pid), argv[0], None, None, args, environ)
+            if ret != 0:
+                raise OSError(ret, os.strerror(ret))
+            return pid.value
+        return spawn
+    except Exception, e:
+        logger.warn('no posix_spawnp, using fork and exec: %s', e)
+        return None
+
+def _fork_exec(argv):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.execvp(argv[0], argv)
+        finally:
+            os._exit(127)
+    return pid
+
+def _cloexec(fd):
+    try:
+        flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+        fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+    except (IOError, OSError):
+        pass
+
+def _open_fds():
+    try:
+        return [int(fd) for fd in os.listdir('/proc/self/fd')]
+    except OSError:
+        return range(256)
+
+
+class Launcher(object):
+    """
+    the helper process and the pipe to it. a command is sent as its length
+    and the arguments separated by NUL bytes.
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.pid = None
+        self.pipe = None
+        self.launches = 0
+        self.restarts = 0
+
+    def start(self):
+        """
+        fork the helper, if it isn't running. call it before any thread
+        is started, a thread could hold a lock the helper needs.
+        """
+        self.__lock.acquire()
+        try:
+            if not self.pid:
+                self.__fork()
+        finally:
+            self.__lock.release()
+
+    def __fork(self):
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                try:
+                    os.close(wfd)
+                    Helper(rfd).run()
+                except:
+                    logger.exception('launcher helper failed')
+            finally:
+                os._exit(0)
+        os.close(rfd)
+        _cloexec(wfd)
+        self.pid = pid
+        self.pipe = wfd
+        logger.debug('launcher helper forked: pid[%d]', pid)
+
+    def __spawn(self):
+        """start this file as helper program, safe with running threads"""
+        rfd, wfd = os.pipe()
+        _cloexec(wfd)
+        try:
+            argv = [sys.executable, os.path.splitext(os.path.abspath(__file__))[0] + '.py', str(rfd)]
+            pid = (_posix_spawnp() or _fork_exec)(argv)
+        finally:
+            os.close(rfd)
+        self.pid = pid
+        self.pipe = wfd
+        logger.debug('launcher helper spawned: pid[%d]', pid)
+
+    def stop(self):
+        """close the pipe and wait for the helper to exit"""
+        self.__lock.acquire()
+        try:
+            self.__stop()
+        finally:
+            self.__lock.release()
+
+    def __stop(self):
+        pid, pipe = self.pid, self.pipe
+        self.pid = self.pipe = None
+        if pipe is not None:
+            os.close(pipe)
+        if pid:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+    def launch(self, argv):
+        """start argv, return as soon as the helper got it"""
+        data = '\0'.join(argv)
+        data = '%d\n%s' % (len(data), data)
+        self.__lock.acquire()
+        try:
+            if not self.pid:
+                self.__spawn()
+            try:
+                self.__write(data)
+            except OSError, e:
+                if e.errno != errno.EPIPE:
+                    raise
+                logger.warn('launcher helper died, restarting')
+                self.__stop()
+                self.__spawn()
+                self.restarts += 1
+                self.__write(data)
+            self.launches += 1
+        finally:
+            self.__lock.release()
+
+    def __write(self, data):
+        while data:
+            data = data[os.write(self.pipe, data):]
+
+    def stats(self):
+        return dict(launches = self.launches, restarts = self.restarts)
+
+
+class Helper(object):
+    """the loop of the helper process: read commands, start them, reap them"""
+    def __init__(self, fd):
+        self.fd = fd
+        self.buffer = ''
+        self.children = 0
+        self.spawn = _posix_spawnp() or _fork_exec
+        # nothing of wmiirc is kept open here, not even the log file. the
+        # applications get stdin, stdout and stderr only
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+        for fd in _open_fds():
+            if fd > 2 and fd != self.fd:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        _cloexec(self.fd)
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(name)s: %(levelname)s: %(message)s'))
+        root.addHandler(handler)
+
+    def run(self):
+        while True:
+            timeout = self.children and REAP_INTERVAL or None
+            try:
+                readable = select.select([self.fd], [], [], timeout)[0]
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                readable = []
+            if readable:
+                data = os.read(self.fd, 65536)
+                if not data:
+                    break
+                self.buffer += data
+                for argv in self.commands():
+                    self.launch(argv)
+            self.reap()
+        logger.debug('launcher helper: pipe closed')
+
+    def commands(self):
+        """the complete commands in the buffer"""
+        while '\n' in self.buffer:
+            size, data = self.buffer.split('\n', 1)
+            size = int(size)
+            if len(data) < size:
+                break
+            self.buffer = data[size:]
+            yield data[:size].split('\0')
+
+    def launch(self, argv):
+        try:
+            pid = self.spawn(argv)
+            self.children += 1
+            logger.debug('launcher: pid[%d], cmd%s', pid, argv)
+        except OSError, e:
+            logger.warn('launcher: can\'t start %s: %s', argv, e)
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    self.children = 0
+                break
+            if not pid:
+                break
+            self.children -= 1
+
+
+LAUNCHER = Launcher()
+
+def start_launcher():
+    """fork the helper now, while the process is small"""
+    LAUNCHER.start()
+
+def stop_launcher():
+    LAUNCHER.stop()
+
+def launch(argv):
+    """start argv from the helper, which is started first if needed"""
+    LAUNCHER.launch(argv)
+
+def launcher_stats():
+    return LAUNCHER.stats()
+
+
+if __name__ == '__main__':
+    Helper(int(sys.argv[1])).run()
@@ -0,0 +1,222 @@
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+logging without file i/o in the logging thread.
+
+QueueHandler puts the records into a bounded queue, a thread passes them
+on to the real handler and flushes it once per batch. the thread waits
+'delay' seconds after the first record of a batch, so a burst of records
+doesn't wake it for every single one. a full queue drops
+records instead of blocking, the number dropped is logged later.
+RotatingLogFile is a size-rotated log file which writes unicode as utf-8
+and survives messages mixing unicode and undecodable strings.
+
+    start_logging('~/.wmii3.log', logging.DEBUG)
+
+nothing here imports the utils package, so wmiirc can set up logging
+before utils connects to wmii.
+"""
+
+import os
+import time
+import Queue
+import logging
+import logging.handlers
+import threading
+
+__all__ = ['QueueHandler', 'RotatingLogFile', 'start_logging']
+
+FORMAT = '%(asctime)s %(levelname)s: %(name)s: %(message)s'
+
+def message(record):
+    """record.getMessage(), with unicode arguments utf-8 encoded if they don't mix"""
+    try:
+        return record.getMessage()
+    except UnicodeError:
+        encode = lambda s: isinstance(s, unicode) and s.encode('utf-8', 'replace') or s
+        args = record.args
+        if isinstance(args, tuple):
+            args = tuple([encode(a) for a in args])
+        msg = encode(record.msg)
+        return args and msg % args or msg
+
+
+class QueueHandler(logging.Handler):
+    """
+    pass records to 'target' from a thread. the message is merged with its
+    arguments here, so later changes of the arguments don't show up, the
+    formatting and writing happens in the thread.
+
+    with start = False the thread is started by start(), records are
+    queued until then. wmiirc forks the launcher helper in between.
+    """
+    def __init__(self, target, maxsize = 10000, batch = 1024, delay = 0.05, start = True):
+        logging.Handler.__init__(self)
+        self.target = target
+        self.queue = Queue.Queue(maxsize)
+        self.batch = batch
+        self.delay = delay
+        self.pid = os.getpid()
+        self.__child = None
+        self.queued = 0
+        self.dropped = 0
+        self.__reported = 0
+        self.__formatter = logging.Formatter()
+        self.__writer = None
+        if start:
+            self.start()
+
+    def start(self):
+        """start the writer thread"""
+        if self.__writer is None:
+            self.__writer = threading.Thread(target = self.__write, name = 'LogWriter')
+            self.__writer.setDaemon(True)
+            self.__writer.start()
+
+    def __writing(self):
+        return os.getpid() == self.pid and self.__writer is not None and self.__writer.isAlive()
+
+    def handle(self, record):
+        # the queue has a lock of its own
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        pid = os.getpid()
+        if pid != self.pid:
+            self.__forked(pid, record)
+            return
+        try:
+            record.msg = message(record)
+            record.args = None
+            if record.exc_info:
+                record.exc_text = self.__formatter.formatException(record.exc_info)
+                record.exc_info = None
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+            self.queued += 1
+        except Queue.Full:
+            self.dropped += 1
+
+    def __forked(self, pid, record):
+        """a forked child has no writer thread, it writes directly"""
+        if self.__child != pid:
+            # the lock could have been held by a thread of the parent
+            self.__child = pid
+            self.target.createLock()
+        self.target.handle(record)
+        self.target.flush()
+
+    def __write(self):
+        while True:
+            records = [self.queue.get()]
+            if records[0] is not None and self.queue.qsize() < self.batch:
+                time.sleep(self.delay)
+            try:
+                while len(records) < self.batch:
+                    records.append(self.queue.get_nowait())
+            except Queue.Empty:
+                pass
+            for record in records:
+                if record is None:
+                    break
+                self.target.handle(record)
+            if self.dropped != self.__reported:
+                dropped, self.__reported = self.dropped - self.__reported, self.dropped
+                self.target.handle(logging.LogRecord('utils.logqueue', logging.WARN, __file__, 0,
+                                                     'queue full, %d records dropped',
+                                                     (dropped, ), None))
+            self.target.flush()
+            for record in records:
+                self.queue.task_done()
+            if None in records:
+                break
+
+    def flush(self):
+        """wait until the queued records are written"""
+        if self.__writing() and threading.currentThread() is not self.__writer:
+            self.queue.join()
+
+    def close(self):
+        if self.__writing():
+            self.queue.put(None)
+            self.__writer.join()
+        self.target.close()
+        logging.Handler.close(self)
+
+    def stats(self):
+        return dict(queued = self.queued, dropped = self.dropped, depth = self.queue.qsize())
+
+
+class RotatingLogFile(logging.handlers.RotatingFileHandler):
+    """
+    a log file renamed to filename.1 (up to filename.'backups') when it
+    would grow beyond 'max_bytes'. records aren't flushed one by one,
+    QueueHandler flushes after each batch.
+    """
+    def __init__(self, filename, max_bytes = 1 << 20, backups = 3):
+        logging.handlers.RotatingFileHandler.__init__(self, filename, 'a', max_bytes, backups)
+        self.stream.seek(0, 2)
+
+    def format(self, record):
+        try:
+            msg = logging.handlers.RotatingFileHandler.format(self, record)
+        except UnicodeError:
+            record.msg = message(record)
+            record.args = None
+            msg = logging.handlers.RotatingFileHandler.format(self, record)
+        if isinstance(msg, unicode):
+            msg = msg.encode('utf-8', 'replace')
+        return msg
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + '\n'
+            if self.maxBytes > 0 and self.stream.tell() + len(msg) > self.maxBytes:
+                self.doRollover()
+            self.stream.write(msg)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+
+
+def start_logging(filename, level = logging.WARN, format = FORMAT, max_bytes = 1 << 20, backups = 3,
+                  start = True):
+    """
+    log to a new RotatingLogFile 'filename' through a QueueHandler, the
+    log of the last run is kept as filename.1. return the QueueHandler,
+    its thread isn't started yet with start = False.
+    """
+    filename = os.path.expanduser(filename)
+    file = RotatingLogFile(filename, max_bytes, backups)
+    if file.stream.tell() > 0:
+        file.doRollover()
+    file.setFormatter(logging.Formatter(format))
+    handler = QueueHandler(file, start = start)
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
@@ -0,0 +1,203 @@
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+minimal mpd client speaking the text protocol, with the 'idle' command.
+
+    mpd = MPDClient()               # MPD_HOST, MPD_PORT or localhost:6600
+    mpd.connect()
+    mpd.status()['state']
+    mpd.idle('player')              # blocks until the player changed
+
+MPDWatcher keeps a connection in a thread and reports every change of the
+player, so nothing has to poll mpd.
+"""
+
+import os
+import socket
+import logging
+import threading
+
+logger = logging.getLogger('utils.mpd')
+
+__all__ = ['MPDError', 'MPDClient', 'MPDWatcher']
+
+
+class MPDError(Exception):
+    """an ACK from mpd or a broken connection"""
+
+
+class MPDClient(object):
+    def __init__(self, host = None, port = None, password = None, timeout = 10.0):
+        """
+        host, port and password default to MPD_HOST ('[password@]host') and
+        MPD_PORT. a host starting with '/' is a unix socket.
+        """
+        host = host or os.environ.get('MPD_HOST', 'localhost')
+        if '@' in host:
+            secret, host = host.split('@', 1)
+            if password is None:
+                password = secret
+        self.host = host
+        self.port = int(port or os.environ.get('MPD_PORT', 6600))
+        self.password = password
+        self.timeout = timeout
+        self.version = None
+        self.sock = None
+        self.file = None
+
+    def connect(self):
+        if self.host.startswith('/'):
+            sock = socket.socket(socket.AF_UNIX)
+            address = self.host
+        else:
+            sock = socket.socket(socket.AF_INET)
+            address = (self.host, self.port)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+        except socket.error, e:
+            sock.close()
+            raise MPDError('connect to %s failed: %s' % (address, e))
+        self.sock = sock
+        self.file = sock.makefile('rb')
+        hello = self.__readline()
+        if not hello.startswith('OK MPD '):
+            self.close()
+            raise MPDError('no mpd: %r' % hello)
+        self.version = hello[7:]
+        if self.password:
+            self.command('password', self.password)
+
+    def close(self):
+        sock, self.sock = self.sock, None
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            sock.close()
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def __readline(self):
+        try:
+            line = self.file.readline()
+        except (socket.error, AttributeError, ValueError), e:
+            raise MPDError('connection lost: %s' % e)
+        if not line.endswith('\n'):
+            raise MPDError('connection lost')
+        return line[:-1]
+
+    def __send(self, line):
+        if not self.sock:
+            raise MPDError('not connected')
+        try:
+            self.sock.sendall(line + '\n')
+        except socket.error, e:
+            raise MPDError('connection lost: %s' % e)
+
+    def __quote(self, arg):
+        return '"%s"' % str(arg).replace('\\', '\\\\').replace('"', '\\"')
+
+    def command(self, name, *args):
+        """send a command, return its reply as list of (key, value)"""
+        self.__send(' '.join([name] + [self.__quote(a) for a in args]))
+        return self.__reply()
+
+    def __reply(self):
+        ret = []
+        while True:
+            line = self.__readline()
+            if line == 'OK':
+                return ret
+            if line.startswith('ACK '):
+                raise MPDError(line)
+            key, sep, value = line.partition(': ')
+            ret.append((key, value))
+
+    def status(self):
+        return dict(self.command('status'))
+
+    def currentsong(self):
+        return dict(self.command('currentsong'))
+
+    def idle(self, *subsystems):
+        """
+        wait until one of subsystems (default any) changed, return the
+        list of changed ones. blocks without a timeout, close() from
+        another thread ends it with an MPDError.
+        """
+        self.__send(' '.join(('idle', ) + subsystems))
+        self.sock.settimeout(None)
+        try:
+            return [value for key, value in self.__reply() if key == 'changed']
+        finally:
+            if self.sock:
+                self.sock.settimeout(self.timeout)
+
+
+class MPDWatcher(threading.Thread):
+    """
+    keep a connection to mpd and call changed(status, song) on connect and
+    after every change of the player, changed(None, None) when the
+    connection is lost. a failed connection is retried after 'backoff'
+    seconds, doubled after every failure up to 'max_backoff'.
+    """
+    def __init__(self, changed, client = None, backoff = 1.0, max_backoff = 60.0):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.changed = changed
+        self.client = client or MPDClient()
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connects = 0
+        self.__running = True
+        self.__stopped = threading.Event()
+
+    def stop(self):
+        self.__running = False
+        self.__stopped.set()
+        self.client.close()
+
+    def run(self):
+        backoff = self.backoff
+        while self.__running:
+            try:
+                self.client.connect()
+                self.connects += 1
+                backoff = self.backoff
+                while self.__running:
+                    self.changed(self.client.status(), self.client.currentsong())
+                    self.client.idle('player')
+            except MPDError, e:
+                logger.debug('mpd: %s', e)
+            except Exception, e:
+                logger.exception(e)
+            self.client.close()
+            if not self.__running:
+                break
+            self.changed(None, None)
+            self.__stopped.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
@@ -18,6 +18,8 @@
 # vim:syntax=python:sw=4:ts=4:expandtab
 
 import os
+import time
+import errno
 import logging
 import socket
 import thread
@@ -25,32 +27,165 @@ import P9
 
 logger = logging.getLogger('utils.p9_sock')
 
-__all__ = ['p9_write', 'p9_read', 'p9_create', 'p9_remove', 'p9_ls', 'p9_process', 'p9_available']
+__all__ = ['p9_write', 'p9_read', 'p9_create', 'p9_remove', 'p9_ls', 'p9_process', 'p9_available',
+           'p9_write_many', 'p9_open', 'p9_subscribe']
 
-def lock(func):
+def fid(func):
+    """
+    call func with a fresh fid, log and swallow its errors. if it failed
+    on a stale cached fid, try once more with the walk cache invalidated.
+    """
     def wrapper(self, *args, **kwargs):
-        self.lock.acquire()
+        fd = self.newfid()
         ret = None
         try:
-            ret = func(self, self.counter, *args, **kwargs)
+            try:
+                ret = func(self, fd, *args, **kwargs)
+            except StaleFid, e:
+                logger.debug('retry after %s', e)
+                ret = func(self, fd, *args, **kwargs)
         except Exception, e:
             logger.exception(e)
-            try:
-                _close(self.counter)
-            except:
-                pass
-        self.counter += 1
-        self.lock.release()
+        self.freefid(fd)
         return ret
     return wrapper
 
+def lines(value):
+    if type(value) not in (type([]), type(()), type(set())):
+        value = [value]
+    return '\n'.join(value)
+
 class P9Exception(Exception):
     pass
 
+class StaleFid(P9Exception):
+    pass
+
+# placeholder for a walk in a burst, resolved against the walk cache
+WALK = 'walk'
+
+class WalkCache(object):
+    """
+    LRU cache of fids walked to frequently used paths. the cached fids are
+    never opened, they are only cloned by a Twalk without names.
+
+    paths through 'sel' aren't cached, wmii resolves it when walking, so a
+    cached fid would stay on the client or tag selected back then.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.fids = {}
+        self.lru = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, path):
+        fd = self.fids.get(path)
+        if fd is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.lru.remove(path)
+            self.lru.append(path)
+        return fd
+
+    def add(self, path, fd):
+        """cache fd for path, return the fids pushed out of the cache"""
+        self.fids[path] = fd
+        self.lru.append(path)
+        evicted = []
+        while len(self.lru) > self.size:
+            evicted.append(self.fids.pop(self.lru.pop(0)))
+            self.evictions += 1
+        return evicted
+
+    def invalidate(self, path):
+        fd = self.fids.pop(path, None)
+        if fd is not None:
+            self.lru.remove(path)
+            self.invalidations += 1
+        return fd
+
+    def stats(self):
+        return dict(hits = self.hits, misses = self.misses, evictions = self.evictions,
+                    invalidations = self.invalidations, cached = len(self.lru))
+
+class P9File(object):
+    """
+    handle for a file which is written over and over again, like the
+    /rbar entries of the statusbar.
+
+    if persistent, the file is kept open and every write replaces its
+    content with a single Twrite at offset 0 (wmii cuts its files at the
+    end of the last write). if the fid stops working, eg. because the file
+    was removed and created again, it is reopened transparently.
+    otherwise every write is a plain p9_write, which is what wmii 3.6 bar
+    files need, as they are only redrawn when the fid is clunked.
+    """
+    def __init__(self, client, path, persistent = False):
+        self.client = client
+        self.path = path
+        self.persistent = persistent
+        self.fd = None
+        self.lock = thread.allocate_lock()
+
+    def __write(self, value):
+        if self.fd is None:
+            self.fd = self.client.open(self.path, P9.OWRITE|P9.OTRUNC)
+        self.client.pwrite(self.fd, lines(value) + '\n')
+
+    def __close(self):
+        fd, self.fd = self.fd, None
+        if fd is not None:
+            try:
+                self.client.clunk(fd)
+            except P9Exception:
+                pass
+
+    def write(self, value):
+        if not self.persistent:
+            return self.client.p9_write(self.path, value)
+        self.lock.acquire()
+        try:
+            try:
+                try:
+                    self.__write(value)
+                except P9Exception, e:
+                    logger.debug('reopen %s: %s', self.path, e)
+                    self.__close()
+                    self.__write(value)
+            except Exception, e:
+                logger.exception(e)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.__close()
+        finally:
+            self.lock.release()
+
 class P9Client(object):
+    """
+    9P client for the wmii file system.
+
+    every operation (walk, open, read/write, clunk) is sent as one pipelined
+    burst over the tag multiplexed P9.RpcClient, so it costs a single round
+    trip and several threads can share the connection.
+
+    walks start from a cached fid of the target path if there is one, so
+    hot files like /ctl or /rbar/<plugin> are resolved by the server only
+    once. fids are recycled through a free list.
+    """
     ROOT = 23
+    MSIZE = P9.Marshal9P.MAXSIZE
+    CACHE_SIZE = 64
     def __init__(self):
         self.connected = False
+        self.error = None
         sock_path = os.environ.get('WMII_ADDRESS', '').split('!')
         try:
             if sock_path[0] == 'unix':
@@ -63,49 +198,137 @@ class P9Client(object):
                 return
         except socket.error, e:
             logger.exception(e)
-            sys.exit(-1)
+            self.error = e
+            return
 
+        self.__sock = sock
         self.__rpc = P9.RpcClient(P9.Sock(sock))
 
-        maxbuf, vers = self.__rpc.version(16 * 1024, P9.version)
+        # ask for the largest message we handle, the server answers with
+        # the largest it allows. every read and write is sized by that.
+        maxbuf, vers = self.__rpc.version(self.MSIZE, P9.version)
         if vers != P9.version:
-            raise Error('version mismatch: %r' % vers)
+            raise P9Exception('version mismatch: %r' % vers)
+        self.msize = min(maxbuf, self.MSIZE)
+        self.iounit = self.msize - P9.IOHDRSZ
 
         self.__rpc.attach(self.ROOT, P9.nofid, '', '')
         self.connected = True
         self.counter = 42
+        self.free = []
+        self.stale = []
+        self.cache = WalkCache(self.CACHE_SIZE)
         self.lock = thread.allocate_lock()
 
+    def __newfid(self):
+        if self.free:
+            return self.free.pop()
+        self.counter += 1
+        return self.counter - 1
+
+    def newfid(self):
+        self.lock.acquire()
+        fd = self.__newfid()
+        self.lock.release()
+        return fd
+
+    def freefid(self, *fids):
+        self.lock.acquire()
+        self.free.extend(fids)
+        self.lock.release()
+
     def __walk(self, fd, path):
-        pstr = path
-        root = self.ROOT
-        path = filter(None, path.split('/'))
-        try:
-            w = self.__rpc.walk(root, fd, path)
-        except P9.RpcError, e:
-            raise P9Exception('_walk: %s: %s' % (pstr, e.args[0]))
-        if len(w) < len(path):
-            raise P9Exception('_walk: %s: not found' % pstr)
-        return w
+        """return the Twalk calls for path, called with self.lock held"""
+        names = filter(None, path.split('/'))
+        if not names or 'sel' in names:
+            return [(P9.Twalk, (self.ROOT, fd, names))]
+        cfd = self.cache.get(path)
+        if cfd is not None:
+            return [(P9.Twalk, (cfd, fd, []))]
+        cfd = self.__newfid()
+        self.stale.extend(self.cache.add(path, cfd))
+        return [(P9.Twalk, (self.ROOT, cfd, names)), (P9.Twalk, (cfd, fd, []))]
 
-    def __open(self, fd, mode = 0):
+    def __burst(self, calls):
+        """
+        send all calls as one pipelined burst and wait for every reply.
+        (WALK, fd, path) calls are resolved against the walk cache, a
+        failed walk or clone invalidates the cached path. an error of a
+        later call, like a bad command written to a ctl file, doesn't.
+        raises a P9Exception for the first call that failed.
+        """
+        self.lock.acquire()
         try:
-            t = self.__rpc.open(fd, mode)
-            if not t:
-                raise P9Exception('_open: failed to open')
-        except P9.RpcError, e:
-            raise P9Exception('_open: %s' % e.args[0])
-        return t
+            wire, paths = [], []
+            for call in calls:
+                if call[0] == WALK:
+                    walks = self.__walk(call[1], call[2])
+                    paths.extend([call[2]] * len(walks))
+                else:
+                    walks = [call]
+                    paths.append(None)
+                wire.extend(walks)
+            # the clunks of evicted fids go last, after every clone of them
+            stale, self.stale = self.stale, []
+            wire.extend([(P9.Tclunk, fd) for fd in stale])
+            reqs = self.__rpc.pipeline(wire)
+        finally:
+            self.lock.release()
+
+        ret = []
+        err = None
+        for req, path in zip(reqs, paths):
+            try:
+                vals = self.__rpc.wait(req)
+                if req.type == P9.Twalk and len(vals) < len(req.args[0][2]):
+                    raise P9.RpcError('/%s: not found' % '/'.join(req.args[0][2]))
+            except P9.RpcError, e:
+                vals = None
+                if path is not None:
+                    self.__invalidate(path)
+                if err is None:
+                    err = '_%s: %s' % (P9.cmdName[req.type][1:], e.args[0])
+                    fd, nfd, names = req.type == P9.Twalk and req.args[0] or (None, None, None)
+                    if fd not in (None, self.ROOT) and not names:
+                        err = StaleFid(err)
+            ret.append(vals)
+        for req in reqs[len(paths):]:
+            try:
+                self.__rpc.wait(req)
+            except P9.RpcError:
+                pass
+        if stale:
+            self.freefid(*stale)
+        if isinstance(err, StaleFid):
+            raise err
+        if err:
+            raise P9Exception(err)
+        return ret
+
+    def __invalidate(self, path):
+        self.lock.acquire()
+        fd = self.cache.invalidate(path)
+        if fd is not None:
+            self.stale.append(fd)
+        self.lock.release()
 
-    def __close(self, fd):
+    def __open(self, fd, path, mode = P9.OREAD):
         try:
-            self.__rpc.clunk(fd)
-        except P9.RpcError, e:
-            raise P9Exception('_close: %s' % e.args[0])
+            self.__burst([(WALK, fd, path), (P9.Topen, fd, mode)])
+        except P9Exception:
+            # don't leave a walked fid behind if only the open failed
+            try:
+                self.__burst([(P9.Tclunk, fd)])
+            except P9Exception:
+                pass
+            raise
 
-    def __read(self, fd, length):
+    def __write(self, fd, buf):
+        return [(P9.Twrite, fd, pos, buf[pos:pos + self.iounit])
+                for pos in xrange(0, len(buf), self.iounit)]
+
+    def __read(self, fd, length, pos = 0L):
         try:
-            pos = 0L
             buf = self.__rpc.read(fd, pos, length)
             while len(buf) > 0:
                 pos += len(buf)
@@ -114,101 +337,231 @@ class P9Client(object):
         except P9.RpcError, e:
             raise P9Exception('_read: %s' % e.args[0])
 
-    def __write(self, fd, buf):
+    def __writecalls(self, fd, file, value):
+        return [(WALK, fd, file), (P9.Topen, fd, P9.OWRITE|P9.OTRUNC)] + \
+               self.__write(fd, lines(value) + '\n') + \
+               [(P9.Tclunk, fd)]
+
+    def stats(self):
+        return self.cache.stats()
+
+    def open(self, path, mode = P9.OREAD):
+        """open path on a fresh fid, which must be released with clunk()"""
+        fd = self.newfid()
         try:
-            towrite = len(buf)
-            pos = 0
-            while pos < towrite:
-                pos += self.__rpc.write(fd, pos, buf[pos:pos + 1024])
-        except P9.RpcError, e:
-            raise P9Exception('_write: %s' % e.args[0])
+            try:
+                self.__open(fd, path, mode)
+            except StaleFid, e:
+                logger.debug('retry after %s', e)
+                self.__open(fd, path, mode)
+        except:
+            self.freefid(fd)
+            raise
+        return fd
 
-    def __create(self, fd, name, mode = 1, perm = 0644):
+    def read(self, fd, pos, length):
+        """read up to length bytes at pos from the open fid fd"""
         try:
-            return self.__rpc.create(fd, name, perm, mode)
+            return self.__rpc.read(fd, pos, length)
         except P9.RpcError, e:
-            self._close()
-            raise P9Exception('_create: %s' % e.args[0])
+            raise P9Exception('_read: %s' % e.args[0])
+
+    def readinto(self, fd, buf, pos = 0):
+        """
+        fill the bytearray buf from pos on with the content of the open fid
+        fd at the same offset, until buf is full or the file ends. returns
+        the number of bytes read.
+        """
+        n = pos
+        while n < len(buf):
+            data = self.read(fd, n, min(self.iounit, len(buf) - n))
+            if not data:
+                break
+            buf[n:n + len(data)] = data
+            n += len(data)
+        return n - pos
+
+    def pwrite(self, fd, buf):
+        """write buf to the open fid fd at offset 0"""
+        self.__burst(self.__write(fd, buf))
 
-    def __remove(self, fd):
+    def clunk(self, fd):
         try:
-            self.__rpc.remove(fd)
-        except P9.RpcError, e:
-            raise P9Exception('_remove: %s' % e.args[0])
+            self.__burst([(P9.Tclunk, fd)])
+        finally:
+            self.freefid(fd)
 
-    @lock
-    def p9_write(self, fd, file, value):
-        if type(value) not in (type([]), type(()), type(set())):
-            value = [value]
+    def close(self):
+        """shut the connection down, wakes up every blocked reader"""
+        if not self.connected:
+            return
+        self.connected = False
         try:
-            # TODO: walk on non existent files fail. needed?
-            self.__walk(fd, file)
-        except:
+            self.__sock.shutdown(socket.SHUT_RDWR)
+            self.__sock.close()
+        except socket.error:
             pass
-        self.__open(fd, mode = P9.OWRITE|P9.OTRUNC)
-        self.__write(fd, '\n'.join(value) + '\n')
-        self.__close(fd)
 
-    @lock
+    @fid
+    def p9_write(self, fd, file, value):
+        self.__burst(self.__writecalls(fd, file, value))
+
+    def p9_write_many(self, items):
+        """write all (file, value) pairs in items with a single burst"""
+        calls, fids = [], []
+        for file, value in items:
+            fids.append(self.newfid())
+            calls.extend(self.__writecalls(fids[-1], file, value))
+        try:
+            self.__burst(calls)
+        except Exception, e:
+            logger.exception(e)
+        self.freefid(*fids)
+
+    @fid
     def p9_read(self, fd, file):
-        ret = ''
-        self.__walk(fd, file)
-        self.__open(fd)
-        for buf in self.__read(fd, 4096):
-            ret += buf
-        ret = ret.split('\n')
-        self.__close(fd)
-        return ret
+        # a short read is the end of a wmii file, so files up to one iounit
+        # are read and clunked speculatively within the first burst
+        data = self.__burst([(WALK, fd, file), (P9.Topen, fd, P9.OREAD),
+                             (P9.Tread, fd, 0L, self.iounit), (P9.Tclunk, fd)])[-2]
+        if len(data) == self.iounit:
+            buf = bytearray(4 * self.iounit)
+            buf[:len(data)] = data
+            n = len(data)
+            self.__open(fd, file)
+            try:
+                n += self.readinto(fd, buf, n)
+                while n == len(buf):
+                    buf += bytearray(len(buf))
+                    n += self.readinto(fd, buf, n)
+            finally:
+                self.__burst([(P9.Tclunk, fd)])
+            data = str(buffer(buf, 0, n))
+        return data.split('\n')
 
-    @lock
+    @fid
     def p9_create(self, fd, file, value = None):
-        if type(value) not in (type([]), type(()), type(set())):
-            value = [value]
         plist = file.split('/')
         path, name = '/'.join(plist[:-1]), plist[-1]
-        self.__walk(fd, path)
-        self.__create(fd, name)
-        self.__write(fd, '\n'.join(value))
-        self.__close(fd)
+        self.__burst([(WALK, fd, path), (P9.Tcreate, fd, name, 0644, P9.OWRITE)] +
+                     self.__write(fd, lines(value)) +
+                     [(P9.Tclunk, fd)])
 
-    @lock
+    @fid
     def p9_remove(self, fd, path):
-        self.__walk(fd, path)
-        self.__open(fd)
-        self.__remove(fd)
+        self.__burst([(WALK, fd, path), (P9.Topen, fd, P9.OREAD), (P9.Tremove, fd)])
+        self.__invalidate(path)
 
-    @lock
+    @fid
     def p9_ls(self, fd, path):
         ret = []
-        self.__walk(fd, path)
-        self.__open(fd)
-        for buf in self.__read(fd, 4096):
-            p9 = self.__rpc.msg
-            p9.setBuf(buf)
-            for sz, t, d, q, m, at, mt, l, name, u, g, mod in p9._decStat(0):
-                if m & P9.DIR:
-                    name += '/'
-                ret.append(name)
-        self.__close(fd)
+        self.__open(fd, path)
+        try:
+            p9 = P9.Marshal9P(None)
+            for buf in self.__read(fd, self.iounit):
+                p9.setBuf(buf)
+                for sz, t, d, q, m, at, mt, l, name, u, g, mod in p9._decStat(0):
+                    if m & P9.DIR:
+                        name += '/'
+                    ret.append(name)
+        finally:
+            self.__burst([(P9.Tclunk, fd)])
         return ret
 
-    @lock
-    def p9_process(self, fd, file, func, *args, **kwargs):
-        self.__walk(fd, file)
-        self.__open(fd)
-        obuf = ''
-        cont = True
-        for buf in self.__read(fd, 4096):
-            buf = obuf + buf
-            lnl = buf.rfind('\n')
-            for line in buf[0:lnl].split('\n'):
-                if not func(line.strip(), *args, **kwargs):
-                    cont = False
+class EventStream(object):
+    """
+    line by line subscription to a stream file like /event, on a connection
+    of its own.
+
+    the stream is an iterator over the lines, which can be left and picked
+    up again without losing a line. the iteration ends as soon as wmii is
+    gone, that is the stream or the connection ends or nobody listens on
+    WMII_ADDRESS anymore. a wmiirc must not outlive its wmii, it would
+    connect to the next one and run along with the wmiirc started there.
+    other errors are taken as transient: the connection is reestablished
+    with exponential backoff, after 'retries' failed attempts in a row the
+    iteration ends. lines split over two reads are joined in a reused
+    buffer, all others are sliced straight out of the read data.
+    """
+    GONE = (errno.ECONNREFUSED, errno.ENOENT)
+    def __init__(self, path, retries = 3, backoff = 0.1):
+        self.path = path
+        self.retries = retries
+        self.backoff = backoff
+        self.running = True
+        self.client = None
+        self.fd = None
+        self.offset = 0L
+        self.failed = 0
+        self.chunk = ''
+        self.pos = 0
+        self.partial = bytearray()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while True:
+            nl = self.chunk.find('\n', self.pos)
+            if nl >= 0:
+                if self.partial:
+                    self.partial += buffer(self.chunk, self.pos, nl - self.pos)
+                    line = str(self.partial)
+                    del self.partial[:]
+                else:
+                    line = self.chunk[self.pos:nl]
+                self.pos = nl + 1
+                return line.strip()
+            if self.pos < len(self.chunk):
+                self.partial += buffer(self.chunk, self.pos)
+            self.chunk, self.pos = self.__read(), 0
+
+    def __connect(self):
+        self.client = P9Client()
+        if not self.client.connected:
+            raise self.client.error or \
+                  P9Exception('no connection to %s' % os.environ.get('WMII_ADDRESS'))
+        self.fd = self.client.open(self.path)
+        self.offset = 0L
+        del self.partial[:]
+
+    def __disconnect(self):
+        client, self.client, self.fd = self.client, None, None
+        if client:
+            client.close()
+
+    def __read(self):
+        while self.running:
+            try:
+                if self.fd is None:
+                    self.__connect()
+                buf = self.client.read(self.fd, self.offset, self.client.iounit)
+                if not buf:
+                    raise P9.EOF('end of file')
+                self.offset += len(buf)
+                self.failed = 0
+                return buf
+            except (P9Exception, P9.Error, socket.error), e:
+                self.__disconnect()
+                if not self.running:
                     break
-            if not cont:
-                break
-            obuf = buf[lnl + 1:]
-        self.__close(fd)
+                if isinstance(e, P9.EOF) or isinstance(e, socket.error) and e.errno in self.GONE:
+                    logger.info('%s: %s, wmii is gone', self.path, e)
+                    self.running = False
+                    break
+                self.failed += 1
+                if self.failed > self.retries:
+                    logger.warn('%s: %s, giving up', self.path, e)
+                    self.running = False
+                    break
+                delay = self.backoff * 2 ** (self.failed - 1)
+                logger.warn('%s: %s, reconnect in %.1fs', self.path, e, delay)
+                time.sleep(delay)
+        raise StopIteration
+
+    def close(self):
+        self.running = False
+        self.__disconnect()
 
 cl = P9Client()
 
@@ -220,6 +573,14 @@ def p9_write(path, value):
     global cl
     return cl.p9_write(path, value)
 
+def p9_write_many(items):
+    global cl
+    return cl.p9_write_many(items)
+
+def p9_open(path, persistent = False):
+    global cl
+    return P9File(cl, path, persistent)
+
 def p9_read(path):
     global cl
     return cl.p9_read(path)
@@ -236,8 +597,21 @@ def p9_ls(path):
     global cl
     return cl.p9_ls(path)
 
+STREAMS = {}
+
+def p9_subscribe(path):
+    return EventStream(path)
+
 def p9_process(path, func, *args, **kwargs):
-    ncl = P9Client()
-    if ncl.connected:
-        return ncl.p9_process(path, func, *args, **kwargs)
+    """
+    call func with each line as parameter. func must return True
+    to continue reading. all calls for a path share one stream.
+    """
+    global STREAMS
+    stream = STREAMS.get(path)
+    if not stream or not stream.running:
+        stream = STREAMS[path] = EventStream(path)
+    for line in stream:
+        if not func(line, *args, **kwargs):
+            break
 
@@ -0,0 +1,66 @@
+#
+# Copyright (C) 2026 the python-wmii contributors
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# vim:syntax=python:sw=4:ts=4:expandtab
+
+"""
+the worker of a statusbar PluginProcess. wmiirc runs threads by the time
+a worker is needed, so the worker isn't forked from it but started as a
+program of its own, with posix_spawnp() like the launcher helper:
+
+    python plugin_worker.py <fd of the connection> <sys.path of wmiirc>...
+
+it reads plugin module names from the connection, imports a plugin on its
+first update and answers with (True, bar text or None) or (False,
+traceback). it exits when wmiirc closes the connection.
+"""
+
+import os
+import sys
+import traceback
+from _multiprocessing import Connection
+
+from launcher import _open_fds
+
+def serve(conn):
+    while True:
+        try:
+            name = conn.recv()
+        except (EOFError, IOError):
+            break
+        try:
+            if name not in sys.modules:
+                __import__(name)
+            uval = sys.modules[name].update()
+            conn.send((True, uval and '%s %s' % uval or None))
+        except Exception, e:
+            conn.send((False, traceback.format_exc()))
+
+
+if __name__ == '__main__':
+    fd = int(sys.argv[1])
+    # nothing of wmiirc is kept open, the plugins connect to wmii themselves
+    for n in _open_fds():
+        if n > 2 and n != fd:
+            try:
+                os.close(n)
+            except OSError:
+                pass
+    # the plugins are found like in wmiirc. this directory isn't on the
+    # path, utils/statusbar.py would hide the statusbar plugin package
+    sys.path[:1] = sys.argv[2:]
+    serve(Connection(fd))
@@ -18,9 +18,10 @@
 #
 # vim:syntax=python:sw=4:ts=4:expandtab
 
+from array import array
 from collections import deque
 
-__all__ = ['RingBuffer']
+__all__ = ['RingBuffer', 'NumericRing']
 
 class RingBuffer(deque):
     def __init__(self, max_size):
@@ -34,3 +35,39 @@ class RingBuffer(deque):
 
     def tolist(self):
         return list(self)
+
+class NumericRing(object):
+    """
+    ring of the last 'size' numbers, stored in an array of 'typecode'.
+    the memory is allocated once, append() overwrites the oldest value.
+    iteration and last() return the oldest value first.
+    """
+    def __init__(self, size, typecode = 'f'):
+        self.__data = array(typecode, [0]) * size
+        self.__size = size
+        self.__pos = 0
+        self.__len = 0
+
+    def append(self, x):
+        self.__data[self.__pos] = x
+        self.__pos = (self.__pos + 1) % self.__size
+        if self.__len < self.__size:
+            self.__len += 1
+
+    def __len__(self):
+        return self.__len
+
+    def __iter__(self):
+        return iter(self.last())
+
+    def last(self, n = None):
+        """return the last n values (default all) as a list"""
+        if n is None or n > self.__len:
+            n = self.__len
+        start = (self.__pos - n) % self.__size
+        if start + n <= self.__size:
+            return self.__data[start:start + n].tolist()
+        return (self.__data[start:] + self.__data[:self.__pos]).tolist()
+
+    def tolist(self):
+        return self.last()
@@ -28,37 +28,120 @@ returns None or not implemented, a default function is used.
 the update method is called all interval() seconds and must return a
 tuple in the form (color, text). it can also return None, which
 results in no update.
+
+instead of being polled, a plugin can push its updates by implementing
+'watch()'. it is called once and returns either a file descriptor (or
+an object with fileno()), whose plugin's update() is called whenever
+the descriptor becomes readable and must read it, or a generator, which
+is run in its own thread and yields the (color, text) tuples. such a
+plugin is only polled if it implements interval(), too.
 """
 
 import os
 import re
+import sys
+import errno
+import heapq
+import select
 import logging
 import types
 import time
+import socket
+import struct
 import subprocess
+import traceback
+import signal
+import Queue
+from array import array
 from threading import Thread, Lock
 from utils import *
+from utils.ringbuffer import NumericRing
+from utils.launcher import _posix_spawnp, _fork_exec, _cloexec
+from _multiprocessing import Connection
 from config import BAR_NORMAL_COLORS
+try:
+    from config import STATUS_BAR_PERSISTENT
+except ImportError:
+    STATUS_BAR_PERSISTENT = False
+try:
+    from config import STATUS_BAR_SLACK
+except ImportError:
+    STATUS_BAR_SLACK = 0.0
+try:
+    from config import STATUS_BAR_HISTORY
+except ImportError:
+    STATUS_BAR_HISTORY = 0
+try:
+    from config import STATUS_BAR_TIMEOUT, STATUS_BAR_PROCESS_PLUGINS, STATUS_BAR_STALE
+except ImportError:
+    STATUS_BAR_TIMEOUT = None
+    STATUS_BAR_PROCESS_PLUGINS = ()
+    STATUS_BAR_STALE = '(stale)'
 
-__all__ = ['start_statusbar', 'stop_statusbar']
+__all__ = ['start_statusbar', 'stop_statusbar', 'statusbar_stats', 'refresh']
 
 logger = logging.getLogger('utils.statusbar')
 
 POS_RE = re.compile('^(?P<pos>\d{2})_.*$')
 
-WATCHER = None
-PLUGIN_LOCK = Lock()
-PLUGIN_THREADS = []
+SCHEDULER = None
+# size of the process pool for STATUS_BAR_PROCESS_PLUGINS
+PROCESSES = 2
+# the program of a PluginProcess
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plugin_worker.py')
 
-class PluginRunner(Thread):
-    def __init__(self, name, module):
-        Thread.__init__(self)
+def _monotonic_clock():
+    """return clock_gettime(CLOCK_MONOTONIC) as a function, time.time if not available"""
+    try:
+        import ctypes, ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno = True)
+        clock_gettime = librt.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        CLOCK_MONOTONIC = 1
+
+        def monotonic():
+            t = timespec()
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+                raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+            return t.tv_sec + t.tv_nsec * 1e-9
+        monotonic()
+        return monotonic
+    except Exception, e:
+        logger.warn('no monotonic clock, using time.time: %s', e)
+        return time.time
+
+monotonic = _monotonic_clock()
+
+# heap entry of a refresh() request
+REFRESH = 'refresh'
+
+class PluginTimeout(Exception):
+    pass
+
+class PluginRunner(object):
+    def __init__(self, name, module, text = None, process = None):
         self.__name = name
         self.__module = module
-        self.__running = True
+        self.__file = p9_open('/rbar/%s' % name, STATUS_BAR_PERSISTENT)
+        # the text last written to the bar
+        self.text = text
+        # the PluginProcess running update(), None runs it in this process
+        self.process = process
+        # an update() is running off the scheduler thread since 'started'
+        self.busy = False
+        self.job = 0
+        self.started = 0.0
+        self.limit = None
+        # push updates through watch(), poll only with an interval()
+        self.watches = hasattr(self.__module, 'watch')
+        self.polls = not self.watches or hasattr(self.__module, 'interval')
 
-        if not hasattr(self.__module, 'interval') or self.__module.interval() == None:
-            logger.debug('module %s doesn\'t have a interval function, setting a default one' % self.__name)
+        if self.polls and (not hasattr(self.__module, 'interval') or self.__module.interval() == None):
+            logger.debug('module %s doesn\'t have a interval function, setting a default one', self.__name)
             setattr(self.__module, 'interval', lambda: 5)
 
     @property
@@ -69,47 +152,519 @@ class PluginRunner(Thread):
     def module(self):
         return self.__module
 
-    def stop(self):
-        self.__running = False
+    @property
+    def path(self):
+        return '/rbar/%s' % self.__name
 
-    def run(self):
-        while self.__running:
+    def update(self, timeout = None):
+        """return the bar text from the plugins update(), None for no update"""
+        try:
+            if self.process:
+                return self.process.update(self.__module, timeout, self.__started)
+            uval = self.__module.update()
+            if uval:
+                return '%s %s' % uval
+        except PluginTimeout:
+            raise
+        except Exception, e:
+            logger.exception(e)
+        return None
+
+    def __started(self):
+        self.started = monotonic()
+
+    def interval(self):
+        """return the seconds until the next update"""
+        try:
+            return self.__module.interval()
+        except Exception, e:
+            logger.exception(e)
+            return 5
+
+    def timeout(self, default):
+        """return the seconds update() may take, the plugins timeout() or default"""
+        if hasattr(self.__module, 'timeout'):
+            try:
+                limit = self.__module.timeout()
+                if limit is not None:
+                    return limit
+            except Exception, e:
+                logger.exception(e)
+        return default
+
+    def stale(self):
+        """return the last text marked as stale"""
+        text = self.text or ''
+        if text.endswith(STATUS_BAR_STALE):
+            return text
+        return '%s %s' % (text, STATUS_BAR_STALE)
+
+    def write(self):
+        logger.debug('update statusbar plugin: %s %s', self.__name, self.text)
+        self.__file.write(self.text)
+
+    def close(self):
+        self.__file.close()
+
+class PluginProcess(object):
+    """
+    a worker process running update() of the plugins assigned to it, so
+    they neither stall the bar nor hold the GIL. a worker which doesn't
+    answer in time is killed and started again on the next update.
+
+    wmiirc runs threads by then, so the worker is utils/plugin_worker.py
+    started with posix_spawnp(), which imports the plugins itself.
+    """
+    def __init__(self):
+        self.__lock = Lock()
+        self.__pid = None
+        self.__conn = None
+
+    def __start(self):
+        parent, child = socket.socketpair()
+        try:
+            fd = os.dup(parent.fileno())
+            _cloexec(fd)
+            argv = [sys.executable, WORKER, str(child.fileno())] + [os.path.abspath(p) for p in sys.path]
+            self.__pid = (_posix_spawnp() or _fork_exec)(argv)
+        finally:
+            parent.close()
+            child.close()
+        self.__conn = Connection(fd)
+        logger.debug('statusbar worker started: pid[%d]', self.__pid)
+
+    def __alive(self):
+        if not self.__pid:
+            return False
+        try:
+            pid, status = os.waitpid(self.__pid, os.WNOHANG)
+        except OSError:
+            pid = self.__pid
+        if pid:
+            # exited and reaped
+            self.__pid = None
+            self.__conn.close()
+            return False
+        return True
+
+    def update(self, module, timeout, started = None):
+        """
+        run module.update() in the worker. started() is called once the
+        plugins before it are done, the timeout counts from there. the
+        first update() of a plugin includes importing it.
+        """
+        self.__lock.acquire()
+        try:
+            if not self.__alive():
+                self.__start()
+            if started:
+                started()
+            self.__conn.send(module.__name__)
+            if not self.__conn.poll(timeout):
+                self.__kill()
+                raise PluginTimeout()
+            ok, val = self.__conn.recv()
+            if not ok:
+                logger.error('%s.update() failed:\n%s', module.__name__, val)
+                return None
+            return val
+        finally:
+            self.__lock.release()
+
+    def __kill(self):
+        pid, self.__pid = self.__pid, None
+        if not pid:
+            return
+        self.__conn.close()
+        try:
+            os.kill(pid, signal.SIGTERM)
+            for i in xrange(100):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    return
+                time.sleep(0.01)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+
+    def close(self):
+        self.__lock.acquire()
+        try:
+            self.__kill()
+        finally:
+            self.__lock.release()
+
+class UpdatePool(object):
+    """
+    threads running update() for the scheduler. there is one more thread
+    whenever all are busy, so a hanging update() only takes its own.
+    """
+    def __init__(self):
+        self.__queue = Queue.Queue()
+        self.__lock = Lock()
+        self.__idle = 0
+        self.threads = 0
+
+    def submit(self, func):
+        self.__lock.acquire()
+        if self.__idle:
+            self.__idle -= 1
+        else:
+            self.threads += 1
+            t = Thread(target = self.__work, name = 'StatusbarUpdate-%d' % self.threads)
+            t.setDaemon(True)
+            t.start()
+        self.__lock.release()
+        self.__queue.put(func)
+
+    def __work(self):
+        while True:
+            func = self.__queue.get()
+            if func is None:
+                break
             try:
-                uval = self.__module.update()
-                if uval:
-                    logger.debug('update statusbar plugin: %s %s' % (self.__name, uval))
-                    p9_write('/rbar/%s' % self.__name, '%s %s' % uval)
+                func()
             except Exception, e:
                 logger.exception(e)
-            time.sleep(self.__module.interval())
+            self.__lock.acquire()
+            self.__idle += 1
+            self.__lock.release()
+
+    def stop(self):
+        for i in range(self.threads):
+            self.__queue.put(None)
+
+class Scheduler(Thread):
+    """
+    run all statusbar plugins from a single thread.
+
+    the plugins wait in a heap ordered by their next deadline on the
+    monotonic clock. a deadline is the previous one plus the interval, so
+    the time spent in update() doesn't add up. plugins due within 'slack'
+    seconds after the first one are run in the same wakeup. between two
+    wakeups the thread sleeps in select() on a pipe, which stop() writes to.
+
+    a bar entry is only written if its text changed. all entries changed
+    in one wakeup are written with a single burst.
 
-class Watcher(Thread):
-    def __init__(self, timeout = 5):
+    with a 'timeout', update() runs on an UpdatePool thread (or in the
+    plugins PluginProcess) and the heap also holds its deadline. an entry
+    whose update() missed it is marked stale in the bar and isn't updated
+    again before the hanging call returned.
+
+    refresh() runs a plugin in the next wakeup, without moving its
+    deadline.
+
+    the descriptors returned by the watch() of push plugins are selected
+    together with the pipe, a readable one runs the plugin. generators
+    returned by watch() run in their own thread and pass each value to
+    the scheduler, which writes it like the result of an update().
+
+    an error in a wakeup is logged, the thread waits ERROR_DELAY seconds
+    and goes on with the plugins it lost rescheduled.
+    """
+    ERROR_DELAY = 1.0
+
+    def __init__(self, slack = 0.0, timeout = None):
         Thread.__init__(self)
-        self.__timeout = timeout
+        self.setDaemon(True)
+        self.__slack = slack
         self.__running = True
+        self.__lock = Lock()
+        self.__heap = []
+        self.__seq = 0
+        self.__runners = {}
+        self.__watched = {}
+        self.__pushed = []
+        self.__rfd, self.__wfd = os.pipe()
+        self.__timeout = timeout
+        self.__pool = timeout and UpdatePool() or None
+        self.__done = []
+        self.wakeups = 0
+        self.runs = 0
+        self.written = 0
+        self.suppressed = 0
+        self.flushes = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.pushes = 0
+        self.errors = 0
+
+    def add(self, runner, deadline = None):
+        """watch runner and schedule runner.run() at deadline (default now)"""
+        self.__runners[runner.name] = runner
+        if runner.watches:
+            self.__watch(runner)
+        if not runner.polls:
+            return
+        if deadline is None:
+            deadline = monotonic()
+        if self.__push(deadline, runner):
+            self.wakeup()
+
+    def __watch(self, runner):
+        try:
+            source = runner.module.watch()
+        except Exception, e:
+            logger.exception(e)
+            return
+        if isinstance(source, types.GeneratorType):
+            t = Thread(target = self.__follow, args = (runner, source))
+            t.setDaemon(True)
+            t.start()
+        else:
+            if hasattr(source, 'fileno'):
+                source = source.fileno()
+            self.__watched[source] = runner
+            self.wakeup()
+
+    def __follow(self, runner, source):
+        """pass the values of a watch() generator to the scheduler thread"""
+        try:
+            for uval in source:
+                if not self.__running:
+                    break
+                self.__lock.acquire()
+                self.__pushed.append((runner, uval and '%s %s' % uval or None))
+                self.__lock.release()
+                self.wakeup()
+        except Exception, e:
+            logger.exception(e)
+        logger.debug('statusbar plugin %s: watch() ended', runner.name)
+
+    def refresh(self, name):
+        """run the plugin 'name' now, return False if there is none"""
+        runner = self.__runners.get(name)
+        if not runner:
+            return False
+        self.__push(monotonic(), runner, REFRESH)
+        self.wakeup()
+        return True
+
+    def __push(self, deadline, runner, job = None):
+        self.__lock.acquire()
+        try:
+            # seq keeps runners with equal deadlines in order, they don't compare.
+            # entries with a job are the deadlines of running update() calls.
+            self.__seq += 1
+            heapq.heappush(self.__heap, (deadline, self.__seq, runner, job))
+            return self.__heap[0][2] is runner
+        finally:
+            self.__lock.release()
+
+    def wakeup(self):
+        os.write(self.__wfd, 'x')
 
     def stop(self):
-        global PLUGIN_LOCK, PLUGIN_THREADS
-        PLUGIN_LOCK.acquire()
         self.__running = False
-        for runner in PLUGIN_THREADS:
-            logger.debug('stop statusbar plugin: %s' % runner.name)
-            runner.stop()
-        for runner in PLUGIN_THREADS:
-            runner.join()
-        PLUGIN_LOCK.release()
+        self.wakeup()
+
+    def __due(self, now):
+        self.__lock.acquire()
+        try:
+            due = []
+            if self.__heap and self.__heap[0][0] <= now:
+                until = now + self.__slack
+                while self.__heap and self.__heap[0][0] <= until:
+                    due.append(heapq.heappop(self.__heap))
+                return due, None
+            if self.__heap:
+                return due, self.__heap[0][0] - now
+            return due, None
+        finally:
+            self.__lock.release()
+
+    def __flush(self, runners):
+        self.flushes += 1
+        self.written += len(runners)
+        if STATUS_BAR_PERSISTENT:
+            # a single Twrite each on the open files
+            for runner in runners:
+                runner.write()
+        else:
+            p9_write_many([(runner.path, runner.text) for runner in runners])
+
+    def __apply(self, runner, text, changed):
+        if text == runner.text:
+            self.suppressed += 1
+        elif text is not None:
+            runner.text = text
+            changed.append(runner)
+
+    def __submit(self, runner):
+        """run update() on the pool, its result is picked up by __finish()"""
+        runner.busy = True
+        runner.job += 1
+        runner.started = monotonic()
+        runner.limit = runner.timeout(self.__timeout)
+        job, limit = runner.job, runner.limit
+        def call():
+            try:
+                text = runner.update(limit)
+            except PluginTimeout:
+                text = PluginTimeout
+            self.__lock.acquire()
+            self.__done.append((runner, job, text))
+            self.__lock.release()
+            self.wakeup()
+        self.__pool.submit(call)
+        self.__push(runner.started + limit, runner, job)
+
+    def __finish(self, changed):
+        self.__lock.acquire()
+        done, self.__done = self.__done, []
+        self.__lock.release()
+        for runner, job, text in done:
+            runner.busy = False
+            elapsed = monotonic() - runner.started
+            if text is PluginTimeout:
+                self.__stale(runner, elapsed, changed)
+                continue
+            if elapsed > runner.limit:
+                logger.warn('statusbar plugin %s: update() returned after %.2fs', runner.name, elapsed)
+            self.__apply(runner, text, changed)
+
+    def __stale(self, runner, elapsed, changed):
+        if runner.text == runner.stale():
+            return
+        self.timeouts += 1
+        logger.warn('statusbar plugin %s: update() timed out after %.2fs (timeout %.2fs)',
+                    runner.name, elapsed, runner.limit)
+        runner.text = runner.stale()
+        changed.append(runner)
+
+    def __take_pushed(self, changed):
+        self.__lock.acquire()
+        pushed, self.__pushed = self.__pushed, []
+        self.__lock.release()
+        for runner, text in pushed:
+            self.pushes += 1
+            self.__apply(runner, text, changed)
+
+    def __select(self, timeout):
+        """wait for the pipe or a watched descriptor, return the runners of readable ones"""
+        # a busy runner reads its descriptor on the pool right now
+        fds = [fd for fd, runner in self.__watched.items() if not runner.busy]
+        try:
+            r, w, x = select.select([self.__rfd] + fds, [], [], timeout)
+        except select.error, e:
+            if e.args[0] == errno.EBADF:
+                self.__unwatch_closed()
+            elif e.args[0] != errno.EINTR:
+                raise
+            return []
+        if self.__rfd in r:
+            os.read(self.__rfd, 4096)
+        ready = [self.__watched[fd] for fd in r if fd != self.__rfd]
+        self.pushes += len(ready)
+        return ready
+
+    def __unwatch_closed(self):
+        for fd, runner in self.__watched.items():
+            try:
+                os.fstat(fd)
+            except OSError:
+                logger.warn('statusbar plugin %s: watched descriptor %d was closed', runner.name, fd)
+                del self.__watched[fd]
+
+    def __run(self, runner, changed):
+        self.runs += 1
+        if not self.__pool:
+            self.__apply(runner, runner.update(), changed)
+        elif runner.busy:
+            self.skipped += 1
+        else:
+            self.__submit(runner)
+
+    def stats(self):
+        return dict(runs = self.runs, wakeups = self.wakeups, written = self.written,
+                    suppressed = self.suppressed, flushes = self.flushes,
+                    timeouts = self.timeouts, skipped = self.skipped, pushes = self.pushes,
+                    errors = self.errors)
 
     def run(self):
-        global PLUGIN_LOCK, PLUGIN_THREADS
+        ready = []
         while self.__running:
-            PLUGIN_LOCK.acquire()
-            for i in range(0, len(PLUGIN_THREADS)):
-                if not PLUGIN_THREADS[i].isAlive():
-                    logger.debug('restart statusbar plugin: %s' % PLUGIN_THREADS[i].name)
-                    PLUGIN_THREADS[i] = PluginRunner(PLUGIN_THREADS[i].name, PLUGIN_THREADS[i].module)
-            PLUGIN_LOCK.release()
-            time.sleep(self.__timeout)
+            try:
+                ready = self.__wakeup(ready)
+            except Exception, e:
+                # nothing restarts this thread, a failed wakeup mustn't
+                # stop the bar for good
+                self.errors += 1
+                logger.exception(e)
+                self.__recover()
+                ready = []
+                time.sleep(self.ERROR_DELAY)
+        self.__lock.acquire()
+        runners = set(self.__runners.values())
+        self.__heap = []
+        self.__lock.release()
+        if self.__pool:
+            self.__pool.stop()
+        for runner in runners:
+            logger.debug('stop statusbar plugin: %s', runner.name)
+            runner.close()
+            if runner.process:
+                runner.process.close()
+        SAMPLER.close()
+        os.close(self.__rfd)
+        os.close(self.__wfd)
+
+    def __wakeup(self, ready):
+        """run what is due and wait for the next wakeup, return the runners of readable descriptors"""
+        changed = []
+        if self.__pool:
+            self.__finish(changed)
+        self.__take_pushed(changed)
+        now = monotonic()
+        due, timeout = self.__due(now)
+        if due or ready:
+            SAMPLER.tick()
+        for runner in ready:
+            self.__run(runner, changed)
+        for deadline, seq, runner, job in due:
+            if not self.__running:
+                break
+            if job is REFRESH:
+                self.__run(runner, changed)
+                continue
+            if job is not None:
+                # the deadline of an update(). it may have been taken
+                # early with the slack, or the update() of a
+                # PluginProcess started late, after the other plugins
+                # of its worker
+                if runner.busy and runner.job == job:
+                    deadline = runner.started + runner.limit
+                    if deadline > now:
+                        self.__push(deadline, runner, job)
+                    else:
+                        self.__stale(runner, now - runner.started, changed)
+                continue
+            self.__run(runner, changed)
+            interval = runner.interval()
+            # count from the deadline, not from now, but skip missed
+            # runs instead of catching up
+            deadline += interval
+            if deadline <= monotonic():
+                deadline = monotonic() + interval
+            self.__push(deadline, runner)
+        if changed:
+            self.__flush(changed)
+        if due or changed:
+            return []
+        self.wakeups += 1
+        return self.__select(timeout)
+
+    def __recover(self):
+        """put the polling runners whose deadline was lost with a failed wakeup back into the heap"""
+        self.__lock.acquire()
+        try:
+            queued = set([runner for deadline, seq, runner, job in self.__heap if job is None])
+        finally:
+            self.__lock.release()
+        for runner in self.__runners.values():
+            if runner.polls and runner not in queued:
+                self.__push(monotonic(), runner)
 
 def start_statusbar(path, separator = None, start = None, end = None):
     """
@@ -137,10 +692,11 @@ def start_statusbar(path, separator = None, start = None, end = None):
     ! these three values are deprecated, since wmii supports (again) a border between
     ! the /rbar entries.
     """
-    global WATCHER, PLUGIN_LOCK, PLUGIN_THREADS
+    global SCHEDULER
 
     # load and initialize plugins
     plugins = {}
+    texts = {}
     path = path.rstrip('/')
     flist = [d for d in os.listdir(os.path.expanduser(path)) if d.endswith('.py') and d != '__init__.py']
     flist.sort()
@@ -153,6 +709,7 @@ def start_statusbar(path, separator = None, start = None, end = None):
                 if not val:
                     val = (BAR_NORMAL_COLORS, '')
                 p9_create('/rbar/%s' % name, '%s %s' % val)
+                texts[name] = '%s %s' % val
 
                 if separator and f != flist[-1]:
                     r = self.POS_RE.match(name)
@@ -162,7 +719,7 @@ def start_statusbar(path, separator = None, start = None, end = None):
                             p9_create('/rbar/%sz_sep__' % pos, '%s %s' % separator)
                 plugins[name] = mod
             else:
-                logger.warn('invalid statusbar plugin: %s' % f)
+                logger.warn('invalid statusbar plugin: %s', f)
         except Exception, e:
             logger.exception(e)
 
@@ -172,25 +729,175 @@ def start_statusbar(path, separator = None, start = None, end = None):
         p9_create('/rbar/zzz_sep_end__', '%s %s' % end)
 
     # start plugins
-    PLUGIN_LOCK.acquire()
+    SCHEDULER = Scheduler(STATUS_BAR_SLACK, STATUS_BAR_TIMEOUT)
+    processes = [PluginProcess() for i in range(PROCESSES)]
+    n = 0
     for name, mod in plugins.iteritems():
-        logger.debug('start statusbar plugin: %s' % name)
-        PLUGIN_THREADS.append(PluginRunner(name, mod))
-        PLUGIN_THREADS[-1].start()
-    PLUGIN_LOCK.release()
-
-    logger.debug('start statusbar watcher')
-    WATCHER = Watcher()
-    WATCHER.start()
+        logger.debug('start statusbar plugin: %s', name)
+        process = None
+        if STATUS_BAR_TIMEOUT and name in STATUS_BAR_PROCESS_PLUGINS and not hasattr(mod, 'watch'):
+            # plugins are spread over the pool but stay in one process,
+            # which keeps the state of their module
+            process = processes[n % PROCESSES]
+            n += 1
+        SCHEDULER.add(PluginRunner(name, mod, texts[name], process))
+    SCHEDULER.start()
 
 def stop_statusbar():
-    global WATCHER
-    logger.debug('stop statusbar watcher')
-    WATCHER.stop()
-    WATCHER.join()
+    global SCHEDULER
+    logger.debug('stop statusbar')
+    SCHEDULER.stop()
+    SCHEDULER.join()
+
+def refresh(name):
+    """
+    update the plugin 'name' now, e.g. from a thread of the plugin which
+    noticed a change. 'name' is the file name without '.py' or the module
+    name, so a plugin can pass its __name__.
+    """
+    if SCHEDULER:
+        return SCHEDULER.refresh(name.split('.')[-1])
+    return False
+
+def statusbar_stats():
+    """return the update counters of the statusbar: written and suppressed updates, ..."""
+    global SCHEDULER
+    stats = dict(sampler_reads = SAMPLER.reads, sampler_hits = SAMPLER.hits)
+    if SCHEDULER:
+        stats.update(SCHEDULER.stats())
+    return stats
 
 # ---------------------------------------------------------------------------
 
+def _pread():
+    """
+    return a function filling a buffer from offset 0 of a file descriptor
+    with a single pread(2), which returns the data read. None if libc or
+    ctypes aren't available.
+    """
+    try:
+        import ctypes, ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno = True)
+        pread = getattr(libc, 'pread64', None) or libc.pread
+        pread.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_longlong]
+        pread.restype = ctypes.c_ssize_t
+
+        def read(fd, buf):
+            n = pread(fd, buf, len(buf), 0)
+            if n < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            return ctypes.string_at(buf, n)
+        read.buffer = ctypes.create_string_buffer
+        return read
+    except Exception, e:
+        logger.warn('no pread, using lseek and read: %s', e)
+        return None
+
+class Sampler(object):
+    """
+    read /proc and /sys files for the statusbar plugins.
+
+    each file is opened once and reread with pread(2) at offset 0 into a
+    buffer kept with it, which grows if a read fills it. a file is read
+    at most once per tick, so plugins run in the same scheduler wakeup
+    share one read. the scheduler calls tick() on every wakeup which runs
+    plugins, data older than 'max_age' seconds is reread anyway.
+    """
+    def __init__(self, size = 4096, max_age = 1.0):
+        self.__lock = Lock()
+        self.__files = {}
+        self.__tick = 0
+        self.__size = size
+        self.__pread = _pread()
+        self.max_age = max_age
+        self.reads = 0
+        self.hits = 0
+
+    def tick(self):
+        self.__tick += 1
+
+    def read(self, path):
+        """return the contents of path, raise IOError or OSError if it can't be read"""
+        self.__lock.acquire()
+        try:
+            now = monotonic()
+            entry = self.__files.get(path)
+            if entry and entry[2] == self.__tick and now - entry[3] < self.max_age:
+                self.hits += 1
+                return entry[4]
+            if not entry:
+                fd = os.open(path, os.O_RDONLY)
+                buf = self.__pread and self.__pread.buffer(self.__size) or None
+                entry = self.__files[path] = [fd, buf, None, None, None]
+            try:
+                data = self.__read(entry)
+            except (IOError, OSError):
+                # e.g. a removed battery, open the file again next time
+                del self.__files[path]
+                os.close(entry[0])
+                raise
+            self.reads += 1
+            entry[2:] = [self.__tick, now, data]
+            return data
+        finally:
+            self.__lock.release()
+
+    def __read(self, entry):
+        fd, buf = entry[0], entry[1]
+        if not self.__pread:
+            os.lseek(fd, 0, 0)
+            chunks = []
+            chunk = os.read(fd, self.__size)
+            while chunk:
+                chunks.append(chunk)
+                chunk = os.read(fd, self.__size)
+            return ''.join(chunks)
+        data = self.__pread(fd, buf)
+        while len(data) == len(buf):
+            buf = entry[1] = self.__pread.buffer(len(buf) * 2)
+            data = self.__pread(fd, buf)
+        return data
+
+    def keyed(self, path, keys):
+        """
+        return a dict mapping each of keys to the list of the rest of the
+        lines of path which start with it. only these lines are looked at,
+        keys without a line are missing in the dict.
+        """
+        data = self.read(path)
+        ret = {}
+        for key in keys:
+            values = []
+            start = 0
+            while True:
+                if not data.startswith(key, start):
+                    start = data.find('\n' + key, start)
+                    if start < 0:
+                        break
+                    start += 1
+                start += len(key)
+                end = data.find('\n', start)
+                if end < 0:
+                    end = len(data)
+                values.append(data[start:end])
+                start = end
+            if values:
+                ret[key] = values
+        return ret
+
+    def close(self):
+        self.__lock.acquire()
+        try:
+            for entry in self.__files.itervalues():
+                os.close(entry[0])
+            self.__files = {}
+        finally:
+            self.__lock.release()
+
+SAMPLER = Sampler()
+
 def parse_file(path_list, regex_list):
     if not isinstance(path_list, (types.ListType, types.TupleType)):
         path_list = [path_list]
@@ -201,10 +908,8 @@ def parse_file(path_list, regex_list):
     lines = []
     for path in path_list:
         try:
-            file = open(path, 'r')
-            lines.extend(file.readlines())
-            file.close()
-        except IOError, e:
+            lines.extend(SAMPLER.read(path).splitlines(True))
+        except (IOError, OSError), e:
             logger.exception(e)
 
     ret = {}
@@ -225,3 +930,300 @@ def parse_file(path_list, regex_list):
 def process_by_pipe(process_info):
     p = subprocess.Popen(process_info, stdout=subprocess.PIPE, close_fds=True)
     return p.communicate()
+
+# system metrics read straight from /proc, /sys and netlink. plugins
+# polling every few seconds should use these instead of forking free(1)
+# or ip(8) on every update.
+
+def meminfo():
+    """
+    return /proc/meminfo as a dict mapping 'MemTotal', 'Cached', ... to
+    their value in kB.
+    """
+    ret = {}
+    for line in SAMPLER.read('/proc/meminfo').splitlines():
+        name, sep, value = line.partition(':')
+        value = value.split()
+        if value:
+            ret[name] = int(value[0])
+    return ret
+
+NET_DEV_FIELDS = ('rx_bytes', 'rx_packets', 'rx_errs', 'rx_drop',
+                  'rx_fifo', 'rx_frame', 'rx_compressed', 'rx_multicast',
+                  'tx_bytes', 'tx_packets', 'tx_errs', 'tx_drop',
+                  'tx_fifo', 'tx_colls', 'tx_carrier', 'tx_compressed')
+
+def net_dev():
+    """
+    return /proc/net/dev as a dict mapping interface names to a dict of
+    their NET_DEV_FIELDS counters.
+    """
+    ret = {}
+    for line in SAMPLER.read('/proc/net/dev').splitlines():
+        name, sep, values = line.partition(':')
+        if not sep or '|' in values:
+            continue
+        ret[name.strip()] = dict(zip(NET_DEV_FIELDS, [int(v) for v in values.split()]))
+    return ret
+
+def iface_operstate(iface):
+    """
+    return the operational state ('up', 'down', 'unknown', ...) of iface
+    from /sys/class/net/<iface>/operstate, None if there is no such
+    interface.
+    """
+    try:
+        return SAMPLER.read(os.path.join('/sys/class/net', iface, 'operstate')).strip()
+    except (IOError, OSError):
+        return None
+
+class CpuStats(object):
+    """
+    per core cpu utilization from the cpuN lines of /proc/stat.
+
+    the jiffy counters of the previous sample, the utilization of the
+    last one ('load', in percent) and a ring of the last 'history'
+    utilizations of every core are kept in arrays, which are only
+    reallocated when the number of cores changes. update() computes the
+    deltas of all cores in one pass and also takes the minimum and
+    maximum frequency from /proc/cpuinfo.
+    """
+    STAT = '/proc/stat'
+    CPUINFO = '/proc/cpuinfo'
+
+    def __init__(self, history = 30):
+        self.history = history
+        self.mhz_min = self.mhz_max = 0.0
+        self.__resize(0)
+
+    def __resize(self, cores):
+        self.cores = cores
+        self.samples = 0
+        self.ids = array('i', [0]) * cores
+        self.load = array('f', [0.0]) * cores
+        self.__total = array('d', [0.0]) * cores
+        self.__idle = array('d', [0.0]) * cores
+        self.__ring = array('f', [0.0]) * (cores * self.history)
+        self.__pos = 0
+
+    def update(self):
+        lines = SAMPLER.keyed(self.STAT, ['cpu']).get('cpu', [])
+        lines = [line for line in lines if line[:1].isdigit()]
+        if len(lines) != self.cores:
+            self.__resize(len(lines))
+        ids, load, total, idle, ring = self.ids, self.load, self.__total, self.__idle, self.__ring
+        base = self.__pos * self.cores
+        for i, line in enumerate(lines):
+            # id user nice system idle iowait irq softirq steal [guest guest_nice],
+            # guest time is already part of user and nice
+            fields = line.split()
+            jiffies = 0.0
+            for value in fields[1:9]:
+                jiffies += int(value)
+            waiting = float(fields[4]) + float(len(fields) > 5 and fields[5] or 0)
+            dtotal = jiffies - total[i]
+            didle = waiting - idle[i]
+            if dtotal > 0:
+                load[i] = (dtotal - didle) * 100.0 / dtotal
+            else:
+                load[i] = 0.0
+            total[i] = jiffies
+            idle[i] = waiting
+            ids[i] = int(fields[0])
+            ring[base + i] = load[i]
+        if self.cores:
+            self.__pos = (self.__pos + 1) % self.history
+            self.samples += 1
+
+        mhz = SAMPLER.keyed(self.CPUINFO, ['cpu MHz']).get('cpu MHz')
+        if mhz:
+            mhz = [float(v.lstrip(' \t:')) for v in mhz]
+            self.mhz_min, self.mhz_max = min(mhz), max(mhz)
+
+    def avg(self):
+        """average utilization of all cores"""
+        if not self.cores:
+            return 0.0
+        return sum(self.load) / self.cores
+
+    def busiest(self):
+        """return (id, utilization) of the busiest core"""
+        if not self.cores:
+            return None, 0.0
+        i = max(xrange(self.cores), key = self.load.__getitem__)
+        return self.ids[i], self.load[i]
+
+    def recent(self, i):
+        """utilizations of the i'th core in the ring, the oldest first"""
+        n = min(self.samples, self.history)
+        return [self.__ring[((self.__pos - n + j) % self.history) * self.cores + i]
+                for j in xrange(n)]
+
+_NLMSGHDR = struct.Struct('=IHHII')     # len type flags seq pid
+_IFADDRMSG = struct.Struct('=BBBBI')    # family prefixlen flags scope index
+_RTATTR = struct.Struct('=HH')          # len type
+_RTM_NEWADDR = 20
+_RTM_GETADDR = 22
+_NLM_F_REQUEST = 0x1
+_NLM_F_DUMP = 0x300
+_NLMSG_ERROR = 2
+_NLMSG_DONE = 3
+_IFA_ADDRESS = 1
+_IFA_LOCAL = 2
+_IFA_LABEL = 3
+
+def iface_addresses():
+    """
+    return a dict mapping interface names to the list of their IPv4
+    addresses, in the order 'ip addr' lists them. one RTM_GETADDR dump
+    over a netlink socket, no matter how many interfaces there are.
+    aliases like 'eth0:1' are listed with their interface.
+    """
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, 0)
+    try:
+        sock.bind((0, 0))
+        sock.send(_NLMSGHDR.pack(_NLMSGHDR.size + _IFADDRMSG.size, _RTM_GETADDR,
+                                 _NLM_F_REQUEST | _NLM_F_DUMP, 1, 0) +
+                  _IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0))
+        ret = {}
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                return ret
+            pos = 0
+            while pos + _NLMSGHDR.size <= len(data):
+                length, type, flags, seq, pid = _NLMSGHDR.unpack_from(data, pos)
+                if length < _NLMSGHDR.size or type == _NLMSG_DONE:
+                    return ret
+                if type == _NLMSG_ERROR:
+                    error, = struct.unpack_from('=i', data, pos + _NLMSGHDR.size)
+                    raise OSError(-error, os.strerror(-error))
+                if type == _RTM_NEWADDR:
+                    _parse_ifaddr(data, pos + _NLMSGHDR.size, pos + length, ret)
+                pos += (length + 3) & ~3
+    finally:
+        sock.close()
+
+def _parse_ifaddr(data, pos, end, ret):
+    pos += _IFADDRMSG.size
+    local = address = label = None
+    while pos + _RTATTR.size <= end:
+        length, type = _RTATTR.unpack_from(data, pos)
+        if length < _RTATTR.size:
+            break
+        value = data[pos + _RTATTR.size:pos + length]
+        if type == _IFA_LOCAL:
+            local = socket.inet_ntoa(value)
+        elif type == _IFA_ADDRESS:
+            address = socket.inet_ntoa(value)
+        elif type == _IFA_LABEL:
+            label = value.rstrip('\0')
+        pos += (length + 3) & ~3
+    if label and (local or address):
+        ret.setdefault(label.split(':')[0], []).append(local or address)
+
+_RTMGRP_LINK = 0x1
+_RTMGRP_IPV4_IFADDR = 0x10
+
+def link_monitor():
+    """
+    return a non-blocking netlink socket which becomes readable when a
+    link changes its state or an IPv4 address is added or removed. meant
+    to be returned by watch(), update() reads it empty with drain().
+    """
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, 0)
+    sock.bind((0, _RTMGRP_LINK | _RTMGRP_IPV4_IFADDR))
+    sock.setblocking(False)
+    return sock
+
+def drain(sock):
+    """read everything pending on a non-blocking socket, return the number of messages"""
+    n = 0
+    while True:
+        try:
+            if not sock.recv(65536):
+                return n
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return n
+            if e.args[0] != errno.ENOBUFS:
+                raise
+            # the kernel dropped messages, reading the state again covers them
+        n += 1
+
+# history of plugin values, rendered as sparklines
+
+SPARKS = u'\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+
+def sparkline(values, lo = None, hi = None):
+    """
+    return values as an utf-8 encoded string of unicode blocks, scaled
+    from lo (default the minimum) to hi (default the maximum).
+    """
+    if not values:
+        return ''
+    if lo is None:
+        lo = min(values)
+    if hi is None:
+        hi = max(values)
+    top = len(SPARKS) - 1
+    span = float(hi - lo)
+    chars = []
+    for value in values:
+        if span > 0:
+            i = int((value - lo) * top / span + 0.5)
+            chars.append(SPARKS[max(0, min(top, i))])
+        else:
+            chars.append(SPARKS[0])
+    return u''.join(chars).encode('utf-8')
+
+class Series(object):
+    """
+    the last 'size' samples of a plugin value in a NumericRing.
+
+    spark() and stats() work on the last 'window' samples (default all).
+    their results are cached until the next push(), so plugins can render
+    a series several times per sample for free.
+    """
+    def __init__(self, name, size = 60, lo = None, hi = None):
+        self.name = name
+        self.lo = lo
+        self.hi = hi
+        self.__ring = NumericRing(size)
+        self.__cache = {}
+
+    def push(self, value):
+        self.__ring.append(value)
+        if self.__cache:
+            self.__cache.clear()
+
+    def __len__(self):
+        return len(self.__ring)
+
+    def spark(self, window = None):
+        key = ('spark', window)
+        if key not in self.__cache:
+            self.__cache[key] = sparkline(self.__ring.last(window), self.lo, self.hi)
+        return self.__cache[key]
+
+    def stats(self, window = None):
+        """return (min, max, avg) of the window, None without samples"""
+        key = ('stats', window)
+        if key not in self.__cache:
+            values = self.__ring.last(window)
+            if values:
+                self.__cache[key] = (min(values), max(values), sum(values) / len(values))
+            else:
+                self.__cache[key] = None
+        return self.__cache[key]
+
+SERIES = {}
+
+def series(name, size = None, lo = None, hi = None):
+    """
+    return the Series 'name', registered with the given arguments on the
+    first call. 'size' defaults to STATUS_BAR_HISTORY.
+    """
+    if name not in SERIES:
+        SERIES[name] = Series(name, size or STATUS_BAR_HISTORY or 1, lo, hi)
+    return SERIES[name]
@@ -18,12 +18,15 @@
 # vim:syntax=python:sw=4:ts=4:expandtab
 
 import os
+import binascii
 import subprocess
 import logging
+from threading import Lock
 
 logger = logging.getLogger('utils.wmiir')
 
-__all__ = ['p9_write', 'p9_read', 'p9_create', 'p9_remove', 'p9_ls', 'p9_process', 'p9_available']
+__all__ = ['p9_write', 'p9_read', 'p9_create', 'p9_remove', 'p9_ls', 'p9_process', 'p9_available',
+           'p9_write_many', 'p9_open', 'p9_subscribe']
 
 def wmiir_path():
     """
@@ -43,7 +46,165 @@ def wmiir_path():
 
 WMIIR_PATH = wmiir_path()
 
-def wmiir(cmd):
+def quote(s):
+    """quote s for sh"""
+    return "'%s'" % s.replace("'", "'\\''")
+
+class WmiirShell(object):
+    """
+    a long-lived sh, fed with wmiir command lines over a pipe.
+
+    python forking itself for every single operation is what makes the
+    wmiir backend slow, wmiir can't do more than one file per call. the
+    shell runs the wmiir calls instead, run() hands it any number of them
+    in a row. after each command the shell prints a marker line with its
+    exit status, which ends the output of the command. the marker is
+    random per shell, so no file content can fake it.
+
+    a command is only sent after the output of the one before was read.
+    written all at once, the output of a batch could fill the stdout pipe
+    while the rest is still being written, and both sides would block.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.proc = None
+        self.pid = os.getpid()
+        self.marker = None
+        self.starts = 0
+        self.commands = 0
+        self.batches = 0
+
+    def __start(self):
+        self.proc = subprocess.Popen(['/bin/sh'], stdin = subprocess.PIPE, stdout = subprocess.PIPE,
+                                     close_fds = True)
+        self.marker = '__wmiir_%s__' % binascii.hexlify(os.urandom(8))
+        self.starts += 1
+
+    def __script(self, cmd, path, value):
+        line = '%s %s %s' % (quote(WMIIR_PATH), cmd, quote(path))
+        if value is None:
+            line += ' </dev/null\n'
+        else:
+            if type(value) not in (type([]), type(()), type(set())):
+                value = [value]
+            line += " <<'%s'\n%s%s\n" % (self.marker, ''.join([v + '\n' for v in value]), self.marker)
+        return line + "printf '\\n%s %%d\\n' $?\n" % self.marker
+
+    def __output(self):
+        lines = []
+        end = self.marker + ' '
+        while True:
+            line = self.proc.stdout.readline()
+            if not line:
+                raise IOError('wmiir shell died')
+            if line.startswith(end):
+                # the newline printed before the marker
+                if lines and lines[-1] in ('\n', ''):
+                    lines.pop()
+                elif lines:
+                    lines[-1] = lines[-1].rstrip('\n')
+                return int(line[len(end):]), lines
+            lines.append(line)
+
+    def run(self, ops):
+        """
+        run each (cmd, path, value) in ops, value is written to wmiir's
+        stdin. return the output of each command as list of lines.
+        """
+        if self.pid != os.getpid():
+            # a forked child, the pipes and the lock belong to the parent
+            self.lock = Lock()
+            self.proc = None
+            self.pid = os.getpid()
+        self.lock.acquire()
+        try:
+            for retry in (True, False):
+                try:
+                    if not self.proc or self.proc.poll() is not None:
+                        self.__start()
+                    ret = []
+                    for cmd, path, value in ops:
+                        self.proc.stdin.write(self.__script(cmd, path, value))
+                        self.proc.stdin.flush()
+                        status, lines = self.__output()
+                        if status:
+                            logger.debug('wmiir %s %s: exit status %d', cmd, path, status)
+                        ret.append(lines)
+                    self.commands += len(ops)
+                    self.batches += 1
+                    return ret
+                except IOError, e:
+                    self.close()
+                    if not retry:
+                        raise
+        finally:
+            self.lock.release()
+
+    def close(self):
+        proc, self.proc = self.proc, None
+        if proc:
+            try:
+                proc.stdin.close()
+                proc.stdout.close()
+                proc.wait()
+            except (IOError, OSError), e:
+                logger.exception(e)
+
+    def stats(self):
+        return dict(starts = self.starts, commands = self.commands, batches = self.batches)
+
+SHELL = WmiirShell()
+
+def wmiir(cmd, path, value = None):
+    """run a single wmiir command, return its output lines or None on errors"""
+    try:
+        return SHELL.run([(cmd, path, value)])[0]
+    except IOError, e:
+        logger.exception(e)
+    return None
+
+def p9_write(path, value):
+    wmiir('write', path, value)
+
+def p9_write_many(items):
+    """write all (path, value) pairs in items with a single batch"""
+    try:
+        SHELL.run([('write', path, value) for path, value in items])
+    except IOError, e:
+        logger.exception(e)
+
+class P9File(object):
+    """handle for a file written over and over again, wmiir can't keep it open"""
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, value):
+        return p9_write(self.path, value)
+
+    def close(self):
+        pass
+
+def p9_open(path, persistent = False):
+    return P9File(path)
+
+def p9_read(path):
+    lines = wmiir('read', path)
+    if lines is not None:
+        return [l.strip() for l in lines]
+
+def p9_create(path, value = None):
+    wmiir('create', path, value)
+
+def p9_remove(path):
+    wmiir('remove', path)
+
+def p9_ls(path):
+    lines = wmiir('ls', path)
+    if lines is not None:
+        return [l.strip() for l in lines]
+
+def spawn(cmd):
+    """a wmiir process per call, for streams which stay open"""
     def decorator(func):
         def wrapped(path, *args, **kwargs):
             try:
@@ -60,31 +221,7 @@ def wmiir(cmd):
         return wrapped
     return decorator
 
-@wmiir('write')
-def p9_write(stdin, stdout, value):
-    if type(value) not in (type([]), type(()), type(set())):
-        value = [value]
-    stdin.writelines([v + '\n' for v in value])
-
-@wmiir('read')
-def p9_read(stdin, stdout):
-    return [l.strip() for l in stdout.readlines()]
-
-@wmiir('create')
-def p9_create(stdin, stdout, value = None):
-    if type(value) not in (type([]), type(())):
-        value = [value]
-    stdin.writelines([v + '\n' for v in value])
-
-@wmiir('remove')
-def p9_remove(stdin, stdout):
-    pass
-
-@wmiir('ls')
-def p9_ls(stdin, stdout):
-    return [l.strip() for l in stdout.readlines()]
-
-@wmiir('read')
+@spawn('read')
 def p9_process(stdin, stdout, func, *args, **kwargs):
     """
     call func with each line as parameter. func must return True
@@ -94,5 +231,24 @@ def p9_process(stdin, stdout, func, *args, **kwargs):
     while next and func(next.strip(), *args, **kwargs):
         next = stdout.readline()
 
+class WmiirStream(object):
+    """line by line subscription to a stream file through one wmiir process"""
+    def __init__(self, path):
+        self.proc = subprocess.Popen([WMIIR_PATH, 'read', path], stdout = subprocess.PIPE, close_fds = True)
+
+    def __iter__(self):
+        for line in iter(self.proc.stdout.readline, ''):
+            yield line.strip()
+
+    def close(self):
+        try:
+            self.proc.terminate()
+            self.proc.wait()
+        except OSError, e:
+            logger.exception(e)
+
+def p9_subscribe(path):
+    return WmiirStream(path)
+
 def p9_available():
     return WMIIR_PATH and os.path.isfile(WMIIR_PATH)